@@ -1,29 +1,148 @@
+import time
+_SCRIPT_T0 = time.perf_counter()  # จับเวลาแต่ละ rerun (ใช้กับ profile_startup)
+
 import streamlit as st
 import pandas as pd
-import gspread
 from datetime import datetime
 import os
 import io
 import json
+import sys
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Library สำหรับอ่าน Barcode (wms_scan / wms_live / PIL / pyzbar): import ในฟังก์ชัน โหลดตอนสแกนครั้งแรก ---
+from wms_photos import PhotoUploadQueue
+from wms_master import ItemMasterIndex
+from wms_asn import read_asn, validate_asn, reconcile, apply_counts, add_asn_to_mutation, AsnError
+from wms_replen import plan_replenishment_wave, add_wave_to_mutation
+from wms_ship import staging_lanes, lane_summary, build_manifest, add_closeout_to_mutation, STAGED_STATUS
+from wms_picking import location_coords, load_orders, allocate_orders, make_batches, pick_path, add_picks_to_mutation
 
-# --- Library สำหรับอ่าน Barcode ---
-from PIL import Image
-from pyzbar.pyzbar import decode
+# --- Library สำหรับ Google Drive: import ในฟังก์ชัน (โหลดตอนอัปโหลดรูปครั้งแรก ไม่ใช่ทุกครั้งที่เปิดแอป) ---
+# --- gspread / wms_shard / wms_archive / wms_reconcile / wms_slotting: import ในฟังก์ชันที่ใช้ (โหลดเฉพาะ backend / เมนูที่เปิด) ---
 
-# --- Library สำหรับ Google Drive (เพิ่มเข้ามา) ---
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from googleapiclient.errors import HttpError
+from wms_stock import StockStore, StockMutation, StockMutationError
+from wms_log import TransactionLogWriter
+from wms_schema import parse_rows
+from wms_storage import GSheetsBackend, SqliteBackend, FakeBackend, TABLE_LOC_MASTER
+from wms_governor import QuotaGovernor, QuotaExceeded
 
 # ==========================================
 # 0. CONFIGURATION
 # ==========================================
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def get_setting(name, default=None):
+    # อ่านจาก Environment Variable (WMS_<NAME>) ก่อน ถ้าไม่มีค่อยดูใน st.secrets["wms"]
+    env = os.environ.get(f"WMS_{name.upper()}")
+    if env is not None:
+        return env
+    try:
+        if "wms" in st.secrets and name in st.secrets["wms"]:
+            return st.secrets["wms"][name]
+    except Exception:
+        pass
+    return default
+
 # ⚠️⚠️ ใส่ ID ของ Folder "D.NA_WMS_V01/picture" ตรงนี้ ⚠️⚠️
 PICTURE_FOLDER_ID = '1i7lWnQy3iV5uodGdDsUrX6wwbyPiH6Hv' # <--- เปลี่ยนเป็น ID จริงของคุณ
 
+# รูปสินค้า: ย่อด้านยาวสุดเหลือกี่ px / คุณภาพ JPEG / จำนวน thread ที่ใช้บีบอัดรูป
+PHOTO_MAX_SIDE = 1280
+PHOTO_JPEG_QUALITY = 80
+PHOTO_UPLOAD_WORKERS = 2
+# รูปที่ยังอัปโหลดไม่เสร็จเก็บไว้ในไฟล์นี้ (เปิดแอปใหม่ส่งต่อให้เอง) / ลองกี่ครั้งก่อนเขียน UPLOAD_FAILED ลงชีต
+PHOTO_JOURNAL_PATH = get_setting("photo_journal_path", os.path.join(APP_DIR, "wms_photo_journal.db"))
+PHOTO_MAX_ATTEMPTS = int(get_setting("photo_max_attempts", 4))
+IMAGE_LINK_COL = 7  # Column Image_Link ใน Item_Master
+
+# Stock cache: เช็คว่าชีตถูกแก้หรือยังทุกกี่วินาที / บังคับอ่านใหม่ทั้งชีตทุกกี่วินาที
+STOCK_POLL_SEC = 5
+STOCK_FULL_RESYNC_SEC = 300
+# ก่อนเขียน Current_Stock อ่านเฉพาะแถวที่งานนั้นแตะจากชีตมาเทียบก่อน (กันแอป/เครื่องอื่นแก้ชีตพร้อมกัน)
+# ปิดได้ถ้าชีตนี้ถูกเขียนจากแอปนี้ process เดียว
+STOCK_VERIFY_WRITES = str(get_setting("stock_verify_writes", "1")).strip().lower() not in ("0", "false", "no", "off")
+
+# Item_Master: เช็คว่าชีตถูกแก้หรือยังทุกกี่วินาที (อ่านใหม่เฉพาะตอนที่ถูกแก้)
+ITEM_MASTER_POLL_SEC = 10
+
+# Transaction_Log: ส่งขึ้นชีตเมื่อค้างครบกี่แถว หรือค้างนานกี่วินาที (ระหว่างรอเก็บใน journal ไฟล์นี้)
+LOG_FLUSH_SIZE = int(get_setting("log_flush_size", 50))
+LOG_FLUSH_SEC = float(get_setting("log_flush_sec", 3))
+LOG_JOURNAL_PATH = get_setting("log_journal_path", os.path.join(APP_DIR, "wms_log_journal.db"))
+
+# Log Archive: เก็บ log ในชีตไว้กี่เดือนล่าสุด (นับเดือนปัจจุบัน) ที่เหลือย้ายไปเป็นไฟล์ Parquet ในโฟลเดอร์นี้
+LOG_KEEP_MONTHS = 1
+LOG_ARCHIVE_DIR = get_setting("log_archive_dir", os.path.join(APP_DIR, "log_archive"))
+
+# Reconcile: checkpoint ของยอดที่ replay จาก log แล้ว / log ที่ใหม่กว่ากี่นาทียังไม่เก็บเข้า checkpoint
+# (เผื่อ log จากเครื่องอื่นที่ยังค้างส่ง)
+RECONCILE_DIR = get_setting("reconcile_dir", os.path.join(APP_DIR, "reconcile"))
+RECONCILE_LAG_MIN = 10
+
+# Slotting: คิด ABC จากการหยิบย้อนหลังกี่วัน / อ่าน Transaction_Log ใหม่ได้ไม่เกิน 1 ครั้งต่อกี่วินาที
+SLOTTING_WINDOW_DAYS = 30
+SLOTTING_REFRESH_SEC = 600
+
+# ที่เก็บข้อมูล: "gsheets" (Google Sheets) | "sqlite" (ฐานข้อมูลในเครื่อง) | "fake" (ชีตปลอมใน memory สำหรับทดสอบ)
+STORAGE_BACKEND = get_setting("storage_backend", "gsheets")
+SQLITE_DB_PATH = get_setting("sqlite_path", os.path.join(APP_DIR, "wms.db"))
+FAKE_LATENCY_MS = float(get_setting("fake_latency_ms", 0))  # หน่วงเวลาต่อ API call ของ backend "fake" (ใช้ทดสอบ/benchmark)
+
+# แบ่ง Current_Stock / Transaction_Log ไปหลาย Spreadsheet ตามโซน / ไซต์ (gsheets / fake): {"ชื่อ shard": "ชื่อ Spreadsheet"}
+# ชื่อ shard = prefix ของรหัส Location หรือค่าในคอลัมน์ Shard / Site / Zone ของ Location_Master
+# Location ที่ไม่เข้า shard ไหน (DOCK_IN, Staging) อยู่ใน WMS_Database เหมือนเดิม / ว่าง = ไม่แบ่ง
+STOCK_SHARDS = get_setting("stock_shards", {})
+if isinstance(STOCK_SHARDS, str):
+    STOCK_SHARDS = json.loads(STOCK_SHARDS) if STOCK_SHARDS.strip() else {}
+STOCK_SHARDS = dict(STOCK_SHARDS)
+
+# Google Sheets quota (ต่อนาที ทั้ง process) / จำนวนครั้งที่ลองใหม่เมื่อโดน 429 ก่อนแจ้ง error
+SHEETS_READ_PER_MIN = int(get_setting("sheets_read_per_min", 60))
+SHEETS_WRITE_PER_MIN = int(get_setting("sheets_write_per_min", 60))
+SHEETS_MAX_RETRIES = 5
+
+# Barcode ที่ใช้ในคลัง (จำกัดชนิดให้ zbar อ่านเร็วขึ้น) / ขนาดรูปสูงสุดก่อน decode
+SCAN_SYMBOLOGIES = ["EAN13", "EAN8", "UPCA", "CODE128", "CODE39", "QRCODE"]
+SCAN_MAX_SIDE = 1024
+
+# สแกนต่อเนื่องจากวิดีโอ (แท็บ 🎥 Live ต้องมี streamlit-webrtc): decode ไม่เกินกี่เฟรม/วินาที /
+# code เดิมที่อ่านซ้ำภายในกี่วินาทีนับครั้งเดียว / หน้าจอเช็ค code ใหม่ทุกกี่วินาที
+LIVE_SCAN = (str(get_setting("live_scan", "1")).strip().lower() not in ("0", "false", "no", "off")
+             and importlib.util.find_spec("streamlit_webrtc") is not None)
+LIVE_SCAN_MAX_FPS = 8
+LIVE_SCAN_DEDUPE_SEC = 2.0
+LIVE_SCAN_POLL_SEC = 0.5
+
+# รับของจาก ASN: อ่าน/ตรวจไฟล์ทีละกี่บรรทัด
+ASN_CHUNK_ROWS = 500
+
+# Picking ตาม Order: จำนวน Order ต่อ 1 Batch (1 รอบเดิน)
+PICK_BATCH_ORDERS = 10
+
+# Ship Out: ช่อง Staging = Loc_Type "STAGING" หรือรหัสขึ้นต้นด้วย prefix นี้ (ถ้า Location_Master ยังไม่มีใช้ช่อง default)
+STAGING_PREFIX = "STG"
+DEFAULT_STAGING_LANES = ["STG-01"]
+
+# แสดงเวลาแต่ละช่วงของการรันสคริปต์ + API call + library หนักที่ถูกโหลดแล้ว ใน sidebar (ใช้ตรวจ startup ช้า)
+PROFILE_STARTUP = str(get_setting("profile_startup", "")).strip().lower() in ("1", "true", "yes", "on")
+
 st.set_page_config(page_title="WMS System", page_icon="📦")
 
+_profile_marks = [("imports", time.perf_counter(), None)]
+
+def _api_call_count():
+    governor = getattr(backend, "governor", None)
+    if governor is not None:
+        return sum(stat["calls"] for stat in governor.stats.values())
+    calls = getattr(backend, "calls", None)
+    return sum(calls.values()) if calls is not None else None
+
+def profile_mark(label):
+    if PROFILE_STARTUP:
+        _profile_marks.append((label, time.perf_counter(), _api_call_count()))
+
 # ==========================================
 # 1. AUTHENTICATION (SHEET + DRIVE)
 # ==========================================
@@ -31,6 +150,7 @@ st.set_page_config(page_title="WMS System", page_icon="📦")
 # 1.1 เชื่อมต่อ Google Sheets (รองรับทั้ง Local File และ Streamlit Secrets)
 @st.cache_resource
 def init_connection():
+    import gspread
     try:
         # กรณีรันบน Streamlit Cloud (อ่านจาก Secrets)
         if "gcp_service_account" in st.secrets:
@@ -57,7 +177,13 @@ def init_connection():
             st.error("⚠️ ไม่พบไฟล์ 'Master_Data'")
             st.stop()
 
-        return sh_wms, sh_master
+        # Spreadsheet ของแต่ละ shard เปิดพร้อมกัน
+        shards = {}
+        if STOCK_SHARDS:
+            with ThreadPoolExecutor(max_workers=len(STOCK_SHARDS)) as pool:
+                shards = dict(zip(STOCK_SHARDS, pool.map(gc.open, STOCK_SHARDS.values())))
+
+        return sh_wms, sh_master, shards
 
     except Exception as e:
         st.error(f"เกิดข้อผิดพลาดในการเชื่อมต่อ Sheet: {e}")
@@ -65,6 +191,7 @@ def init_connection():
 
 # 1.2 เชื่อมต่อ Google Drive (OAuth จากโค้ดตัวอย่าง)
 def get_drive_credentials():
+    from google.oauth2.credentials import Credentials
     try:
         if "oauth" in st.secrets:
             info = st.secrets["oauth"]
@@ -86,6 +213,7 @@ def get_drive_credentials():
         return None
 
 def authenticate_drive():
+    from googleapiclient.discovery import build
     try:
         creds = get_drive_credentials()
         if creds: 
@@ -95,8 +223,15 @@ def authenticate_drive():
         st.error(f"Error Drive Init: {e}")
         return None
 
+# Drive client ตัวเดียวใช้ทั้ง process (ไม่ต้อง build ใหม่ทุก rerun)
+@st.cache_resource
+def get_drive_service():
+    return authenticate_drive()
+
 # 1.3 ฟังก์ชัน Upload รูป
 def upload_photo_to_drive(service, file_obj, filename, folder_id):
+    from googleapiclient.http import MediaIoBaseUpload
+    from googleapiclient.errors import HttpError
     try:
         file_metadata = {'name': filename, 'parents': [folder_id]}
         
@@ -105,75 +240,299 @@ def upload_photo_to_drive(service, file_obj, filename, folder_id):
         else: 
             media_body = file_obj 
             
-        media = MediaIoBaseUpload(media_body, mimetype='image/jpeg', chunksize=1024*1024, resumable=True)
+        # รูปที่บีบอัดแล้วมีขนาดเล็ก ใช้ simple upload (request เดียว) แทน resumable
+        size = media_body.getbuffer().nbytes if isinstance(media_body, io.BytesIO) else None
+        resumable = size is None or size > 5 * 1024 * 1024
+        media = MediaIoBaseUpload(media_body, mimetype='image/jpeg', chunksize=1024*1024, resumable=resumable)
         
         file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
         return file.get('id')
 
     except HttpError as error:
+        # ฟังก์ชันนี้ถูกเรียกจาก thread อัปโหลด (ใช้ st.error ไม่ได้) ให้ error ไปแสดงในสถานะคิวแทน
         error_reason = json.loads(error.content.decode('utf-8'))
-        st.error(f"Google Drive Error: {error_reason}")
-        raise error
-    except Exception as e:
-        raise e
+        raise RuntimeError(f"Google Drive Error: {error_reason}") from error
 
-# --- INIT SHEETS ---
-sh_wms, sh_master = init_connection()
-ws_stock = sh_wms.worksheet("Current_Stock")
-ws_log = sh_wms.worksheet("Transaction_Log")
-ws_item_master = sh_master.worksheet("Item_Master")
+# 1.4 เลือก Storage Backend ตาม STORAGE_BACKEND (ทุกหน้าอ่าน/เขียนผ่าน backend.stock / log / item_master / loc_master)
+@st.cache_resource
+def get_backend():
+    if STORAGE_BACKEND == "sqlite":
+        return SqliteBackend(SQLITE_DB_PATH)
+    if STORAGE_BACKEND == "fake":
+        main = FakeBackend(latency=FAKE_LATENCY_MS / 1000)
+        if not STOCK_SHARDS:
+            return main
+        from wms_shard import ShardedBackend
+        return ShardedBackend(main, {name: ShardedBackend.fake_shard(title, FAKE_LATENCY_MS / 1000)
+                                     for name, title in STOCK_SHARDS.items()})
+    sh_wms, sh_master, shards = init_connection()
+    # ทุก session / thread (log writer, คิวรูป) ใช้ quota ก้อนเดียวกัน
+    governor = QuotaGovernor(SHEETS_READ_PER_MIN, SHEETS_WRITE_PER_MIN, max_retries=SHEETS_MAX_RETRIES)
+    main = GSheetsBackend(sh_wms, sh_master, governor=governor)
+    if not shards:
+        return main
+    from wms_shard import ShardedBackend
+    return ShardedBackend(main, {name: ShardedBackend.sheet_shard(sh, governor) for name, sh in shards.items()})
 
-try:
-    ws_loc_master = sh_master.worksheet("Location_Master")
-except:
-    ws_loc_master = None
+# --- INIT STORAGE ---
+backend = get_backend()
+# backend แบบ shard มี router (Location -> shard) แบบชีตเดียวไม่มี
+SHARDED = hasattr(backend, "router")
+profile_mark("backend")
 
 # ==========================================
 # 2. HELPER FUNCTIONS
 # ==========================================
+@st.cache_resource
+def get_barcode_decoder():
+    from wms_scan import BarcodeDecoder
+    return BarcodeDecoder(symbologies=SCAN_SYMBOLOGIES, max_side=SCAN_MAX_SIDE)
+
 def decode_barcode_from_image(image_file):
     try:
-        image = Image.open(image_file)
-        decoded_objects = decode(image)
-        if decoded_objects:
-            return decoded_objects[0].data.decode("utf-8")
-        return None
-    except:
+        data = image_file.getvalue() if hasattr(image_file, "getvalue") else image_file.read()
+        result = get_barcode_decoder().decode(data)
+    except Exception as e:
+        st.warning(f"⚠️ เปิดรูปไม่ได้: {e}")
         return None
+    tm = result['timings']
+    if result['cached']:
+        st.caption(f"🔍 ใช้ผลเดิม (cache) {tm['total']} ms")
+    else:
+        st.caption(f"🔍 {tm['total']} ms (load {tm['load']} / decode {tm['decode']} ms, ลอง {result['attempts']} แบบ)")
+    if result['code'] is None:
+        st.warning("⚠️ อ่าน Barcode ไม่ได้ ลองให้ Barcode อยู่กลางภาพ ไม่เอียง แล้วถ่ายใหม่")
+    return result['code']
+
+# กล้อง Live: scanner แยกต่อ session / ต่อช่องสแกน
+# callback ของกล้องรันใน thread ของ webrtc แตะ session_state ไม่ได้ จึงส่งเฟรมเข้า scanner ตรง ๆ
+def get_live_scanner(key):
+    name = f"live_scanner_{key}"
+    if name not in st.session_state:
+        from wms_live import LiveScanner
+        st.session_state[name] = LiveScanner(get_barcode_decoder().decode_frame,
+                                             max_fps=LIVE_SCAN_MAX_FPS, dedupe_sec=LIVE_SCAN_DEDUPE_SEC)
+    return st.session_state[name]
+
+def live_scan(key):
+    """แสดงกล้องแบบ Live แล้วคืน Barcode ใหม่ทีละ 1 code ต่อ rerun (ไม่มีคืน None) ไม่ต้องกดถ่ายรูป"""
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+
+    queue = st.session_state.setdefault(f"live_codes_{key}", [])
+    code = queue.pop(0) if queue else None
+    scanner = get_live_scanner(key)
+
+    def on_frame(frame):
+        scanner.feed(frame.to_ndarray(format="gray"))
+        return frame
 
-def safe_get_data(worksheet):
-    all_values = worksheet.get_all_values()
-    if len(all_values) > 1:
-        return pd.DataFrame(all_values[1:], columns=all_values[0])
-    return pd.DataFrame()
+    webrtc_streamer(key=f"live_{key}", mode=WebRtcMode.SENDRECV, video_frame_callback=on_frame,
+                    media_stream_constraints={"video": {"facingMode": "environment"}, "audio": False},
+                    async_processing=True)
+
+    # เช็ค code ใหม่จาก worker เป็นระยะ (rerun เฉพาะส่วนนี้) เจอแล้วค่อย rerun ทั้งหน้า
+    @st.fragment(run_every=LIVE_SCAN_POLL_SEC)
+    def poll():
+        codes = scanner.drain()
+        if codes:
+            st.session_state[f"live_codes_{key}"].extend(codes)
+            st.rerun(scope="app")
+        stats = scanner.stats
+        st.caption(f"🎥 {stats['sampled']}/{stats['frames']} เฟรม / อ่านได้ {stats['decoded']} / ซ้ำ {stats['duplicates']}")
+
+    poll()
+    return code
+
+# Stock store ตัวเดียวใช้ร่วมกันทุก session (ทุกเครื่อง handheld)
+@st.cache_resource
+def get_stock_store():
+    if SHARDED:
+        from wms_shard import ShardedStockStore
+        # StockStore 1 ตัวต่อ shard / shard ของแต่ละ Location อ่านจาก Location_Master
+        backend.router.load(get_location_values())
+        stores = {name: StockStore(table, poll_sec=STOCK_POLL_SEC, full_resync_sec=STOCK_FULL_RESYNC_SEC)
+                  for name, table in backend.stock_tables.items()}
+        return ShardedStockStore(stores, backend.router, backend.pool)
+    return StockStore(backend.stock, poll_sec=STOCK_POLL_SEC, full_resync_sec=STOCK_FULL_RESYNC_SEC)
+
+def get_stock_df():
+    store = get_stock_store()
+    store.sync()
+    return store.to_frame()
+
+# Location_Master เริ่มอ่านใน thread เบื้องหลังตั้งแต่ rerun แรกของ process (หน้าแรกไม่ต้องรอ)
+@st.cache_resource
+def get_location_prefetch():
+    if not backend.loc_master:
+        return {}
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wms-prefetch")
+    return {"future": pool.submit(backend.loc_master.get_all_values)}
+
+@st.cache_data(ttl=300)
+def get_location_values():
+    # ครั้งแรกใช้ผลจาก prefetch (รอเฉพาะส่วนที่ยังอ่านไม่เสร็จ) ครั้งต่อไปเมื่อ cache หมดอายุค่อยอ่านใหม่
+    future = get_location_prefetch().pop("future", None)
+    if future is not None:
+        try:
+            return future.result()
+        except Exception:
+            pass
+    return backend.loc_master.get_all_values() if backend.loc_master else []
+
+@st.cache_data(ttl=300)
+def get_location_frame():
+    # Location_Master แบบมี dtype (wms_schema) คืนเป็น (DataFrame, report แถวเสีย)
+    return parse_rows(get_location_values()[1:], TABLE_LOC_MASTER)
 
 @st.cache_data(ttl=300)
 def get_location_map():
-    loc_map = {}
-    if ws_loc_master:
-        data = ws_loc_master.get_all_values()
-        if len(data) > 1:
-            for row in data[1:]:
-                if len(row) >= 6: 
-                    loc_id = str(row[0]).strip()
-                    loc_type = str(row[5]).strip().upper()
-                    loc_map[loc_id] = loc_type
-    return loc_map
-
-def validate_move_rule(target_loc, loc_map, df_current_stock):
+    locs, _ = get_location_frame()
+    locs = locs[locs['Location_ID'] != ""]
+    return dict(zip(locs['Location_ID'], locs['Loc_Type'].astype(str)))
+
+@st.cache_data(ttl=300)
+def get_location_table():
+    # Location_Master ครบทุกช่อง (Zone / Rack / Level / Loc_Type + ลำดับทางเดิน) ใช้กับ Slotting
+    from wms_slotting import location_table
+    return location_table(get_location_values())
+
+def get_staging_lanes():
+    return staging_lanes(get_location_map(), prefix=STAGING_PREFIX, default=DEFAULT_STAGING_LANES)
+
+@st.cache_data(ttl=300)
+def get_location_coords():
+    # พิกัด Zone / Rack / Level ของแต่ละ Location ใช้เรียงเส้นทางหยิบ
+    return location_coords(get_location_values())
+
+@st.cache_data(ttl=60)
+def get_open_orders(closed=("PICKED", "SHIPPED", "CANCELLED")):
+    # Order จากชีต Orders ที่ Status ยังไม่อยู่ใน closed (เก็บเลขแถวไว้อัปเดต Status)
+    if not backend.orders:
+        return pd.DataFrame()
+    data = backend.orders.get_all_values()
+    if len(data) < 2:
+        return pd.DataFrame()
+    df = pd.DataFrame(data[1:], columns=[str(h).strip() for h in data[0]])
+    df['Row'] = range(2, len(df) + 2)
+    if 'Status' in df.columns:
+        df = df[~df['Status'].str.strip().str.upper().isin(closed)]
+    return df
+
+# Index ของ Item_Master ตัวเดียวใช้ร่วมกันทุก session (ค้นหาด้วย Barcode ได้ทันที)
+@st.cache_resource
+def get_item_index():
+    return ItemMasterIndex(backend.item_master, poll_sec=ITEM_MASTER_POLL_SEC)
+
+# เติม Image_Link ให้แถวสินค้าเมื่ออัปโหลดรูปเสร็จ (ถูกเรียกจาก thread อัปโหลด)
+def fill_image_link(barcode, file_id):
+    item_index = get_item_index()
+    rows = item_index.rows_of(barcode)
+    if rows:
+        link = f"https://drive.google.com/open?id={file_id}"
+        backend.item_master.update_cells([(rows[-1], IMAGE_LINK_COL, link)])
+        item_index.update_local(rows[-1], "Image_Link", link)
+
+# อัปโหลดไม่สำเร็จครบทุกครั้ง: แทน UPLOADING ด้วย UPLOAD_FAILED:<hash> ให้รู้ว่ารูปไหนหาย (รูปยังอยู่ใน journal)
+def mark_image_failed(barcode, digest):
+    item_index = get_item_index()
+    rows = item_index.rows_of(barcode)
+    if rows:
+        marker = f"UPLOAD_FAILED:{digest[:12]}"
+        backend.item_master.update_cells([(rows[-1], IMAGE_LINK_COL, marker)])
+        item_index.update_local(rows[-1], "Image_Link", marker)
+
+@st.cache_resource
+def get_photo_queue():
+    service = get_drive_service()
+    queue = PhotoUploadQueue(
+        lambda data, filename: upload_photo_to_drive(service, data, filename, PICTURE_FOLDER_ID),
+        on_done=fill_image_link,
+        on_failed=mark_image_failed,
+        journal_path=PHOTO_JOURNAL_PATH,
+        max_side=PHOTO_MAX_SIDE,
+        quality=PHOTO_JPEG_QUALITY,
+        workers=PHOTO_UPLOAD_WORKERS,
+        max_attempts=PHOTO_MAX_ATTEMPTS,
+    )
+    # รูปที่ค้างจากรอบก่อน (แอปล่ม / restart) ส่งต่อทันที
+    queue.resume()
+    return queue
+
+def validate_move_rule(target_loc, loc_map, store):
+    # เช็คจาก index ของ StockStore (ไม่ต้องกรองทั้ง DataFrame)
     if target_loc not in loc_map:
         return False, f"❌ ไม่พบ Location: '{target_loc}' ในระบบ"
     loc_type = loc_map[target_loc]
     if loc_type == "RESERVE":
-        if not df_current_stock.empty:
-            is_occupied = not df_current_stock[df_current_stock['Location'] == target_loc].empty
-            if is_occupied:
-                return False, f"❌ Location '{target_loc}' (RESERVE) มีของวางอยู่แล้ว!"
+        if store.is_occupied(target_loc):
+            return False, f"❌ Location '{target_loc}' (RESERVE) มีของวางอยู่แล้ว!"
     return True, "OK"
 
+# Log ถูกเขียนลง journal ในเครื่องก่อน แล้ว thread เบื้องหลังส่งขึ้นชีตทีละหลายแถว
+@st.cache_resource
+def get_log_writer():
+    return TransactionLogWriter(
+        backend.log.append_rows,
+        LOG_JOURNAL_PATH,
+        flush_size=LOG_FLUSH_SIZE,
+        flush_sec=LOG_FLUSH_SEC,
+        # Transaction_Log อยู่ Spreadsheet เดียวกับ Current_Stock
+        on_flush=get_stock_store().note_local_write,
+        # ส่งแล้ว error (5xx / timeout) -> เช็คท้ายชีตก่อนส่งซ้ำ กัน log ซ้ำ
+        tail_fn=backend.log.tail,
+    )
+
+# Log เดือนเก่าย้ายออกจากชีตไปไว้ที่ LOG_ARCHIVE_DIR (ค้นประวัติได้โดยไม่เรียก Sheets API)
+@st.cache_resource
+def get_log_archive():
+    from wms_archive import LogArchive
+    return LogArchive(LOG_ARCHIVE_DIR)
+
+# ยอด Stock ที่สร้างจาก log (archive + ชีต) เก็บ checkpoint ไว้ที่ RECONCILE_DIR
+@st.cache_resource
+def get_reconciler():
+    from wms_reconcile import StockReconciler
+    return StockReconciler(RECONCILE_DIR, lag_sec=RECONCILE_LAG_MIN * 60)
+
+# ยอดหยิบ / เติม รายวัน (ABC) ตัวเดียวใช้ร่วมกันทุก session อ่าน log เพิ่มเฉพาะส่วนที่ใหม่
+@st.cache_resource
+def get_slotting_model():
+    from wms_slotting import SlottingModel
+    return SlottingModel(window_days=SLOTTING_WINDOW_DAYS, refresh_sec=SLOTTING_REFRESH_SEC)
+
+def slotting_model(force=False):
+    model = get_slotting_model()
+    try:
+        model.refresh(backend.log, get_log_archive(), force=force)
+    except Exception as e:
+        # อ่าน log ไม่ได้ใช้ยอดรอบก่อนไปก่อน
+        model.stats["last_error"] = str(e)
+    return model
+
 def log_transaction(action, item_id, qty, from_loc, to_loc):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ws_log.append_row([timestamp, action, item_id, qty, from_loc, to_loc, "Admin"])
+    get_log_writer().write([timestamp, action, item_id, qty, from_loc, to_loc, "Admin"])
+
+# รวมการแก้ Current_Stock ของ 1 งาน ให้ส่งเป็น batch_update ครั้งเดียว
+def new_stock_mutation():
+    store = get_stock_store()
+    if SHARDED:
+        from wms_shard import ShardedMutation
+        return ShardedMutation(store, get_log_writer(), verify=STOCK_VERIFY_WRITES)
+    return StockMutation(store, get_log_writer(), verify=STOCK_VERIFY_WRITES)
+
+def commit_mutation(mut):
+    try:
+        result = mut.commit()
+    except QuotaExceeded as e:
+        # batch ไม่ถูกเขียนเลย (ทั้งงานล้มพร้อมกัน) แจ้งผู้ใช้แบบเดียวกับ error ของงาน
+        raise StockMutationError(str(e)) from e
+    st.session_state.last_op_stats = result
+    return result
+
+# เริ่มอ่าน Location_Master เบื้องหลัง (ครั้งเดียวต่อ process)
+get_location_prefetch()
+profile_mark("helpers")
 
 # ==========================================
 # 3. UI & MENU
@@ -186,13 +545,30 @@ menu = st.sidebar.radio("เมนูการทำงาน",
      "3. Replenishment (เติมสินค้า)",
      "4. Picking (หยิบสินค้า)",
      "5. Ship Out (ขนส่ง)",
-     "6. Add New Item (เพิ่มสินค้าใหม่)"]
+     "6. Add New Item (เพิ่มสินค้าใหม่)",
+     "7. History (ประวัติ)",
+     "8. Reconcile (กระทบยอด)",
+     "9. Slotting (จัดตำแหน่ง)"]
 )
 
-# --- 4. ฟังก์ชันช่วยบันทึก Log ---
-def log_transaction(action, item_id, qty, from_loc, to_loc):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ws_log.append_row([timestamp, action, item_id, qty, from_loc, to_loc, "Admin"])
+if st.session_state.get('last_op_stats'):
+    op = st.session_state.last_op_stats
+    st.sidebar.caption(f"⚡ งานล่าสุด: {op['api_calls']} API call / {op['requests']} requests / {op['ms']} ms"
+                       + (f" / ชนกับเครื่องอื่น {op['conflicts']} ครั้ง" if op.get('conflicts') else ""))
+log_stats = get_log_writer().stats
+pending_logs = get_log_writer().pending_count()
+if pending_logs or log_stats['last_error']:
+    st.sidebar.caption(f"📝 Log รอส่ง: {pending_logs} แถว" + (f" (Error: {log_stats['last_error']})" if log_stats['last_error'] else ""))
+if SHARDED:
+    st.sidebar.caption("🗄️ Shard: " + ", ".join(backend.stock_tables))
+if getattr(backend, "governor", None):
+    with st.sidebar.expander("📊 Sheets API"):
+        snap = backend.governor.snapshot()
+        st.dataframe(pd.DataFrame(snap).T.rename_axis("quota"), use_container_width=True)
+        throttles = list(backend.governor.events)
+        if throttles:
+            st.caption("โดน 429 ล่าสุด: " + ", ".join(f"{t} ({k})" for t, k, _ in throttles[-5:]))
+profile_mark("sidebar")
 
 # ==========================================
 # 1. RECEIVE (แก้ไข V2 - เพิ่มกล่อง Container)
@@ -200,90 +576,167 @@ def log_transaction(action, item_id, qty, from_loc, to_loc):
 if menu == "1. Receive (รับของ)":
     st.header("📥 1. Receive (V2 Updated)")  # สังเกตตรงนี้ ถ้าขึ้น V2 แปลว่า Code ใหม่มาแล้ว
     
-    @st.cache_data(ttl=600)
-    def load_master_data():
-        return pd.DataFrame(ws_item_master.get_all_records())
+    item_index = get_item_index()
+    item_index.sync()
     
-    df_master = load_master_data()
-    if not df_master.empty: df_master['Barcode'] = df_master['Barcode'].astype(str)
-    
-    df_stock_history = safe_get_data(ws_stock)
-
-    if 'cam_reset_id' not in st.session_state: st.session_state.cam_reset_id = 0
-    if 'scanned_code' not in st.session_state: st.session_state.scanned_code = None
-
-    st.subheader("📍 Step 1: ระบุสินค้า")
-    t1, t2 = st.tabs(["📸 กล้อง", "⌨️ พิมพ์"])
-    with t1:
-        c = st.camera_input("Scan", key=f"bc_{st.session_state.cam_reset_id}")
-        if c:
-            cd = decode_barcode_from_image(c)
-            if cd: st.session_state.scanned_code = cd
-    with t2:
-        mi_input = st.text_input("Key", key=f"mi_{st.session_state.cam_reset_id}")
-        if mi_input: st.session_state.scanned_code = mi_input
-
-    if st.session_state.scanned_code:
-        sb = st.session_state.scanned_code
-        # ค้นหาข้อมูล Master
-        mi = df_master[df_master['Barcode'] == str(sb)]
-        st.divider()
+    stock_store = get_stock_store()
+    stock_store.sync()
+
+    t_one, t_asn = st.tabs(["📷 ทีละชิ้น", "📦 ทั้งตู้ (ASN)"])
+    with t_one:
+        if 'cam_reset_id' not in st.session_state: st.session_state.cam_reset_id = 0
+        if 'scanned_code' not in st.session_state: st.session_state.scanned_code = None
+
+        st.subheader("📍 Step 1: ระบุสินค้า")
+        t1, t2, *t_live = st.tabs(["📸 กล้อง", "⌨️ พิมพ์"] + (["🎥 Live"] if LIVE_SCAN else []))
+        with t1:
+            c = st.camera_input("Scan", key=f"bc_{st.session_state.cam_reset_id}")
+            if c:
+                cd = decode_barcode_from_image(c)
+                if cd: st.session_state.scanned_code = cd
+        with t2:
+            mi_input = st.text_input("Key", key=f"mi_{st.session_state.cam_reset_id}")
+            if mi_input: st.session_state.scanned_code = mi_input
+        for t in t_live:
+            with t:
+                lv = live_scan("rc")
+                if lv: st.session_state.scanned_code = lv
+
+        if st.session_state.scanned_code:
+            sb = st.session_state.scanned_code
+            # ค้นหาข้อมูล Master
+            mi = item_index.get(sb)
+            st.divider()
         
-        if not mi.empty:
-            inf = mi.iloc[0]['Description']
-            drv = 1 # ค่า Default Replen Point
-            
-            # ดึงค่า Replen Point ล่าสุดจากประวัติ (ถ้ามี)
-            if not df_stock_history.empty and 'Item_ID' in df_stock_history.columns:
-                df_stock_history['Item_ID'] = df_stock_history['Item_ID'].astype(str)
-                hm = df_stock_history[df_stock_history['Item_ID'] == str(sb)]
-                if not hm.empty:
-                    try: drv = int(hm.iloc[-1]['Replen_Point'])
-                    except: pass
+            if mi is not None:
+                inf = mi['Description']
+                # ค่า Replen Point ล่าสุดของสินค้านี้ใน stock (ถ้าไม่มี Default = 1)
+                drv = stock_store.last_replen_point(sb, default=1)
             
-            st.success(f"✅ **{inf}**")
+                st.success(f"✅ **{inf}**")
+                # ของชิ้นนี้ที่มีอยู่แล้วทุก Location (ทุก shard ถ้าแบ่ง Spreadsheet)
+                on_hand = stock_store.lookup([sb])
+                if not on_hand.empty:
+                    with st.expander(f"📦 มีใน Stock แล้ว {len(on_hand)} แถว"):
+                        st.dataframe(on_hand, hide_index=True)
             
-            # ปุ่ม Cancel
-            if st.button("❌ Cancel"): 
-                st.session_state.scanned_code = None
-                st.session_state.cam_reset_id += 1
-                st.rerun()
+                # ปุ่ม Cancel
+                if st.button("❌ Cancel"): 
+                    st.session_state.scanned_code = None
+                    st.session_state.cam_reset_id += 1
+                    st.rerun()
             
-            # --- FORM เริ่มต้นตรงนี้ ---
-            with st.form("rf"):
-                st.text_input("Code", value=sb, disabled=True)
+                # --- FORM เริ่มต้นตรงนี้ ---
+                with st.form("rf"):
+                    st.text_input("Code", value=sb, disabled=True)
                 
-                # >>> ส่วนที่เพิ่ม: กล่อง Container <<<
-                container_id = st.text_input("ระบุหมายเลข Container / พาเลท", key="cont_input_new")
-                # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
+                    # >>> ส่วนที่เพิ่ม: กล่อง Container <<<
+                    container_id = st.text_input("ระบุหมายเลข Container / พาเลท", key="cont_input_new")
+                    # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
                 
-                c1, c2 = st.columns(2)
-                with c1: q = st.number_input("Qty", min_value=1, value=1)
-                with c2: r = st.number_input("Replen Point", min_value=0, value=drv)
+                    c1, c2 = st.columns(2)
+                    with c1: q = st.number_input("Qty", min_value=1, value=1)
+                    with c2: r = st.number_input("Replen Point", min_value=0, value=drv)
                 
-                if st.form_submit_button("✅ Save"):
-                    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    if st.form_submit_button("✅ Save"):
+                        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     
-                    # เช็คค่า Container (ถ้าไม่กรอก ให้เป็น "-")
-                    cont_val = container_id if container_id else "-"
+                        # เช็คค่า Container (ถ้าไม่กรอก ให้เป็น "-")
+                        cont_val = container_id if container_id else "-"
                     
-                    try:
-                        # เรียง Data ตาม Column ใน Google Sheet
-                        # Col 1:ID, 2:Name, 3:Qty, 4:Loc, 5:Status, 6:Container, 7:Replen, 8:Time
-                        new_row = [str(sb), inf, q, "DOCK_IN", "Pending Putaway", cont_val, r, ts]
+                        try:
+                            # เรียง Data ตาม Column ใน Google Sheet
+                            # Col 1:ID, 2:Name, 3:Qty, 4:Loc, 5:Status, 6:Container, 7:Replen, 8:Time
+                            new_row = [str(sb), inf, q, "DOCK_IN", "Pending Putaway", cont_val, r, ts]
                         
-                        ws_stock.append_row(new_row)
-                        log_transaction("RECEIVE", sb, q, "-", "DOCK_IN")
+                            mut = new_stock_mutation()
+                            mut.append(new_row)
+                            mut.log("RECEIVE", sb, q, "-", "DOCK_IN")
+                            commit_mutation(mut)
                         
-                        st.success(f"บันทึกสำเร็จ! (Container: {cont_val})")
-                        st.session_state.scanned_code = None
-                        st.session_state.cam_reset_id += 1
-                        st.rerun()
+                            st.success(f"บันทึกสำเร็จ! (Container: {cont_val})")
+                            st.session_state.scanned_code = None
+                            st.session_state.cam_reset_id += 1
+                            st.rerun()
                         
-                    except Exception as e: 
-                        st.error(f"Error: {e}")
-        else: 
-            st.error(f"❌ ไม่พบสินค้า Code: {sb} ใน Master Data")
+                        except Exception as e: 
+                            st.error(f"Error: {e}")
+            else: 
+                st.error(f"❌ ไม่พบสินค้า Code: {sb} ใน Master Data")
+                # อาจพิมพ์ชื่อสินค้าแทน Barcode: แนะนำสินค้าที่ชื่อขึ้นต้นด้วยคำนี้
+                matches = item_index.search_prefix(sb)
+                if matches:
+                    opts = [f"{m['Barcode']} : {m['Description']}" for m in matches]
+                    pick = st.selectbox("หรือเลือกจากชื่อสินค้า", opts, index=None)
+                    if pick:
+                        st.session_state.scanned_code = pick.split(" : ")[0]
+                        st.session_state.cam_reset_id += 1  # ล้างช่องพิมพ์ ไม่ให้ค่าเดิมทับ
+                        st.rerun()
+
+    with t_asn:
+        # รับของทั้งตู้: อัปโหลด ASN -> ตรวจกับ Item_Master ทีละ chunk -> (สแกนนับเทียบ) -> บันทึกใน batch เดียว
+        if 'asn_r' not in st.session_state: st.session_state.asn_r = 0
+        st.caption("ไฟล์ CSV / Excel ที่มี column: Container, Barcode, Qty")
+        asn_cont = st.text_input("Container / พาเลท (ใช้กับบรรทัดที่ไม่มี Container)", key=f"asn_cont_{st.session_state.asn_r}")
+        asn_file = st.file_uploader("ไฟล์ ASN", type=["csv", "xlsx"], key=f"asn_file_{st.session_state.asn_r}")
+        if asn_file:
+            sig = (asn_file.name, asn_file.size, asn_cont.strip())
+            if st.session_state.get('asn_sig') != sig:
+                try:
+                    lines, errors, total = validate_asn(read_asn(asn_file, asn_file.name, ASN_CHUNK_ROWS),
+                                                        item_index, default_container=asn_cont.strip())
+                except AsnError as e:
+                    lines, errors, total = None, None, 0
+                    st.error(f"❌ {e}")
+                st.session_state.asn = {"lines": lines, "errors": errors, "total": total}
+                st.session_state.asn_sig = sig
+                st.session_state.asn_scans = {}
+            asn = st.session_state.asn
+            if asn["lines"] is not None:
+                lines, errors = asn["lines"], asn["errors"]
+                c1, c2, c3 = st.columns(3)
+                c1.metric("บรรทัดในไฟล์", asn["total"])
+                c2.metric("ผ่าน", f"{len(lines)} SKU / {int(lines['Qty'].sum())} ชิ้น")
+                c3.metric("ไม่ผ่าน", len(errors))
+                if not errors.empty:
+                    st.warning(f"⚠️ {len(errors)} บรรทัดไม่ผ่าน (จะไม่ถูกรับเข้า)")
+                    st.dataframe(errors, hide_index=True)
+                    st.download_button("⬇️ บรรทัดที่ไม่ผ่าน (CSV)", errors.to_csv(index=False).encode('utf-8-sig'),
+                                       file_name=f"asn_errors_{asn_file.name}.csv", mime="text/csv")
+                
+                # สแกนนับของจริงเทียบกับ ASN (จำนวนต่อครั้ง เช่น ยิงกล่องที่มี 24 ชิ้น)
+                scans = st.session_state.asn_scans
+                with st.form("asn_scan", clear_on_submit=True):
+                    c1, c2 = st.columns([3, 1])
+                    code = c1.text_input("📲 สแกน Barcode")
+                    n = c2.number_input("จำนวน", min_value=1, value=1)
+                    if st.form_submit_button("นับ") and code.strip():
+                        scans[code.strip()] = scans.get(code.strip(), 0) + int(n)
+                if scans:
+                    recon = reconcile(lines, scans)
+                    bad = recon[recon['Result'] != "OK"]
+                    st.caption(f"สแกนแล้ว {sum(scans.values())} ชิ้น / ตรง {len(recon) - len(bad)} / ไม่ตรง {len(bad)} SKU")
+                    st.dataframe(recon, hide_index=True)
+                    if st.button("ล้างการนับ"):
+                        st.session_state.asn_scans = {}; st.rerun()
+                
+                by_count = st.radio("จำนวนที่รับเข้า", ["ตาม ASN", "ตามที่สแกนนับ (ไม่เกิน ASN)"],
+                                    horizontal=True, disabled=not scans) != "ตาม ASN"
+                to_receive = apply_counts(lines, scans) if by_count and scans else lines
+                if st.button(f"✅ รับเข้า {len(to_receive)} บรรทัด / {int(to_receive['Qty'].sum())} ชิ้น",
+                             type="primary", disabled=to_receive.empty):
+                    mut = add_asn_to_mutation(new_stock_mutation(), to_receive,
+                                              replen_point=lambda b: stock_store.last_replen_point(b, default=1))
+                    try:
+                        res = commit_mutation(mut)
+                    except StockMutationError as e:
+                        st.error(f"❌ {e}")
+                    else:
+                        st.session_state.asn_r += 1
+                        st.session_state.asn_sig = None
+                        st.toast(f"รับเข้า {len(to_receive)} บรรทัด ({res['api_calls']} API call)")
+                        st.rerun()
+
 
 # ==========================================
 # 2. PUT AWAY
@@ -291,7 +744,7 @@ if menu == "1. Receive (รับของ)":
 elif menu == "2. Put Away (เก็บเข้าชั้น)":
     st.header("🏗️ 2. Put Away")
     # (Code V21)
-    df = safe_get_data(ws_stock)
+    df = get_stock_df()
     loc_map = get_location_map()
     pending = df[df['Location'] == "DOCK_IN"] if not df.empty else pd.DataFrame()
     if not pending.empty:
@@ -300,7 +753,7 @@ elif menu == "2. Put Away (เก็บเข้าชั้น)":
         if 'pa_s' not in st.session_state: st.session_state.pa_s = None
         if st.session_state.pa_s is None:
             st.subheader("📲 Step 1: สแกนสินค้า")
-            t1, t2 = st.tabs(["📸 กล้อง", "⌨️ พิมพ์"])
+            t1, t2, *t_live = st.tabs(["📸 กล้อง", "⌨️ พิมพ์"] + (["🎥 Live"] if LIVE_SCAN else []))
             with t1:
                 c = st.camera_input("Scan", key=f"pc_{st.session_state.pa_r}")
                 if c:
@@ -309,15 +762,25 @@ elif menu == "2. Put Away (เก็บเข้าชั้น)":
             with t2:
                 m = st.text_input("Key", key=f"pm_{st.session_state.pa_r}")
                 if m: st.session_state.pa_s = m; st.rerun()
+            for t in t_live:
+                with t:
+                    lv = live_scan("pa_item")
+                    if lv: st.session_state.pa_s = lv; st.rerun()
         else:
             sel = st.session_state.pa_s
-            pending['Item_ID'] = pending['Item_ID'].astype(str)
             m_row = pending[pending['Item_ID'] == str(sel)]
             if not m_row.empty:
                 st.success(f"✅ Selected: {m_row.iloc[0]['Item_Name']}")
                 if st.button("Cancel"): st.session_state.pa_s = None; st.session_state.pa_r += 1; st.rerun()
                 st.subheader("📍 Step 2: ปลายทาง")
-                t3, t4 = st.tabs(["📸 กล้อง", "⌨️ พิมพ์"])
+                # ปลายทางแนะนำจากความถี่การหยิบ (กดแล้วใช้เหมือนสแกน Location)
+                sug = slotting_model().suggest_putaway(sel, get_stock_store(), get_location_table())
+                if not sug.empty:
+                    st.caption("💡 แนะนำ: " + " / ".join(f"{r.Location} ({r.Reason})" for r in sug.itertuples()))
+                    for col, r in zip(st.columns(len(sug)), sug.itertuples()):
+                        if col.button(r.Location, key=f"pa_sug_{st.session_state.pa_r}_{r.Location}"):
+                            st.session_state[f"pa_tgt_{st.session_state.pa_r}"] = r.Location; st.rerun()
+                t3, t4, *t_live = st.tabs(["📸 กล้อง", "⌨️ พิมพ์"] + (["🎥 Live"] if LIVE_SCAN else []))
                 tgt = None
                 with t3:
                     lc = st.camera_input("Loc", key=f"lc_{st.session_state.pa_r}")
@@ -327,21 +790,24 @@ elif menu == "2. Put Away (เก็บเข้าชั้น)":
                 with t4:
                     lm = st.text_input("Loc Key", key=f"lm_{st.session_state.pa_r}")
                     if lm: tgt = lm
+                for t in t_live:
+                    with t:
+                        # Location ที่อ่านได้จาก Live ต้องอยู่ถึง rerun ถัดไป (ตอนกดปุ่ม Move) เก็บไว้ใน session
+                        lv = live_scan("pa_loc")
+                        if lv: st.session_state[f"pa_tgt_{st.session_state.pa_r}"] = lv
+                tgt = tgt or st.session_state.get(f"pa_tgt_{st.session_state.pa_r}")
                 if tgt:
-                    valid, msg = validate_move_rule(tgt, loc_map, df)
+                    valid, msg = validate_move_rule(tgt, loc_map, get_stock_store())
                     if valid:
                         if st.button(f"Move to {tgt}", type="primary"):
-                            cl = ws_stock.findall(str(sel))
-                            fnd = False
-                            for c in cl:
-                                if ws_stock.cell(c.row, 4).value == "DOCK_IN":
-                                    ws_stock.update_cell(c.row, 4, tgt)
-                                    ws_stock.update_cell(c.row, 5, "Available")
-                                    ws_stock.update_cell(c.row, 8, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                                    log_transaction("PUT_AWAY", sel, "All", "DOCK_IN", tgt)
-                                    st.toast("Done"); st.session_state.pa_s = None; st.session_state.pa_r += 1; st.rerun()
-                                    fnd = True; break
-                            if not fnd: st.error("Not found")
+                            mut = new_stock_mutation()
+                            mut.move(sel, "DOCK_IN", tgt, status="Available", log_action="PUT_AWAY")
+                            try:
+                                commit_mutation(mut)
+                            except StockMutationError:
+                                st.error("Not found")
+                            else:
+                                st.toast("Done"); st.session_state.pa_s = None; st.session_state.pa_r += 1; st.rerun()
                     else: st.error(msg)
             else: st.error("Not Found"); st.session_state.pa_s = None; st.session_state.pa_r += 1; st.rerun()
     else: st.info("No Pending Items")
@@ -351,76 +817,111 @@ elif menu == "2. Put Away (เก็บเข้าชั้น)":
 # ==========================================
 elif menu == "3. Replenishment (เติมสินค้า)":
     st.header("🔄 3. Replenishment")
-    df = safe_get_data(ws_stock)
+    df = get_stock_df()
     loc_map = get_location_map()
     if not df.empty:
-        df['Qty'] = pd.to_numeric(df['Qty'], errors='coerce')
-        df['Replen_Point'] = pd.to_numeric(df['Replen_Point'], errors='coerce')
         df['Loc_Type'] = df['Location'].map(loc_map)
-        queue = df[(df['Qty'] <= df['Replen_Point']) & (df['Loc_Type'] == 'PICK')]
+        queue = df[(df['Qty'] <= df['Replen_Point']) & (df['Loc_Type'] == 'PICK')].copy()
         
         if not queue.empty:
+            # ของใน Reserve รวมต่อสินค้า: อ่านจาก on-hand ของ StockStore ทีละสินค้าในคิว ไม่ต้องกรองทั้ง frame
+            store = get_stock_store()
+            reserve_total = {i: store.on_hand_by_type(i, loc_map).get('RESERVE', 0) for i in queue['Item_ID'].unique()}
+            queue['Reserve_Qty'] = queue['Item_ID'].map(reserve_total).astype('int64')
             st.error(f"🚨 ต้องเติม: {len(queue)} รายการ")
-            st.dataframe(queue[['Item_ID', 'Item_Name', 'Location', 'Qty', 'Replen_Point']], hide_index=True)
+            st.dataframe(queue[['Item_ID', 'Item_Name', 'Location', 'Qty', 'Replen_Point', 'Reserve_Qty']], hide_index=True)
             st.divider()
-            opts = queue.apply(lambda x: f"{x['Item_ID']} : {x['Item_Name']} ({x['Location']})", axis=1).tolist()
-            sel_task = st.selectbox("เลือกรายการ", opts)
-            if sel_task:
-                i_id = sel_task.split(" : ")[0]
-                t_loc = sel_task.split("(")[1].replace(")", "")
-                t_dat = queue[(queue['Item_ID'] == i_id) & (queue['Location'] == t_loc)].iloc[0]
+            tw, t1 = st.tabs(["🌊 Wave (เติมทั้งหมด)", "✍️ ทีละรายการ"])
+            with tw:
+                tasks, shortages = plan_replenishment_wave(df, loc_map)
+                if tasks.empty:
+                    st.warning("ไม่พบสินค้าใน Reserve")
+                else:
+                    st.info(f"🌊 Wave: {len(tasks)} งาน / {int(tasks['Qty'].sum())} ชิ้น (Reserve เก่าสุดออกก่อน)")
+                    if 'wave_done' not in st.session_state: st.session_state.wave_done = set()
+                    if 'wave_r' not in st.session_state: st.session_state.wave_r = 0
+                    tasks['Key'] = tasks['Item_ID'] + "|" + tasks['From_Loc'] + "|" + tasks['To_Loc']
+                    
+                    # สแกน Location ต้นทาง (หรือพิมพ์เลข Task) เพื่อยืนยันว่าหยิบของแล้ว
+                    scan = st.text_input("📲 สแกน Location ต้นทาง / เลข Task", key=f"wave_scan_{st.session_state.wave_r}")
+                    if scan:
+                        todo = tasks[~tasks['Key'].isin(st.session_state.wave_done)]
+                        hit = todo[(todo['From_Loc'] == scan.strip()) | (todo['Task'].astype(str) == scan.strip())]
+                        if hit.empty:
+                            st.warning(f"ไม่มีงานค้างที่ {scan}")
+                        else:
+                            st.session_state.wave_done.add(hit.iloc[0]['Key'])
+                            st.session_state.wave_r += 1
+                            st.rerun()
+                    
+                    tasks.insert(1, '✅', tasks['Key'].isin(st.session_state.wave_done))
+                    st.dataframe(tasks.drop(columns=['Key']), hide_index=True)
+                    ts_file = datetime.now().strftime("%Y%m%d_%H%M")
+                    st.download_button("🖨️ ใบงาน Wave (CSV)",
+                                       tasks.drop(columns=['Key', '✅']).to_csv(index=False).encode('utf-8-sig'),
+                                       file_name=f"replen_wave_{ts_file}.csv", mime="text/csv")
+                    if not shortages.empty:
+                        st.warning(f"⚠️ Reserve ไม่พอ {len(shortages)} รายการ")
+                        st.dataframe(shortages, hide_index=True)
+                    
+                    confirm_all = st.checkbox("ยืนยันทุกงาน (ไม่ต้องสแกนทีละงาน)")
+                    to_commit = tasks if confirm_all else tasks[tasks['✅']]
+                    if st.button(f"🚀 บันทึก Wave ({len(to_commit)} งาน)", type="primary", disabled=to_commit.empty):
+                        mut = add_wave_to_mutation(new_stock_mutation(), to_commit)
+                        try:
+                            commit_mutation(mut)
+                        except StockMutationError as e:
+                            st.error(f"❌ {e}")
+                        else:
+                            st.session_state.wave_done = set()
+                            st.toast(f"เติมสินค้า {len(to_commit)} งานเรียบร้อย"); st.rerun()
+            with t1:
+                opts = queue.apply(lambda x: f"{x['Item_ID']} : {x['Item_Name']} ({x['Location']})", axis=1).tolist()
+                sel_task = st.selectbox("เลือกรายการ", opts)
+                if sel_task:
+                    i_id = sel_task.split(" : ")[0]
+                    t_loc = sel_task.split("(")[1].replace(")", "")
+                    t_dat = queue[(queue['Item_ID'] == i_id) & (queue['Location'] == t_loc)].iloc[0]
                 
-                res_stock = df[(df['Item_ID'] == i_id) & (df['Loc_Type'] == 'RESERVE')]
-                if not res_stock.empty:
-                    st.success(f"พบ Reserve: {len(res_stock)} จุด")
-                    st.dataframe(res_stock[['Location', 'Qty']], hide_index=True)
-                    with st.form("exe_rep"):
-                        c1, c2 = st.columns(2)
-                        with c1: 
-                            src = st.selectbox("จาก Reserve", res_stock['Location'].tolist())
-                            # --- GUARD: หาจำนวนที่มีจริงใน Location ที่เลือก ---
-                            max_avail = int(res_stock[res_stock['Location'] == src].iloc[0]['Qty'])
-                            st.caption(f"📍 มีของ: {max_avail} ชิ้น")
+                    reserve = store.stock_of(i_id, loc_map, 'RESERVE')
+                    res_stock = pd.DataFrame({'Location': list(reserve), 'Qty': list(reserve.values())})
+                    res_stock = res_stock[res_stock['Qty'] > 0]
+                    if not res_stock.empty:
+                        st.success(f"พบ Reserve: {len(res_stock)} จุด")
+                        st.dataframe(res_stock[['Location', 'Qty']], hide_index=True)
+                        with st.form("exe_rep"):
+                            c1, c2 = st.columns(2)
+                            with c1: 
+                                src = st.selectbox("จาก Reserve", res_stock['Location'].tolist())
+                                # --- GUARD: หาจำนวนที่มีจริงใน Location ที่เลือก ---
+                                max_avail = reserve[src]
+                                st.caption(f"📍 มีของ: {max_avail} ชิ้น")
                             
-                        with c2: 
-                            sug = int(t_dat['Replen_Point'] - t_dat['Qty'])
-                            if sug > max_avail: sug = max_avail # ปรับ Suggest ไม่ให้เกินของที่มี
+                            with c2: 
+                                sug = int(t_dat['Replen_Point'] - t_dat['Qty'])
+                                if sug > max_avail: sug = max_avail # ปรับ Suggest ไม่ให้เกินของที่มี
                             
-                            # --- GUARD: ล็อค Max Value ที่หน้าจอ ---
-                            qty = st.number_input("จำนวนเติม", min_value=1, max_value=max_avail, value=sug if sug > 0 else 1)
+                                # --- GUARD: ล็อค Max Value ที่หน้าจอ ---
+                                qty = st.number_input("จำนวนเติม", min_value=1, max_value=max_avail, value=sug if sug > 0 else 1)
                         
-                        new_rp = st.number_input("แก้ไข Replen Point", 0, value=int(t_dat['Replen_Point']))
+                            new_rp = st.number_input("แก้ไข Replen Point", 0, value=int(t_dat['Replen_Point']))
                         
-                        if st.form_submit_button("Confirm"):
-                            # --- GUARD: เช็คอีกรอบก่อนบันทึก ---
-                            if qty > max_avail:
-                                st.error(f"❌ ทำรายการไม่ได้! คุณกรอก {qty} แต่มีของแค่ {max_avail}")
-                                st.stop()
+                            if st.form_submit_button("Confirm"):
+                                # --- GUARD: เช็คอีกรอบก่อนบันทึก ---
+                                if qty > max_avail:
+                                    st.error(f"❌ ทำรายการไม่ได้! คุณกรอก {qty} แต่มีของแค่ {max_avail}")
+                                    st.stop()
 
-                            try:
-                                # Cut Source
-                                cl_s = ws_stock.findall(str(i_id))
-                                for c in cl_s:
-                                    if ws_stock.cell(c.row, 4).value == src:
-                                        curr = int(ws_stock.cell(c.row, 3).value)
-                                        if curr >= qty:
-                                            rem = curr - qty
-                                            if rem == 0: ws_stock.delete_rows(c.row)
-                                            else: ws_stock.update_cell(c.row, 3, rem)
-                                            break
-                                # Add Target
-                                cl_t = ws_stock.findall(str(i_id))
-                                for c in cl_t:
-                                    if ws_stock.cell(c.row, 4).value == t_loc:
-                                        curr = int(ws_stock.cell(c.row, 3).value)
-                                        ws_stock.update_cell(c.row, 3, curr + qty)
-                                        ws_stock.update_cell(c.row, 7, new_rp)
-                                        ws_stock.update_cell(c.row, 8, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                                        break
-                                log_transaction("REPLENISH", i_id, qty, src, t_loc)
-                                st.success("Success"); st.rerun()
-                            except Exception as e: st.error(e)
-                else: st.warning("ไม่พบสินค้าใน Reserve")
+                                try:
+                                    # Cut Source -> Add Target -> Log (ส่งทีเดียว)
+                                    mut = new_stock_mutation()
+                                    mut.decrement(i_id, src, qty)
+                                    mut.increment(i_id, t_loc, qty, replen_point=new_rp, item_name=t_dat['Item_Name'])
+                                    mut.log("REPLENISH", i_id, qty, src, t_loc)
+                                    commit_mutation(mut)
+                                    st.success("Success"); st.rerun()
+                                except Exception as e: st.error(e)
+                    else: st.warning("ไม่พบสินค้าใน Reserve")
         else: st.success("PICK Zone ปกติ")
 
 # ==========================================
@@ -429,35 +930,132 @@ elif menu == "3. Replenishment (เติมสินค้า)":
 elif menu == "4. Picking (หยิบสินค้า)":
     st.header("🛒 4. Picking")
     # (Code V19)
-    df = safe_get_data(ws_stock)
+    df = get_stock_df()
+    if 'pk_r' not in st.session_state: st.session_state.pk_r = 0
     if not df.empty:
-        if 'pk_r' not in st.session_state: st.session_state.pk_r = 0
-        il = df['Item_ID'].unique().tolist()
-        dk = f"pks_{st.session_state.pk_r}"
-        sp = st.selectbox("Item", il, index=None, key=dk)
-        if sp:
-            df['Item_ID'] = df['Item_ID'].astype(str)
-            sl = df[df['Item_ID'] == str(sp)]
-            if not sl.empty:
-                st.dataframe(sl[['Location', 'Qty']])
-                with st.form("pk"):
-                    tl = st.selectbox("Loc", sl['Location'].unique())
-                    # GUARD Picking: ห้ามหยิบเกิน
-                    max_pick = int(sl[sl['Location'] == tl].iloc[0]['Qty'])
-                    q = st.number_input("Qty", min_value=1, max_value=max_pick, value=1)
+        tb, t1 = st.tabs(["📋 ตาม Order (Batch)", "✍️ ทีละรายการ"])
+        with tb:
+            src = st.radio("Order จาก", ["ชีต Orders", "ไฟล์ CSV"], horizontal=True)
+            raw = pd.DataFrame()
+            if src == "ชีต Orders":
+                raw = get_open_orders()
+                if not backend.orders: st.info("ไม่พบชีต Orders (ต้องมี column: Order_ID, Item_ID, Qty)")
+            else:
+                up = st.file_uploader("CSV (Order_ID, Item_ID, Qty)", type=["csv"], key="pk_orders_csv")
+                if up: raw = pd.read_csv(up, dtype=str)
+            
+            if raw.empty:
+                st.info("ไม่มี Order รอหยิบ")
+            else:
+                try:
+                    orders = load_orders(raw)
+                except ValueError as e:
+                    st.error(f"❌ {e}"); orders = pd.DataFrame()
+                # Order ที่บันทึกหยิบไปแล้วใน session นี้ไม่ถูกจัดสรรซ้ำ (CSV / ชีตที่ไม่มี Status / อัปเดต Status ไม่สำเร็จ)
+                if 'pk_picked' not in st.session_state: st.session_state.pk_picked = set()
+                if not orders.empty and st.session_state.pk_picked:
+                    picked = orders['Order_ID'].isin(st.session_state.pk_picked)
+                    if picked.any():
+                        c1, c2 = st.columns([3, 1])
+                        c1.caption(f"✅ ซ่อน {orders[picked]['Order_ID'].nunique()} Order ที่บันทึกหยิบแล้ว")
+                        if c2.button("แสดงอีกครั้ง", key="pk_unhide"):
+                            st.session_state.pk_picked = set(); st.rerun()
+                        orders = orders[~picked]
+                if not orders.empty:
+                    n_per = st.number_input("Order ต่อ Batch", min_value=1, value=PICK_BATCH_ORDERS)
+                    picks, shortages = allocate_orders(orders, df, get_location_map())
+                    batch_of = make_batches(orders[~orders['Order_ID'].isin(shortages['Order_ID'])], n_per)
+                    st.info(f"📋 {orders['Order_ID'].nunique()} Orders / {len(orders)} บรรทัด -> {max(batch_of.values(), default=0)} Batch")
+                    if not shortages.empty:
+                        st.warning(f"⚠️ Stock ไม่พอ {shortages['Order_ID'].nunique()} Order (พักไว้ทั้ง Order ยังไม่หยิบ)")
+                        st.dataframe(shortages, hide_index=True)
+                    
+                    bno = st.selectbox("Batch", sorted(set(batch_of.values())), format_func=lambda b: f"Batch {b}")
+                    b_picks = picks[picks['Order_ID'].map(batch_of) == bno]
+                    stops = pick_path(b_picks, get_location_coords())
+                    if stops.empty:
+                        st.warning("ไม่มี Order ที่หยิบได้ครบ")
+                    else:
+                        if 'pk_done' not in st.session_state: st.session_state.pk_done = set()
+                        stops['Key'] = f"{bno}|" + stops['Item_ID'] + "|" + stops['Location']
+                        
+                        # สแกน Location ตามลำดับจุดหยิบเพื่อยืนยันว่าหยิบแล้ว
+                        live = None
+                        if LIVE_SCAN:
+                            with st.expander("🎥 สแกนด้วยกล้อง Live"):
+                                live = live_scan("pk")
+                        scan = live or st.text_input("📲 สแกน Location / เลข Stop", key=f"pk_scan_{st.session_state.pk_r}")
+                        if scan:
+                            todo = stops[~stops['Key'].isin(st.session_state.pk_done)]
+                            hit = todo[(todo['Location'] == scan.strip()) | (todo['Stop'].astype(str) == scan.strip())]
+                            if hit.empty:
+                                st.warning(f"ไม่มีจุดหยิบค้างที่ {scan}")
+                            else:
+                                st.session_state.pk_done.add(hit.iloc[0]['Key'])
+                                st.session_state.pk_r += 1
+                                st.rerun()
+                        
+                        stops.insert(1, '✅', stops['Key'].isin(st.session_state.pk_done))
+                        st.dataframe(stops.drop(columns=['Key']), hide_index=True)
+                        st.download_button("🖨️ ใบหยิบ (CSV)",
+                                           stops.drop(columns=['Key', '✅']).to_csv(index=False).encode('utf-8-sig'),
+                                           file_name=f"pick_batch_{bno}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+                                           mime="text/csv")
+                        
+                        # บันทึกทั้ง Batch ครั้งเดียว (ไม่บันทึกบางจุด เพราะ Order ที่ยังเปิดอยู่จะถูกจัดสรรซ้ำ)
+                        lane = st.selectbox("📦 วางของที่ช่อง Staging", get_staging_lanes(), key="pk_lane")
+                        confirm_all = st.checkbox("ยืนยันทุกจุด (ไม่ต้องสแกนทีละจุด)")
+                        left = int((~stops['✅']).sum())
+                        label = f"🚀 บันทึกการหยิบ Batch {bno} ({len(stops)} จุด)" if confirm_all or not left else f"เหลืออีก {left} จุด"
+                        if st.button(label, type="primary", disabled=bool(left) and not confirm_all):
+                            mut = add_picks_to_mutation(new_stock_mutation(), b_picks, lane)
+                            try:
+                                commit_mutation(mut)
+                            except StockMutationError as e:
+                                st.error(f"❌ {e}")
+                            else:
+                                # ทุก Order ใน Batch หยิบครบแล้ว -> Status = PICKED ในชีต Orders
+                                done_ids = set(b_picks['Order_ID'])
+                                st.session_state.pk_picked |= done_ids
+                                st.session_state.pk_done = set()
+                                if src == "ชีต Orders" and 'Status' in raw.columns:
+                                    s_col = raw.columns.get_loc('Status') + 1
+                                    rows = raw[raw['Order_ID'].astype(str).str.strip().isin(done_ids)]['Row']
+                                    try:
+                                        backend.orders.apply_batch(updates=[(int(r), s_col, "PICKED") for r in rows])
+                                    except Exception as e:
+                                        # Stock ย้ายไปแล้ว: Order ยังถูกซ่อนใน session นี้ แต่ต้องแก้ Status ในชีตเอง
+                                        st.error(f"⚠️ หยิบ Batch {bno} แล้ว แต่อัปเดต Status ในชีต Orders ไม่สำเร็จ: {e} "
+                                                 f"(Order: {', '.join(sorted(done_ids))})")
+                                        st.stop()
+                                    get_open_orders.clear()
+                                st.toast(f"หยิบ Batch {bno} เรียบร้อย ({len(done_ids)} Order)"); st.rerun()
+        with t1:
+            il = df['Item_ID'].unique().tolist()
+            dk = f"pks_{st.session_state.pk_r}"
+            sp = st.selectbox("Item", il, index=None, key=dk)
+            if sp:
+                sl = df[(df['Item_ID'] == str(sp)) & (df['Status'] != STAGED_STATUS)]
+                if not sl.empty:
+                    st.dataframe(sl[['Location', 'Qty']])
+                    with st.form("pk"):
+                        tl = st.selectbox("Loc", sl['Location'].unique())
+                        lane = st.selectbox("Staging", get_staging_lanes())
+                        # GUARD Picking: ห้ามหยิบเกิน
+                        max_pick = int(sl[sl['Location'] == tl].iloc[0]['Qty'])
+                        q = st.number_input("Qty", min_value=1, max_value=max_pick, value=1)
                     
-                    if st.form_submit_button("Pick"):
-                        cl = ws_stock.findall(str(sp))
-                        for c in cl:
-                            if ws_stock.cell(c.row, 4).value == tl:
-                                cr = int(ws_stock.cell(c.row, 3).value)
-                                if cr >= q:
-                                    nq = cr - q
-                                    if nq == 0: ws_stock.delete_rows(c.row)
-                                    else: ws_stock.update_cell(c.row, 3, nq)
-                                    log_transaction("PICKING", sp, q, tl, "OUT")
-                                    st.toast("Picked"); st.session_state.pk_r += 1; st.rerun()
-                                break
+                        if st.form_submit_button("Pick"):
+                            mut = new_stock_mutation()
+                            mut.decrement(sp, tl, q)
+                            mut.increment(sp, lane, q, item_name=sl.iloc[0]['Item_Name'], status=STAGED_STATUS, container="-")
+                            mut.log("PICKING", sp, q, tl, lane)
+                            try:
+                                commit_mutation(mut)
+                            except StockMutationError as e:
+                                st.error(f"❌ {e}")
+                            else:
+                                st.toast("Picked"); st.session_state.pk_r += 1; st.rerun()
     else: st.info("No Data")
 
 # ==========================================
@@ -465,6 +1063,62 @@ elif menu == "4. Picking (หยิบสินค้า)":
 # ==========================================
 elif menu == "5. Ship Out (ขนส่ง)":
     st.header("🚚 5. Ship Out")
+    df = get_stock_df()
+    lanes = get_staging_lanes()
+    summary = lane_summary(df, lanes)
+    st.subheader("📦 ของรอส่งในช่อง Staging")
+    st.dataframe(summary, hide_index=True)
+    
+    loaded = summary[summary['Lines'] > 0]['Lane'].tolist()
+    if not loaded:
+        st.info("ไม่มีของรอส่ง")
+    else:
+        if 'ship_r' not in st.session_state: st.session_state.ship_r = 0
+        sel_lanes = st.multiselect("เลือกช่องที่ขึ้นรถคันนี้", loaded, default=loaded, key=f"ship_lanes_{st.session_state.ship_r}")
+        c1, c2 = st.columns(2)
+        shp_id = c1.text_input("Shipment ID", value=f"SHP-{datetime.now().strftime('%Y%m%d-%H%M')}", key=f"ship_id_{st.session_state.ship_r}")
+        truck = c2.text_input("ทะเบียนรถ / ผู้ขนส่ง", key=f"ship_truck_{st.session_state.ship_r}")
+        
+        if sel_lanes and shp_id.strip():
+            shp_id = shp_id.strip()
+            manifest = build_manifest(df, sel_lanes, shp_id)
+            st.subheader(f"📄 Manifest: {shp_id}")
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Orders", manifest.loc[manifest['Order_ID'] != "-", 'Order_ID'].nunique())
+            m2.metric("บรรทัด", len(manifest))
+            m3.metric("ชิ้น", int(manifest['Qty'].sum()))
+            st.dataframe(manifest, hide_index=True)
+            out = manifest.assign(Truck=truck)
+            st.download_button("🖨️ Manifest (CSV)", out.to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"manifest_{shp_id}.csv", mime="text/csv")
+            
+            # ปิดรถ: ตัดทุกแถวในช่องที่เลือก + log SHIP_OUT ใน commit เดียว
+            if st.checkbox(f"ยืนยันรถออก {len(manifest)} บรรทัด"):
+                if st.button("🚚 ปิดรถ / ตัด Stock", type="primary"):
+                    try:
+                        commit_mutation(add_closeout_to_mutation(new_stock_mutation(), sel_lanes, shp_id))
+                    except StockMutationError as e:
+                        st.error(f"❌ {e}")
+                    else:
+                        shipped = set(manifest['Order_ID']) - {"-"}
+                        st.session_state.ship_r += 1
+                        if backend.orders and shipped:
+                            o_df = get_open_orders(closed=("SHIPPED", "CANCELLED"))
+                            if 'Status' in o_df.columns:
+                                s_col = list(o_df.columns).index('Status') + 1
+                                hit = o_df[o_df['Order_ID'].astype(str).str.strip().isin(shipped)]
+                                if len(hit):
+                                    try:
+                                        backend.orders.apply_batch(updates=[(int(r), s_col, "SHIPPED") for r in hit['Row']])
+                                    except Exception as e:
+                                        # Stock ตัดออกไปแล้ว: แจ้ง Order ที่ยังไม่ได้ SHIPPED ให้แก้ Status ในชีตเอง
+                                        get_open_orders.clear()
+                                        not_marked = sorted(hit['Order_ID'].astype(str).str.strip().unique())
+                                        st.warning(f"⚠️ รถ {shp_id} ออกแล้ว แต่อัปเดต Status ในชีต Orders ไม่สำเร็จ: {e} "
+                                                   f"(Order ที่ยังไม่เป็น SHIPPED: {', '.join(not_marked)})")
+                                        st.stop()
+                                get_open_orders.clear()
+                        st.toast(f"รถ {shp_id} ออกแล้ว ({len(manifest)} บรรทัด)"); st.rerun()
 
 # ==========================================
 # 6. ADD NEW ITEM (NEW FEATURE)
@@ -475,7 +1129,7 @@ elif menu == "6. Add New Item (เพิ่มสินค้าใหม่)":
     st.warning(f"📂 รูปจะถูกอัปโหลดไปที่ Drive Folder ID: {PICTURE_FOLDER_ID}")
     
     # 1. เชื่อมต่อ Drive
-    drive_service = authenticate_drive()
+    drive_service = get_drive_service()
     if not drive_service:
         st.error("❌ ไม่สามารถเชื่อมต่อ Google Drive ได้ (กรุณาเช็ค st.secrets['oauth'])")
     
@@ -516,19 +1170,8 @@ elif menu == "6. Add New Item (เพิ่มสินค้าใหม่)":
                 st.error("Google Drive ไม่พร้อมใช้งาน")
             else:
                 try:
-                    image_id = "-"
-                    image_link = "-"
-                    
-                    # 1. Upload Photo (ถ้ามีการถ่าย)
-                    if product_photo:
-                        with st.spinner("กำลังอัปโหลดรูปภาพ..."):
-                            # ตั้งชื่อไฟล์เป็น Barcode_Timestamp.jpg
-                            ts_file = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            filename = f"{new_barcode}_{ts_file}.jpg"
-                            
-                            image_id = upload_photo_to_drive(drive_service, product_photo, filename, PICTURE_FOLDER_ID)
-                            image_link = f"https://drive.google.com/open?id={image_id}"
-                            st.toast("✅ อัปโหลดรูปสำเร็จ")
+                    # 1. รูปจะอัปโหลดเบื้องหลังหลังบันทึกแถว ระหว่างนี้ Image_Link = UPLOADING
+                    image_link = "UPLOADING" if product_photo else "-"
                     
                     # 2. Save to Master Sheet
                     with st.spinner("กำลังบันทึกข้อมูล..."):
@@ -537,22 +1180,198 @@ elif menu == "6. Add New Item (เพิ่มสินค้าใหม่)":
                         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                         
                         # เช็คว่ามี Barcode ซ้ำไหม
-                        existing = ws_item_master.findall(str(new_barcode))
+                        item_index = get_item_index()
+                        item_index.sync()
+                        existing = item_index.rows_of(new_barcode)
                         if existing:
-                            st.warning(f"⚠️ Barcode {new_barcode} มีอยู่แล้วในระบบ (แถว {existing[0].row}) - จะทำการเพิ่มต่อท้าย")
+                            st.warning(f"⚠️ Barcode {new_barcode} มีอยู่แล้วในระบบ (แถว {existing[0]}) - จะทำการเพิ่มต่อท้าย")
                         
                         # เพิ่มข้อมูล (Append)
                         # สมมติลำดับคอลัมน์: Barcode | Description | Category | Zone | Rack | Level | ... | Image | ...
                         # เพื่อความชัวร์ ผมจะต่อท้ายเป็น List ไป
                         new_row = [str(new_barcode), new_name, new_category, "", "", "", image_link, new_replen, timestamp]
                         
-                        ws_item_master.append_row(new_row)
+                        backend.item_master.append_row(new_row)
+                        item_index.add_local(new_row)
                         
-                        st.success(f"บันทึกสินค้า **{new_name}** เรียบร้อย!")
-                        if image_id != "-":
-                            st.write(f"🔗 Link รูปภาพ: [Click Here]({image_link})")
+                    # 3. ส่งรูปเข้าคิวอัปโหลด (ย่อ/บีบอัด -> Drive -> เติม Image_Link ให้เอง)
+                    if product_photo:
+                        # ตั้งชื่อไฟล์เป็น Barcode_Timestamp.jpg
+                        ts_file = datetime.now().strftime("%Y%m%d_%H%M%S")
+                        filename = f"{new_barcode}_{ts_file}.jpg"
+                        get_photo_queue().submit(str(new_barcode), product_photo.getvalue(), filename)
+                        
+                    st.success(f"บันทึกสินค้า **{new_name}** เรียบร้อย!")
+                    if product_photo:
+                        st.info("📤 รูปกำลังอัปโหลดเบื้องหลัง ลิงก์จะถูกเติมใน Item_Master ให้อัตโนมัติ")
                             
                 except Exception as e:
 
                     st.error(f"เกิดข้อผิดพลาด: {e}")
 
+    # --- สถานะคิวอัปโหลดรูป ---
+    if drive_service and get_photo_queue().jobs:
+        st.divider()
+        st.subheader("📤 สถานะอัปโหลดรูป")
+        jobs = list(get_photo_queue().jobs.values())[::-1]
+        st.dataframe(pd.DataFrame([{
+            'Barcode': j['key'], 'ไฟล์': j['filename'], 'สถานะ': j['status'],
+            'Link': f"https://drive.google.com/open?id={j['file_id']}" if j['file_id'] else (j['error'] or ""),
+        } for j in jobs]), hide_index=True)
+        if get_photo_queue().pending():
+            st.button("🔄 รีเฟรชสถานะ")
+        if any(j['status'] == "failed" for j in jobs) and st.button("🔁 อัปโหลดรูปที่ล้มเหลวอีกครั้ง"):
+            st.toast(f"ส่งรูปเข้าคิวใหม่ {get_photo_queue().retry_failed()} รูป"); st.rerun()
+
+# ==========================================
+# 7. HISTORY (LOG ARCHIVE)
+# ==========================================
+elif menu == "7. History (ประวัติ)":
+    st.header("🗂️ 7. History")
+    from wms_archive import LOG_COLUMNS
+    archive = get_log_archive()
+    
+    with st.expander("📦 ย้าย Log เก่าออกจากชีต (Rollover)"):
+        st.write(f"เก็บในชีตไว้ {LOG_KEEP_MONTHS} เดือนล่าสุด เดือนที่เก่ากว่าจะถูกย้ายไปเป็นไฟล์ Parquet แล้วลบออกจากชีต")
+        if st.button("🚀 Rollover ตอนนี้"):
+            try:
+                res = archive.rollover(backend.log, get_log_writer(), keep_months=LOG_KEEP_MONTHS)
+                get_stock_store().note_local_write()
+            except Exception as e:
+                st.error(f"❌ Rollover ไม่สำเร็จ: {e}")
+            else:
+                st.success(f"ย้าย {res['archived']} แถว ({', '.join(res['partitions']) or '-'}) / เหลือในชีต {res['live_rows']} แถว ({res['ms']} ms)")
+    
+    parts = archive.partitions()
+    st.caption(f"Archive: {len(parts)} เดือน" + (f" ({parts[0][0]}-{parts[0][1]:02d} ถึง {parts[-1][0]}-{parts[-1][1]:02d})" if parts else ""))
+    if parts:
+        today = datetime.now().date()
+        first = datetime(parts[0][0], parts[0][1], 1).date()
+        c1, c2 = st.columns(2)
+        d_from = c1.date_input("ตั้งแต่", value=first)
+        d_to = c2.date_input("ถึง", value=today)
+        items = st.text_input("Item_ID (คั่นด้วย ,)")
+        actions = st.multiselect("Action", ["RECEIVE", "PUT_AWAY", "REPLENISH", "PICKING", "SHIP_OUT"])
+        cols = st.multiselect("Column", LOG_COLUMNS, default=LOG_COLUMNS)
+        if st.button("🔍 ค้นหา"):
+            hist = archive.query(d_from, d_to,
+                                 items=[i.strip() for i in items.split(",") if i.strip()] or None,
+                                 actions=actions or None, columns=cols or None)
+            st.write(f"พบ {len(hist)} แถว")
+            st.dataframe(hist, hide_index=True)
+            st.download_button("⬇️ CSV", hist.to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"history_{d_from}_{d_to}.csv", mime="text/csv")
+    else:
+        st.info("ยังไม่มีข้อมูลใน Archive")
+
+# ==========================================
+# 8. RECONCILE (ยอดจาก LOG vs CURRENT_STOCK)
+# ==========================================
+elif menu == "8. Reconcile (กระทบยอด)":
+    st.header("⚖️ 8. Reconcile")
+    from wms_reconcile import compare_stock
+    reconciler = get_reconciler()
+    meta = reconciler.checkpoint()
+    if meta:
+        src = "Current_Stock (ตั้งจุดเริ่ม)" if meta.get('source') == "stock" else f"log {meta['events']} แถว"
+        st.caption(f"Checkpoint: ยอดถึง {meta['watermark']} จาก {src} / {meta['rows']} บรรทัด")
+    else:
+        st.caption("ยังไม่มี Checkpoint (รอบแรกจะ replay log ทั้งหมดใน Archive + ชีต)")
+
+    full = st.checkbox("Replay log ทั้งหมดใหม่ (ไม่ใช้ Checkpoint)")
+    if st.button("⚖️ ตรวจยอดตอนนี้", type="primary"):
+        try:
+            ledger, info = reconciler.rebuild(backend.log, get_log_archive(), get_log_writer(), full=full)
+        except Exception as e:
+            st.error(f"❌ ตรวจยอดไม่สำเร็จ: {e}")
+        else:
+            st.session_state.recon = (compare_stock(ledger, get_stock_df()), info)
+
+    if st.session_state.get('recon'):
+        mismatch, info = st.session_state.recon
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Log ที่ replay", info['replayed'])
+        m2.metric("บรรทัดไม่ตรง", len(mismatch))
+        m3.metric("เวลา", f"{info['ms']} ms")
+        if info['skipped'] or info['unresolved']:
+            st.warning(f"ข้าม log ที่อ่านไม่ได้ {info['skipped']} แถว / ย้าย All ที่หายอดไม่ได้ {info['unresolved']} แถว")
+        if mismatch.empty:
+            st.success("✅ ยอดใน Current_Stock ตรงกับ Log ทุกบรรทัด")
+        else:
+            # Diff = Current_Stock - ยอดจาก Log (บวก = ในชีตมีมากกว่าที่ log บอก)
+            st.dataframe(mismatch, hide_index=True)
+            st.download_button("⬇️ CSV", mismatch.to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"reconcile_{datetime.now().strftime('%Y%m%d_%H%M')}.csv", mime="text/csv")
+
+    with st.expander("📌 ตั้ง Current_Stock ตอนนี้เป็นจุดเริ่ม (หลังนับสต็อกจริง)"):
+        st.write("ยอดใน Current_Stock ตอนนี้จะเป็นยอดตั้งต้น log ก่อนหน้านี้จะไม่ถูกนำมาเทียบอีก")
+        if st.checkbox("ยืนยันตั้งจุดเริ่มใหม่"):
+            if st.button("📌 ตั้งจุดเริ่ม"):
+                meta = reconciler.reset(get_stock_df(), get_log_writer())
+                st.session_state.recon = None
+                st.toast(f"ตั้งจุดเริ่มที่ {meta['watermark']} ({meta['rows']} บรรทัด)"); st.rerun()
+
+    # ค่าในชีตที่แปลงเป็น dtype ไม่ได้ (ตัวเลข / วันที่ / ช่องที่ห้ามว่าง) + หน่วยความจำก่อน / หลังแปลง
+    with st.expander("🧮 ตรวจชนิดข้อมูล (แถวเสีย / หน่วยความจำ)"):
+        get_stock_df()
+        item_index = get_item_index()
+        item_index.sync()
+        item_index.to_frame()
+        reports = [r for r in (get_stock_store().schema_report, item_index.schema_report, get_location_frame()[1]) if r]
+        st.dataframe(pd.DataFrame([{
+            "ตาราง": r['table'], "แถว": r['rows'], "แถวเสีย": r['bad']['Row'].nunique(), "Parse (ms)": r['parse_ms'],
+            "ก่อน (KB)": r['raw_bytes'] // 1024, "หลัง (KB)": r['typed_bytes'] // 1024,
+        } for r in reports]), hide_index=True)
+        for r in reports:
+            if not r['bad'].empty:
+                st.caption(f"⚠️ {r['table']}: ค่าที่อ่านไม่ได้ถูกนับเป็น 0 / ว่าง")
+                st.dataframe(r['bad'], hide_index=True)
+
+# ==========================================
+# 9. SLOTTING (ABC / ช่อง PICK ที่แนะนำ)
+# ==========================================
+elif menu == "9. Slotting (จัดตำแหน่ง)":
+    st.header("🧭 9. Slotting")
+    model = slotting_model(force=st.button("🔄 อ่าน Log ใหม่ตอนนี้"))
+    stats = model.stats
+    st.caption(f"หยิบย้อนหลัง {SLOTTING_WINDOW_DAYS} วัน / อ่าน Log ล่าสุด {stats['last_refresh'] or '-'} "
+               f"({stats['rows']} แถว, {stats['last_ms'] or 0} ms)"
+               + (f" / Error: {stats['last_error']}" if stats.get('last_error') else ""))
+    vel = model.velocity()
+    if vel.empty:
+        st.info("ยังไม่มีประวัติการหยิบใน Log")
+    else:
+        counts = vel['ABC'].value_counts()
+        c1, c2, c3 = st.columns(3)
+        c1.metric("A", int(counts.get("A", 0)))
+        c2.metric("B", int(counts.get("B", 0)))
+        c3.metric("C", int(counts.get("C", 0)))
+        st.subheader("📈 ความถี่การหยิบ (Hits = จำนวนบรรทัดหยิบ)")
+        st.dataframe(vel, hide_index=True)
+
+        st.subheader("📍 ช่อง PICK ที่แนะนำ")
+        plan = model.plan(get_stock_store(), get_location_table())
+        if plan.empty:
+            st.success("✅ สินค้าที่หยิบบ่อยอยู่ในช่อง PICK ที่ใกล้ที่สุดแล้ว")
+        else:
+            # Gain = จำนวนเที่ยว x ลำดับทางเดินที่สั้นลง (ยิ่งมากยิ่งควรย้ายก่อน)
+            st.dataframe(plan, hide_index=True)
+            st.download_button("⬇️ CSV", plan.to_csv(index=False).encode('utf-8-sig'),
+                               file_name=f"slotting_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv")
+
+# ==========================================
+# PROFILE (profile_startup)
+# ==========================================
+if PROFILE_STARTUP:
+    profile_mark("page")
+    rows, prev_t, prev_calls = [], _SCRIPT_T0, 0
+    for label, t, calls in _profile_marks:
+        rows.append({"step": label, "ms": round((t - prev_t) * 1000, 1),
+                     "api_calls": None if calls is None else calls - prev_calls})
+        prev_t, prev_calls = t, calls if calls is not None else prev_calls
+    with st.sidebar.expander("⏱️ Startup profile", expanded=True):
+        # api_calls แถว backend = call สะสมทั้ง process (rerun แรกคือ call ตอนต่อ Sheets) แถวถัดไปนับเฉพาะของ rerun นี้
+        st.caption(f"rerun นี้ {round((prev_t - _SCRIPT_T0) * 1000, 1)} ms")
+        st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+        heavy = ["PIL", "pyzbar", "googleapiclient", "pyarrow"]
+        st.caption("Library ที่โหลดแล้ว: " + (", ".join(m for m in heavy if m in sys.modules) or "-"))
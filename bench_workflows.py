@@ -0,0 +1,363 @@
+"""Benchmark งานหลักของแอป (Receive / Put Away / Replenishment / Picking / Add New Item) ผ่าน Streamlit AppTest
+
+รันกับ FakeBackend (Google Sheets ปลอมใน memory) ที่หน่วงเวลาต่อ API call ได้และนับจำนวน call ทุกครั้ง
+Drive ถูกแทนด้วย FakeDrive (หน่วงเวลาเท่ากัน) เพื่อวัดคิวอัปโหลดรูป
+
+    python bench_workflows.py                              # เทียบกับ bench_baseline.json (regress = exit 1)
+    python bench_workflows.py --sizes 100,1000,10000,50000 --latency-ms 50
+    python bench_workflows.py --update-baseline            # บันทึกผลรอบนี้เป็น baseline ใหม่
+
+ผลต่อ workflow: จำนวน API call (เฉลี่ยต่อรอบ), เวลา p50 / p95 (ms) และหน่วยความจำสูงสุด (tracemalloc, KB)
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "DNA_WMS_app_V1.py")
+BASELINE_PATH = os.path.join(APP_DIR, "bench_baseline.json")
+
+WORKFLOWS = ["receive", "put_away", "replenish", "picking", "add_item", "photo_upload"]
+
+# เกณฑ์ regress: ค่าที่เกิน baseline * (1 + tolerance)
+CALL_TOLERANCE = 0.1
+TIME_TOLERANCE = 1.0  # เวลาผ่าน AppTest แกว่งมาก เทียบหยาบ ๆ เพื่อจับงานที่ช้าลงเป็นเท่าตัว
+MEM_TOLERANCE = 0.5
+
+
+# ==========================================
+# Fake Google Drive
+# ==========================================
+class FakeDrive:
+    """เลียนแบบ service ที่ได้จาก googleapiclient.discovery.build('drive', 'v3') เฉพาะ files().create().execute()"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.bytes = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def files(self):
+        return self
+
+    def create(self, body=None, media_body=None, fields=None):
+        drive = self
+
+        class _Request:
+            def execute(self):
+                with drive._lock:
+                    drive.calls += 1
+                    if media_body is not None and hasattr(media_body, "getbytes"):
+                        drive.bytes += len(media_body.getbytes(0, media_body.size()))
+                    file_id = f"fake-file-{next(drive._ids)}"
+                if drive.latency:
+                    time.sleep(drive.latency)
+                return {"id": file_id}
+
+        return _Request()
+
+
+# ==========================================
+# ข้อมูลตั้งต้น
+# ==========================================
+def seed_backend(backend, n_stock, iterations):
+    """Current_Stock n_stock แถว + Master / Location ที่สอดคล้องกัน
+
+    - สินค้าแต่ละตัวมี PICK 1 ช่อง ที่เหลือเป็น RESERVE
+    - PICK ของสินค้าตัวแรก ๆ ต่ำกว่า Replen_Point (ให้ Replenishment มีงานทุกรอบ)
+    - DOCK_IN รอ Put Away รอบละแถว และ RESERVE ว่างไว้เป็นปลายทาง
+    """
+    from wms_storage import TABLE_ITEM_MASTER, TABLE_LOC_MASTER, TABLE_STOCK
+
+    n_items = max(iterations + 5, n_stock // 10)
+    rounds = iterations + 2  # warm-up + วัดเวลา + วัดหน่วยความจำ
+    ts = "2024-01-01 00:00:00"
+    items = [f"IT{i:06d}" for i in range(n_items)]
+    stock, locs = [], []
+    for i, item in enumerate(items[:n_stock]):
+        qty = 2 if i < rounds else 100
+        stock.append([item, f"Item {i}", qty, f"P-{i:06d}", "Available", "-", 5, ts])
+        locs.append([f"P-{i:06d}", "A", str(i // 20), str(i % 5), "", "PICK"])
+    for k in range(len(stock), n_stock):
+        item = items[k % n_items]
+        stock.append([item, f"Item {k % n_items}", 50, f"R-{k:06d}", "Available", "-", 5, ts])
+        locs.append([f"R-{k:06d}", "B", str(k // 20), str(k % 5), "", "RESERVE"])
+    for i in range(rounds):
+        stock.append([items[i], f"Item {i}", 10, "DOCK_IN", "Pending Putaway", f"C{i}", 5, ts])
+        locs.append([f"RE-{i:04d}", "C", str(i), "1", "", "RESERVE"])
+    locs.append(["STG-01", "S", "1", "1", "", "STAGING"])
+
+    def fill(sh, title, rows):
+        ws = sh._sheets[title]
+        ws.rows.extend(ws._norm(r) for r in rows)
+
+    fill(backend.fake_wms, TABLE_STOCK, stock)
+    fill(backend.fake_master, TABLE_ITEM_MASTER,
+         [[item, f"Item {i}", "General", "", "", "", "-", 5, ts] for i, item in enumerate(items)])
+    fill(backend.fake_master, TABLE_LOC_MASTER, locs)
+    return {"items": items}
+
+
+def install_fakes(n_stock, iterations, latency):
+    """ให้แอปใช้ FakeBackend ที่ seed แล้ว + FakeDrive คืนค่า (holder ของ backend, drive)"""
+    import googleapiclient.discovery
+    import streamlit as st
+    import wms_storage
+
+    holder = {}
+    base = wms_storage.FakeBackend if not hasattr(wms_storage.FakeBackend, "_bench_base") else \
+        wms_storage.FakeBackend._bench_base
+
+    class SeededBackend(base):
+        _bench_base = base
+
+        def __init__(self, latency=0.0, governor=None):
+            super().__init__(latency, governor)
+            holder["seed"] = seed_backend(self, n_stock, iterations)
+            holder["backend"] = self
+
+    drive = FakeDrive(latency)
+    wms_storage.FakeBackend = SeededBackend
+    googleapiclient.discovery.build = lambda *a, **k: drive
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    return holder, drive
+
+
+# ==========================================
+# Workflows (แต่ละฟังก์ชัน = 1 รอบของงาน ผ่าน UI จริง)
+# ==========================================
+def _menu(at, prefix):
+    radio = at.sidebar.radio[0]
+    radio.set_value([o for o in radio.options if o.startswith(prefix)][0]).run()
+
+
+def _check(at, name):
+    if at.exception:
+        raise RuntimeError(f"{name}: {at.exception[0].message}")
+    errors = [e.value for e in at.error if "ต้องเติม" not in e.value]
+    if errors:
+        raise RuntimeError(f"{name}: {errors[0]}")
+
+
+def wf_receive(at, i, ctx):
+    _menu(at, "1")
+    at.text_input(key=f"mi_{at.session_state['cam_reset_id']}").input(ctx["items"][-1 - i]).run()
+    at.text_input(key="cont_input_new").input(f"BENCH-{i}")
+    at.number_input[0].set_value(5)
+    [b for b in at.button if "Save" in b.label][0].click().run()
+
+
+def wf_put_away(at, i, ctx):
+    _menu(at, "2")
+    at.text_input(key=f"pm_{at.session_state['pa_r']}").input(ctx["items"][i]).run()
+    at.text_input(key=f"lm_{at.session_state['pa_r']}").input(f"RE-{i:04d}").run()
+    [b for b in at.button if b.label.startswith("Move to")][0].click().run()
+
+
+def wf_replenish(at, i, ctx):
+    _menu(at, "3")
+    # แท็บ "ทีละรายการ": รายการแรกในคิว เติมจาก Reserve ช่องแรก ให้พ้น Replen_Point
+    at.number_input[0].set_value(10)
+    [b for b in at.button if "Confirm" in b.label][0].click().run()
+
+
+def wf_picking(at, i, ctx):
+    _menu(at, "4")
+    at.selectbox(key=f"pks_{at.session_state['pk_r']}").set_value(ctx["items"][-1 - i]).run()
+    at.number_input[-1].set_value(1)
+    [b for b in at.button if b.label == "Pick"][0].click().run()
+
+
+def wf_add_item(at, i, ctx):
+    _menu(at, "6")
+    at.text_input(key="new_item_barcode").input(f"NEW{i:06d}")
+    at.text_input(key="new_item_name").input(f"Bench item {i}")
+    at.text_input(key="new_item_cat").input("Bench")
+    [b for b in at.button if "บันทึกสินค้าใหม่" in b.label][0].click().run()
+
+
+def _photo_bytes():
+    from PIL import Image
+
+    img = Image.effect_noise((3000, 2000), 64).convert("RGB")
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92)
+    return out.getvalue()
+
+
+def run_photo_upload(drive, iterations):
+    """คิวอัปโหลดรูป: submit -> ย่อ/บีบอัด -> FakeDrive จนเสร็จ (รูปต่างกันทุกรอบ ไม่โดน dedupe)"""
+    from googleapiclient.http import MediaIoBaseUpload
+    from wms_photos import PhotoUploadQueue
+
+    def upload(data, filename):
+        media = MediaIoBaseUpload(io.BytesIO(data), mimetype="image/jpeg", resumable=False)
+        return drive.files().create(body={"name": filename}, media_body=media, fields="id").execute()["id"]
+
+    queue = PhotoUploadQueue(upload, workers=2)
+    base = _photo_bytes()
+    samples = []
+    for i in range(iterations + 1):
+        data = base + str(i).encode()
+        calls0 = drive.calls
+        traced = i == iterations
+        if traced:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        job = queue.submit(f"P{i}", data, f"P{i}.jpg")
+        while job["status"] in ("queued", "uploading"):
+            time.sleep(0.002)
+        ms = (time.perf_counter() - t0) * 1000
+        if job["status"] != "done":
+            raise RuntimeError(f"photo_upload: {job['error']}")
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            samples.append((ms, drive.calls - calls0))
+    return _summary(samples, peak)
+
+
+def _summary(samples, peak):
+    times = sorted(ms for ms, _ in samples)
+    p95 = times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))]
+    return {
+        "calls": round(statistics.mean(c for _, c in samples), 1),
+        "p50_ms": round(statistics.median(times), 1),
+        "p95_ms": round(p95, 1),
+        "peak_kb": round(peak / 1024),
+    }
+
+
+def run_size(n_stock, iterations, latency, workflows):
+    from streamlit.testing.v1 import AppTest
+
+    holder, drive = install_fakes(n_stock, iterations, latency)
+    at = AppTest.from_file(APP_FILE, default_timeout=600)
+    at.secrets["oauth"] = {"refresh_token": "bench", "client_id": "bench", "client_secret": "bench"}
+    t0 = time.perf_counter()
+    at.run()
+    _check(at, "startup")
+    results = {"startup": {"calls": sum(holder["backend"].calls.values()),
+                           "p50_ms": round((time.perf_counter() - t0) * 1000, 1)}}
+    ctx = holder["seed"]
+    fns = {"receive": wf_receive, "put_away": wf_put_away, "replenish": wf_replenish,
+           "picking": wf_picking, "add_item": wf_add_item}
+    for name in workflows:
+        if name == "photo_upload":
+            results[name] = run_photo_upload(drive, iterations)
+            continue
+        samples, peak = [], 0
+        # รอบแรก warm-up (โหลด cache ของหน้านั้นครั้งแรก) ไม่นับ
+        # รอบสุดท้ายวัดหน่วยความจำอย่างเดียว (tracemalloc ทำให้เวลาช้าลงมาก)
+        for i in range(iterations + 2):
+            calls0 = sum(holder["backend"].calls.values())
+            traced = i == iterations + 1
+            if traced:
+                tracemalloc.start()
+            t = time.perf_counter()
+            fns[name](at, i, ctx)
+            ms = (time.perf_counter() - t) * 1000
+            if traced:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            _check(at, name)
+            if 0 < i and not traced:
+                samples.append((ms, sum(holder["backend"].calls.values()) - calls0))
+        results[name] = _summary(samples, peak)
+    return results
+
+
+# ==========================================
+# Baseline
+# ==========================================
+def compare(report, baseline):
+    """คืนค่ารายการ regress [(size, workflow, metric, now, base)]"""
+    regressions = []
+    limits = {"calls": CALL_TOLERANCE, "p95_ms": TIME_TOLERANCE, "peak_kb": MEM_TOLERANCE}
+    for size, flows in report["results"].items():
+        for name, now in flows.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            for metric, tol in limits.items():
+                if metric in now and metric in base and now[metric] > base[metric] * (1 + tol) + 1:
+                    regressions.append((size, name, metric, now[metric], base[metric]))
+    return regressions
+
+
+def print_report(report):
+    print(f"latency {report['latency_ms']} ms/call, {report['iterations']} รอบต่อ workflow")
+    print(f"{'rows':>7} {'workflow':<13} {'calls':>7} {'p50 ms':>9} {'p95 ms':>9} {'peak KB':>9}")
+    for size, flows in report["results"].items():
+        for name, r in flows.items():
+            print(f"{size:>7} {name:<13} {r['calls']:>7} {r['p50_ms']:>9} {r.get('p95_ms', ''):>9} "
+                  f"{r.get('peak_kb', ''):>9}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="100,1000", help="จำนวนแถว Current_Stock คั่นด้วย , (เช่น 100,1000,10000,50000)")
+    ap.add_argument("--iterations", type=int, default=5, help="จำนวนรอบต่อ workflow")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="หน่วงเวลาต่อ API call (Sheets / Drive)")
+    ap.add_argument("--workflows", default=",".join(WORKFLOWS))
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--json", help="เขียนผลเป็น JSON ลงไฟล์นี้ด้วย")
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="wms-bench-")
+    os.environ.update({
+        "WMS_STORAGE_BACKEND": "fake",
+        "WMS_FAKE_LATENCY_MS": str(args.latency_ms),
+        "WMS_LOG_JOURNAL_PATH": os.path.join(tmp, "journal.db"),
+        "WMS_PHOTO_JOURNAL_PATH": os.path.join(tmp, "photos.db"),
+        "WMS_LOG_ARCHIVE_DIR": os.path.join(tmp, "archive"),
+        # ไม่ให้ log ถูกส่งขึ้นชีตระหว่างวัด (ไม่งั้นจำนวน call ขึ้นกับจังหวะเวลา)
+        "WMS_LOG_FLUSH_SEC": "3600",
+        "WMS_LOG_FLUSH_SIZE": "1000000",
+    })
+    sys.path.insert(0, APP_DIR)
+    workflows = [w for w in args.workflows.split(",") if w]
+    report = {"latency_ms": args.latency_ms, "iterations": args.iterations, "results": {}}
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        report["results"][str(size)] = run_size(size, args.iterations, args.latency_ms / 1000, workflows)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"บันทึก baseline: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("ไม่มี baseline (รันด้วย --update-baseline ก่อน)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("latency_ms") != args.latency_ms:
+        print(f"⚠️ baseline วัดที่ latency {baseline.get('latency_ms')} ms ไม่เทียบเวลา")
+        for flows in baseline.get("results", {}).values():
+            for r in flows.values():
+                r.pop("p95_ms", None)
+    regressions = compare(report, baseline)
+    for size, name, metric, now, base in regressions:
+        print(f"❌ REGRESSION {size} rows / {name}: {metric} {now} > baseline {base}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
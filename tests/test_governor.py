@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+import wms_governor
+from wms_governor import QuotaExceeded, QuotaGovernor, TokenBucket
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.code = status
+
+
+class FakeTime:
+    """แทน module time ใน wms_governor: sleep() เลื่อนนาฬิกาแทนการรอจริง"""
+
+    strftime = staticmethod(time.strftime)
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, sec):
+        self.sleeps.append(sec)
+        self.now += sec
+
+
+class FakeRandom:
+    def __init__(self):
+        self.calls = []
+
+    def uniform(self, lo, hi):
+        self.calls.append((lo, hi))
+        return hi
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(wms_governor, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def jitter(monkeypatch):
+    fake = FakeRandom()
+    monkeypatch.setattr(wms_governor, "random", fake)
+    return fake
+
+
+def failing(*statuses, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(statuses):
+            raise HttpError(statuses[len(calls) - 1])
+        return result
+
+    return fn, calls
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(per_min=60, burst=2)
+    assert bucket.acquire() == 0 and bucket.acquire() == 0
+    # หมด burst: รอ 1 token = 1 วินาที (60 ต่อนาที)
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert clock.sleeps == [pytest.approx(1.0)]
+    clock.now += 10
+    assert bucket.acquire() == 0
+    assert bucket.tokens == pytest.approx(1.0)  # เติมได้ไม่เกิน burst
+
+
+def test_429_retries_with_jittered_backoff(clock, jitter):
+    gov = QuotaGovernor(max_retries=5, base_delay=1.0, max_delay=3.0)
+    fn, calls = failing(429, 429, 429)
+    assert gov.call("read", fn) == "ok"
+    assert len(calls) == 4
+    # full jitter: uniform(0, min(max_delay, base_delay * 2^attempt))
+    assert jitter.calls == [(0, 2.0), (0, 3.0), (0, 3.0)]
+    stat = gov.snapshot()["read"]
+    assert (stat["throttled"], stat["retries"], stat["errors"]) == (3, 3, 0)
+
+
+def test_quota_exceeded_after_max_retries(clock, jitter):
+    gov = QuotaGovernor(max_retries=2)
+    fn, calls = failing(429, 429, 429, 429)
+    with pytest.raises(QuotaExceeded):
+        gov.call("write", fn)
+    assert len(calls) == 3
+    assert gov.snapshot()["write"]["errors"] == 1
+
+
+def test_write_5xx_is_not_retried(clock, jitter):
+    gov = QuotaGovernor()
+    fn, calls = failing(503)
+    with pytest.raises(HttpError):
+        gov.call("write", fn)
+    assert len(calls) == 1 and jitter.calls == []
+    fn, calls = failing(503)
+    assert gov.call("read", fn) == "ok"  # read retry 5xx ได้
+    assert len(calls) == 2
+
+
+def test_same_key_reads_are_coalesced():
+    gov = QuotaGovernor()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def read():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return [["header"]]
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(gov.call("read", read, key="k")))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(gov.call("read", read, key="k")))
+    follower.start()
+    deadline = time.monotonic() + 5
+    while gov.stats["read"]["coalesced"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(calls) == 1
+    assert results == [[["header"]], [["header"]]]
+    assert gov.snapshot()["read"]["coalesced"] == 1
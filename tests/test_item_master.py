@@ -0,0 +1,67 @@
+from wms_master import ItemMasterIndex
+from wms_storage import FakeBackend
+
+
+def seeded():
+    backend = FakeBackend()
+    backend.item_master.append_rows([["B1", "Apple", "Fruit", "", "", "", "-", "5", ""],
+                                     ["B2", "Banana", "Fruit", "", "", "", "-", "5", ""]])
+    return backend.item_master
+
+
+def test_local_write_skips_only_its_own_revision():
+    table = seeded()
+    index = ItemMasterIndex(table, poll_sec=0)
+    index.sync()
+    new_row = ["B3", "Cherry", "Fruit", "", "", "", "-", "5", ""]
+    table.append_row(new_row)
+    index.add_local(new_row)
+    api_calls = index.api_calls
+    assert not index.sync()
+    assert index.api_calls == api_calls + 1  # เช็คแค่ revision ไม่อ่านทั้งชีต
+    # เครื่องอื่นแก้ชีตหลังการเขียนของเรา: revision ไม่ใช่ของเรา ต้องอ่านใหม่
+    table.update_cells([(2, 2, "Apricot")])
+    assert index.sync()
+    assert index.get("B1")["Description"] == "Apricot"
+    assert [r["Barcode"] for r in index.search_prefix("c")] == ["B3"]
+
+
+def test_external_edit_right_after_local_write_is_not_skipped():
+    table = seeded()
+    index = ItemMasterIndex(table, poll_sec=0)
+    index.sync()
+    table.update_cells([(3, 7, "link")])
+    index.update_local(3, "Image_Link", "link")
+    table.update_cells([(3, 2, "Blueberry")])
+    assert index.sync()
+    assert index.get("B2")["Description"] == "Blueberry"
+
+
+def test_external_edit_is_picked_up_by_revision_poll():
+    table = seeded()
+    index = ItemMasterIndex(table, poll_sec=0)
+    index.sync()
+    table.update_cells([(3, 2, "Blueberry")])
+    assert index.sync()
+    assert index.get("B2")["Description"] == "Blueberry"
+
+
+def test_category_index_follows_appends_and_edits():
+    table = seeded()
+    index = ItemMasterIndex(table, poll_sec=0)
+    index.sync()
+    assert [r["Barcode"] for r in index.in_category("Fruit")] == ["B1", "B2"]
+    new_row = ["B3", "Carrot", "Veg", "", "", "", "-", "5", ""]
+    table.append_row(new_row)
+    index.add_local(new_row)
+    assert index.categories() == ["Fruit", "Veg"]
+    assert [r["Barcode"] for r in index.in_category("Veg")] == ["B3"]
+    table.update_cells([(3, 3, "Snack")])
+    index.update_local(3, "Category", "Snack")
+    assert [r["Barcode"] for r in index.in_category("Fruit")] == ["B1"]
+    assert [r["Barcode"] for r in index.in_category("Snack")] == ["B2"]
+    # แก้จากเครื่องอื่น: อ่านใหม่ตาม revision แล้ว index รองตามมาด้วย
+    table.update_cells([(2, 3, "Veg")])
+    assert index.sync()
+    assert [r["Barcode"] for r in index.in_category("Veg")] == ["B1", "B3"]
+    assert index.in_category("Fruit") == []
@@ -0,0 +1,122 @@
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+from wms_live import LiveScanner, load_frames, replay
+
+# EAN-13: ชุด bit ของตัวเลขแต่ละตัว (L / G / R) และ parity ของหลักแรก
+L_CODES = ["0001101", "0011001", "0010011", "0111101", "0100011", "0110001", "0101111", "0111011", "0110111", "0001011"]
+G_CODES = ["0100111", "0110011", "0011011", "0100001", "0011101", "0111001", "0000101", "0010001", "0001001", "0010111"]
+R_CODES = ["1110010", "1100110", "1101100", "1000010", "1011100", "1001110", "1010000", "1000100", "1001000", "1110100"]
+PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG", "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+
+CODE_A, CODE_B = "5901234123457", "4006381333931"
+# pixel (0, 0) ของเฟรมที่สร้าง = เลขประจำ code ใช้กับ decoder ปลอม (ไม่ต้องมี zbar)
+MARKS = {1: CODE_A, 2: CODE_B}
+
+
+def ean13_frame(code, mark, module=3, height=120):
+    digits = [int(c) for c in code]
+    bits = "101"
+    for d, p in zip(digits[1:7], PARITY[digits[0]]):
+        bits += (L_CODES if p == "L" else G_CODES)[d]
+    bits += "01010"
+    for d in digits[7:]:
+        bits += R_CODES[d]
+    bits += "101"
+    quiet = 12 * module
+    img = Image.new("L", (len(bits) * module + 2 * quiet, height + 40), 255)
+    draw = ImageDraw.Draw(img)
+    for i, b in enumerate(bits):
+        if b == "1":
+            x = quiet + i * module
+            draw.rectangle([x, 20, x + module - 1, 20 + height], fill=0)
+    img.putpixel((0, 0), mark)
+    return img
+
+
+def blank_frame():
+    return Image.new("L", (300, 160), 255)
+
+
+def fake_decode(frame):
+    return {"code": MARKS.get(frame.getpixel((0, 0)))}
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    """บันทึกเฟรมลงโฟลเดอร์ (แบบที่ `python wms_live.py <โฟลเดอร์>` ใช้): A 8 เฟรม / ว่าง 4 / B 8 / A 8"""
+    frames = [ean13_frame(CODE_A, 1)] * 8 + [blank_frame()] * 4 + [ean13_frame(CODE_B, 2)] * 8 \
+        + [ean13_frame(CODE_A, 1)] * 8
+    for i, f in enumerate(frames):
+        f.save(tmp_path / f"frame_{i:03d}.png")
+    return tmp_path
+
+
+def test_load_frames_from_folder_and_gif(recorded, tmp_path):
+    frames = list(load_frames(str(recorded)))
+    assert len(frames) == 28 and frames[0].mode == "L"
+    gif = tmp_path / "clip.gif"
+    # GIF รวมเฟรมที่เหมือนกันติดกันเป็นเฟรมเดียว ใช้เฟรมที่ต่างกัน: A / ว่าง / B
+    frames[0].save(gif, save_all=True, append_images=[frames[8], frames[12]])
+    assert [fake_decode(f)["code"] for f in load_frames(str(gif))] == [CODE_A, None, CODE_B]
+
+
+def test_replay_decodes_and_dedupes(recorded):
+    scanner = LiveScanner(fake_decode, max_fps=0, dedupe_sec=60)
+    codes = replay(scanner, load_frames(str(recorded)), fps=50)
+    # A ที่กลับมาอีกครั้งยังอยู่ในช่วง dedupe ไม่ถูกส่งซ้ำ
+    assert codes == [CODE_A, CODE_B]
+    stats = scanner.stats
+    assert stats["frames"] == 28
+    assert stats["decoded"] == 2
+    assert stats["duplicates"] > 0
+
+
+def test_dedupe_window_expires():
+    scanner = LiveScanner(fake_decode, max_fps=0, dedupe_sec=0.05)
+    frames = [ean13_frame(CODE_A, 1)] * 3 + [blank_frame()] * 10 + [ean13_frame(CODE_A, 1)] * 3
+    assert replay(scanner, frames, fps=50) == [CODE_A, CODE_A]
+
+
+def test_fps_limit_samples_latest_frame():
+    calls = []
+
+    def slow_count(frame):
+        calls.append(time.monotonic())
+        return fake_decode(frame)
+
+    scanner = LiveScanner(slow_count, max_fps=10, dedupe_sec=60)
+    t0 = time.monotonic()
+    codes = replay(scanner, [ean13_frame(CODE_A, 1)] * 60, fps=100)
+    elapsed = time.monotonic() - t0
+    assert codes == [CODE_A]
+    assert scanner.stats["frames"] == 60
+    # 10 เฟรม/วินาที: เฟรมที่มาระหว่างรอถูกแทนที่ ไม่ decode ทุกเฟรม
+    assert 2 <= scanner.stats["sampled"] <= elapsed * 10 + 2
+    gaps = [b - a for a, b in zip(calls, calls[1:])]
+    assert all(g >= 0.1 - 0.01 for g in gaps)
+
+
+def test_decode_errors_do_not_stop_worker():
+    seen = []
+
+    def flaky(frame):
+        seen.append(frame)
+        if len(seen) == 1:
+            raise ValueError("bad frame")
+        return fake_decode(frame)
+
+    scanner = LiveScanner(flaky, max_fps=0, dedupe_sec=60)
+    frames = [blank_frame()] + [ean13_frame(CODE_B, 2)] * 5
+    assert replay(scanner, frames, fps=50) == [CODE_B]
+    assert scanner.stats["errors"] == 1
+
+
+def test_real_decoder_reads_recorded_frames(recorded):
+    pytest.importorskip("pyzbar.pyzbar", reason="ต้องมี zbar", exc_type=ImportError)
+    from wms_scan import BarcodeDecoder
+
+    scanner = LiveScanner(BarcodeDecoder().decode_frame, max_fps=0, dedupe_sec=60)
+    assert replay(scanner, load_frames(str(recorded)), fps=30) == [CODE_A, CODE_B]
@@ -0,0 +1,112 @@
+import pytest
+
+from wms_log import TransactionLogWriter
+from wms_storage import FakeBackend, SqliteBackend
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.code = status
+
+
+@pytest.fixture(params=["fake", "sqlite"])
+def log_table(request, tmp_path):
+    backend = FakeBackend() if request.param == "fake" else SqliteBackend(str(tmp_path / "wms.db"))
+    return backend.log
+
+
+def make_writer(tmp_path, append_fn, table):
+    return TransactionLogWriter(append_fn, str(tmp_path / "journal.db"), flush_size=10_000, flush_sec=3600,
+                                tail_fn=table.tail)
+
+
+def rows_of(table):
+    return table.get_all_values()[1:]
+
+
+ROWS = [["2024-01-01 10:00:00", "PICKING", "I1", 2, "P-1", "STG-01", "u"],
+        ["2024-01-01 10:00:01", "PICKING", "I2", 1, "P-2", "STG-01", "u"]]
+
+
+def test_error_after_write_does_not_duplicate(tmp_path, log_table):
+    # 5xx หลังเขียนลงชีตไปแล้ว: รอบถัดไปต้องเห็นว่าอยู่ในชีตแล้ว ไม่ส่งซ้ำ
+    calls = []
+
+    def append(rows):
+        calls.append(rows)
+        log_table.append_rows(rows)
+        if len(calls) == 1:
+            raise HttpError(503)
+
+    w = make_writer(tmp_path, append, log_table)
+    w.write_many(ROWS)
+    with pytest.raises(HttpError):
+        w.flush()
+    assert w.pending_count() == 2
+    assert w.flush()
+    assert len(calls) == 1
+    assert w.stats["deduped"] == 2
+    assert [r[2] for r in rows_of(log_table)] == ["I1", "I2"]
+    w.close()
+
+
+def test_error_before_write_is_resent(tmp_path, log_table):
+    # 5xx ที่ยังไม่ได้เขียน: เช็คท้ายชีตแล้วไม่เจอ -> ส่งใหม่ครบ
+    calls = []
+
+    def append(rows):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise HttpError(503)
+        log_table.append_rows(rows)
+
+    w = make_writer(tmp_path, append, log_table)
+    w.write_many(ROWS)
+    with pytest.raises(HttpError):
+        w.flush()
+    assert w.flush()
+    assert len(calls) == 2
+    assert w.stats["deduped"] == 0
+    assert [r[2] for r in rows_of(log_table)] == ["I1", "I2"]
+    w.close()
+
+
+def test_identical_rows_are_counted(tmp_path, log_table):
+    # แถวเดิมที่อยู่ในชีตก่อนแล้ว 1 แถว + batch มีแถวเดียวกัน 2 แถวที่ยังไม่ได้เขียน -> ต้องส่ง 1 แถว
+    log_table.append_rows([ROWS[0]])
+    calls = []
+
+    def append(rows):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise HttpError(504)
+        log_table.append_rows(rows)
+
+    w = make_writer(tmp_path, append, log_table)
+    w.write_many([ROWS[0], ROWS[0]])
+    with pytest.raises(HttpError):
+        w.flush()
+    assert w.flush()
+    assert len(rows_of(log_table)) == 2
+    w.close()
+
+
+def test_429_is_resent_without_tail_check(tmp_path, log_table):
+    calls, tails = [], []
+
+    def append(rows):
+        calls.append(rows)
+        if len(calls) == 1:
+            raise HttpError(429)
+        log_table.append_rows(rows)
+
+    w = TransactionLogWriter(append, str(tmp_path / "journal.db"), flush_size=10_000, flush_sec=3600,
+                             tail_fn=lambda n: tails.append(n) or log_table.tail(n))
+    w.write_many(ROWS)
+    with pytest.raises(HttpError):
+        w.flush()
+    assert w.flush()
+    assert tails == []
+    assert len(rows_of(log_table)) == 2
+    w.close()
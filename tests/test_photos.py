@@ -0,0 +1,96 @@
+import io
+import time
+
+from PIL import Image
+
+from wms_photos import PhotoUploadQueue
+
+
+def photo(seed=0):
+    out = io.BytesIO()
+    Image.new("RGB", (64, 48), (seed, 100, 200)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def wait(queue, timeout=5.0):
+    end = time.monotonic() + timeout
+    while queue.pending() and time.monotonic() < end:
+        time.sleep(0.01)
+    assert not queue.pending()
+
+
+class FlakyDrive:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def upload(self, data, filename):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("drive down")
+        return f"id-{filename}"
+
+
+def make_queue(tmp_path, drive, done, failed, **kw):
+    return PhotoUploadQueue(drive.upload, on_done=lambda k, f: done.append((k, f)),
+                            on_failed=lambda k, h: failed.append((k, h)),
+                            journal_path=str(tmp_path / "photos.db"), retry_sec=0.01, **kw)
+
+
+def test_retry_then_done_clears_journal(tmp_path):
+    drive, done, failed = FlakyDrive(failures=2), [], []
+    q = make_queue(tmp_path, drive, done, failed, max_attempts=4)
+    job = q.submit("B1", photo(), "B1.jpg")
+    wait(q)
+    assert job["status"] == "done" and job["attempts"] == 2
+    assert done == [("B1", "id-B1.jpg")] and failed == []
+    assert q.stats["retried"] == 2 and q.stats["uploaded"] == 1
+    assert q._journal() == []
+
+
+def test_exhausted_marks_failed_and_survives_restart(tmp_path):
+    drive, done, failed = FlakyDrive(failures=10), [], []
+    q = make_queue(tmp_path, drive, done, failed, max_attempts=2)
+    job = q.submit("B2", photo(1), "B2.jpg")
+    wait(q)
+    assert job["status"] == "failed"
+    assert failed == [("B2", job["hash"])]
+    assert [r[0] for r in q._journal()] == ["B2"]
+
+    # เปิดแอปใหม่: journal เดิม ส่งต่อได้
+    drive.failures = 0
+    q2 = make_queue(tmp_path, drive, done, failed)
+    assert q2.resume() == 1
+    wait(q2)
+    assert done == [("B2", "id-B2.jpg")]
+    assert q2._journal() == []
+
+
+def test_retry_failed(tmp_path):
+    drive, done, failed = FlakyDrive(failures=1), [], []
+    q = make_queue(tmp_path, drive, done, failed, max_attempts=1)
+    q.submit("B3", photo(2), "B3.jpg")
+    wait(q)
+    assert q.jobs["B3"]["status"] == "failed"
+    assert q.retry_failed() == 1
+    wait(q)
+    assert q.jobs["B3"]["status"] == "done"
+    assert done == [("B3", "id-B3.jpg")]
+
+
+def test_on_done_failure_reuses_uploaded_file(tmp_path):
+    # อัปโหลดสำเร็จแต่เขียนชีตล้ม: รอบถัดไปใช้ file_id เดิม ไม่อัปโหลดซ้ำ
+    drive, done, failed = FlakyDrive(failures=0), [], []
+    calls = []
+
+    def on_done(key, file_id):
+        calls.append(file_id)
+        if len(calls) == 1:
+            raise ConnectionError("sheet down")
+        done.append((key, file_id))
+
+    q = PhotoUploadQueue(drive.upload, on_done=on_done, journal_path=str(tmp_path / "p.db"), retry_sec=0.01)
+    q.submit("B4", photo(3), "B4.jpg")
+    wait(q)
+    assert drive.calls == 1
+    assert done == [("B4", "id-B4.jpg")]
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pandas as pd
+
+from wms_reconcile import LOG_COLUMNS, StockReconciler, compare_stock, replay
+from wms_storage import FakeBackend
+
+NOW = datetime(2024, 1, 2, 12, 0, 0)
+
+
+def ev(*rows):
+    return pd.DataFrame([list(r) for r in rows], columns=LOG_COLUMNS)
+
+
+def as_dict(ledger):
+    return {(r.Item_ID, r.Location): r.Qty for r in ledger.itertuples()}
+
+
+def log_table(*rows):
+    table = FakeBackend().log
+    table.append_rows([list(r) for r in rows])
+    return table
+
+
+def test_move_picking_and_ship_out_signs():
+    ledger, info = replay(ev(
+        ("2024-01-01 08:00:00", "RECEIVE", "A", "10", "-", "DOCK_IN", "u"),
+        ("2024-01-01 08:01:00", "PUT_AWAY", "A", "10", "DOCK_IN", "R-1", "u"),
+        ("2024-01-01 08:02:00", "REPLENISH", "A", "4", "R-1", "P-1", "u"),
+        ("2024-01-01 08:03:00", "PICKING", "A", "3", "P-1", "STG-01", "u"),
+        ("2024-01-01 08:04:00", "PICKING", "A", "1", "P-1", "OUT", "u"),
+        ("2024-01-01 08:05:00", "SHIP_OUT", "A", "2", "STG-01", "SHP-1", "u"),
+    ))
+    # ย้าย = ตัดต้นทาง + เพิ่มปลายทาง / PICKING ไป OUT = ออกจากคลัง / SHIP_OUT ตัดอย่างเดียว
+    assert as_dict(ledger) == {("A", "R-1"): 6, ("A", "STG-01"): 1}
+    assert info == {"events": 6, "skipped": 0, "unresolved": 0}
+
+
+def test_unknown_action_and_bad_qty_are_skipped():
+    ledger, info = replay(ev(
+        ("2024-01-01 08:00:00", "RECEIVE", "A", "5", "-", "DOCK_IN", "u"),
+        ("2024-01-01 08:01:00", "FOO", "A", "1", "DOCK_IN", "X", "u"),
+        ("2024-01-01 08:02:00", "PICKING", "A", "abc", "DOCK_IN", "STG-01", "u"),
+    ))
+    assert as_dict(ledger) == {("A", "DOCK_IN"): 5}
+    assert info["skipped"] == 2
+
+
+def test_put_away_all_moves_the_running_balance():
+    ledger, info = replay(ev(
+        ("2024-01-01 08:00:00", "RECEIVE", "A", "10", "-", "DOCK_IN", "u"),
+        ("2024-01-01 08:01:00", "PUT_AWAY", "A", "All", "DOCK_IN", "R-1", "u"),
+        ("2024-01-01 08:02:00", "RECEIVE", "A", "3", "-", "DOCK_IN", "u"),
+        ("2024-01-01 08:03:00", "PUT_AWAY", "A", "All", "DOCK_IN", "R-2", "u"),
+        ("2024-01-01 08:04:00", "PUT_AWAY", "A", "All", "R-1", "P-1", "u"),
+    ))
+    assert as_dict(ledger) == {("A", "R-2"): 3, ("A", "P-1"): 10}
+    assert info["unresolved"] == 0
+
+
+def test_rebuild_from_empty_checkpoint(tmp_path):
+    table = log_table(
+        ("2024-01-01 08:00:00", "RECEIVE", "A", "10", "-", "DOCK_IN", "u"),
+        ("2024-01-01 08:01:00", "PUT_AWAY", "A", "10", "DOCK_IN", "R-1", "u"),
+        ("2024-01-02 11:59:00", "REPLENISH", "A", "4", "R-1", "P-1", "u"),
+    )
+    rec = StockReconciler(str(tmp_path), lag_sec=600)
+    assert rec.checkpoint() is None
+    ledger, info = rec.rebuild(table, now=NOW)
+    assert as_dict(ledger) == {("A", "R-1"): 6, ("A", "P-1"): 4}
+    # แถวที่ใหม่กว่า now - lag_sec ยังไม่เข้า checkpoint
+    assert info["replayed"] == 3 and info["checkpointed"] == 2
+    assert rec.checkpoint()["watermark"] == "2024-01-02 11:50:00"
+    assert as_dict(rec.load()[0]) == {("A", "R-1"): 10}
+
+
+def test_resume_from_checkpoint_after_new_rows(tmp_path):
+    rows = [("2024-01-01 08:00:00", "RECEIVE", "A", "10", "-", "DOCK_IN", "u"),
+            ("2024-01-01 08:01:00", "PUT_AWAY", "A", "10", "DOCK_IN", "R-1", "u")]
+    table = log_table(*rows)
+    rec = StockReconciler(str(tmp_path), lag_sec=0)
+    rec.rebuild(table, now=NOW)
+    new = [("2024-01-02 12:30:00", "REPLENISH", "A", "4", "R-1", "P-1", "u"),
+           ("2024-01-02 12:40:00", "PICKING", "A", "1", "P-1", "STG-01", "u")]
+    table.append_rows([list(r) for r in new])
+    ledger, info = rec.rebuild(table, now=datetime(2024, 1, 2, 13, 0, 0))
+    # replay เฉพาะแถวหลัง watermark ทับยอดจาก checkpoint
+    assert info["from"] == "2024-01-02 12:00:00"
+    assert info["replayed"] == 2
+    assert as_dict(ledger) == {("A", "R-1"): 6, ("A", "P-1"): 3, ("A", "STG-01"): 1}
+    full, _ = rec.rebuild(table, full=True, now=datetime(2024, 1, 2, 13, 0, 0))
+    assert as_dict(full) == as_dict(ledger)
+
+
+def test_compare_stock_reports_mismatches():
+    ledger = pd.DataFrame({"Item_ID": ["A", "A", "B"], "Location": ["R-1", "P-1", "P-2"], "Qty": [6, 4, 2]})
+    stock = pd.DataFrame({"Item_ID": ["A", "A", "A", "C"], "Location": ["R-1", "P-1", "P-1", "P-9"],
+                          "Qty": ["6", "1", "2", "5"]})
+    diff = compare_stock(ledger, stock)
+    assert list(diff.columns) == ["Item_ID", "Location", "Stock", "Log", "Diff"]
+    # เรียงจากต่างมากไปน้อย / แถวที่ตรงกัน (A, R-1) ไม่อยู่ในรายงาน
+    assert diff.values.tolist() == [["C", "P-9", 5, 0, 5], ["B", "P-2", 0, 2, -2], ["A", "P-1", 3, 4, -1]]
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from wms_schema import columns, concat_frames, parse_rows
+from wms_storage import TABLE_LOG, TABLE_STOCK
+
+
+def bad_cells(report):
+    return [(r.Row, r.Column, r.Error) for r in report["bad"].itertuples()]
+
+
+def test_stock_qty_blank_and_non_numeric():
+    df, report = parse_rows([["I1", "N1", "", "P-1", "Available", "-", "5", "2024-01-01 00:00:00"],
+                             ["I2", "N2", "abc", "P-2", "Available", "-", "x", "2024-01-01 00:00:00"],
+                             ["I3", "N3", "2.5", "P-3", "Available", "-", "", "2024-01-01 00:00:00"],
+                             ["I4", "N4", "7", "P-4", "Available", "-", "3", "2024-01-01 00:00:00"]], TABLE_STOCK)
+    assert str(df["Qty"].dtype) == "int32"
+    # ว่าง = 0 ไม่ใช่แถวเสีย / อ่านไม่ได้ หรือมีทศนิยม = 0 แล้วรายงาน (เลขแถวตามชีต)
+    assert df["Qty"].tolist() == [0, 0, 0, 7]
+    assert df["Replen_Point"].isna().tolist() == [False, True, True, False]
+    assert bad_cells(report) == [(3, "Qty", "ไม่ใช่จำนวนเต็ม"), (3, "Replen_Point", "ไม่ใช่ตัวเลข"),
+                                 (4, "Qty", "ไม่ใช่จำนวนเต็ม")]
+    assert report["rows"] == 4
+
+
+def test_trailing_cells_trimmed_by_sheet():
+    # ชีตตัด cell ว่างท้ายแถวทิ้ง: แถวสั้นกว่า schema ต้องได้ค่าว่าง ไม่ใช่ error
+    df, report = parse_rows([["I1", "N1", "3", "P-1"],
+                             ["I2", "N2", "4", "P-2", "Available", "-", "5", "2024-01-01 00:00:00"]], TABLE_STOCK)
+    assert list(df.columns) == columns(TABLE_STOCK)
+    assert df["Status"].astype(str).tolist() == ["", "Available"]
+    assert pd.isna(df.loc[0, "Time"]) and pd.isna(df.loc[0, "Replen_Point"])
+    assert report["bad"].empty
+
+
+def test_missing_required_columns_and_extra_columns():
+    df, report = parse_rows([["2024-01-01 10:00:00", "picking ", "I1", "All", "DOCK_IN", "R-1", "u", "extra"],
+                             ["bad", "", "", "1"]], TABLE_LOG)
+    assert list(df.columns) == columns(TABLE_LOG)  # column เกิน schema ถูกตัด
+    assert df["Action"].astype(str).tolist() == ["PICKING", ""]
+    assert df["Qty"].tolist() == ["All", "1"]  # Qty ของ log เป็น text
+    assert bad_cells(report) == [(3, "Timestamp", "อ่านวันที่ไม่ได้"), (3, "Action", "ว่าง"), (3, "Item_ID", "ว่าง")]
+
+
+def test_empty_rows_and_concat_keep_dtypes():
+    empty, report = parse_rows([], TABLE_STOCK)
+    assert list(empty.columns) == columns(TABLE_STOCK) and report["rows"] == 0
+    a, _ = parse_rows([["I1", "N1", "1", "P-1"]], TABLE_STOCK)
+    b, _ = parse_rows([["I2", "N2", "2", "R-1"]], TABLE_STOCK)
+    both = concat_frames([a, empty, b], TABLE_STOCK)
+    assert both["Location"].dtype == "category"
+    assert both["Location"].astype(str).tolist() == ["P-1", "R-1"]
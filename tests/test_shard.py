@@ -0,0 +1,129 @@
+import pytest
+
+from wms_shard import ShardedBackend, ShardedMutation, ShardedStockStore
+from wms_stock import StockMutationError, StockStore
+from wms_storage import FakeBackend
+
+LOCS = [["Location_ID", "Zone", "Rack", "Level", "Bin", "Loc_Type"],
+        ["A-01", "A", "1", "1", "", "PICK"], ["R-01", "R", "1", "1", "", "RESERVE"]]
+
+
+class LogSink:
+    def __init__(self):
+        self.rows = []
+
+    def write_many(self, rows):
+        self.rows += rows
+
+
+class FailingBatch:
+    """Table ที่ apply_batch ล้มทุกครั้ง (เช่น เน็ตหลุดระหว่างส่ง batch)"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def apply_batch(self, updates=(), appends=(), deletes=()):
+        raise ConnectionError("batch failed")
+
+
+@pytest.fixture
+def shards():
+    b = ShardedBackend(FakeBackend(), {"A": ShardedBackend.fake_shard("WMS_A"),
+                                       "R": ShardedBackend.fake_shard("WMS_R")})
+    b.router.load(LOCS)
+    b.stock_tables["R"].append_rows([["I2", "Item 2", "7", "R-01", "Available", "-", "2", "2024-01-01 00:00:00"]])
+    stores = {name: StockStore(t, poll_sec=0, full_resync_sec=0) for name, t in b.stock_tables.items()}
+    store = ShardedStockStore(stores, b.router, b.pool)
+    store.sync(force=True)
+    return b, store
+
+
+def sheet(b, shard):
+    return {(r[0], r[3]): int(r[2]) for r in b.stock_tables[shard].get_all_values()[1:]}
+
+
+def replenish(store, log, qty=3):
+    mut = ShardedMutation(store, log)
+    return mut.decrement("I2", "R-01", qty).increment("I2", "A-01", qty, item_name="Item 2") \
+              .log("REPLENISH", "I2", qty, "R-01", "A-01")
+
+
+def test_cross_shard_move_commits_both_shards(shards):
+    b, store = shards
+    stats = replenish(store, LogSink()).commit()
+    assert stats["shards"] == 2
+    assert sheet(b, "A") == {("I2", "A-01"): 3}
+    assert sheet(b, "R") == {("I2", "R-01"): 4}
+
+
+def test_failed_source_shard_only_over_counts(shards):
+    b, store = shards
+    store.stores["R"].table = FailingBatch(store.stores["R"].table)
+    with pytest.raises(ConnectionError):
+        replenish(store, LogSink()).commit()
+    # shard ที่เพิ่มของ commit ก่อน ส่วน shard ต้นทางยังไม่ถูกตัด: ยอดรวมเกิน (10) ไม่ขาด
+    assert sheet(b, "A") == {("I2", "A-01"): 3}
+    assert sheet(b, "R") == {("I2", "R-01"): 7}
+    assert store.stock_of("I2") == {"A-01": 3, "R-01": 7}
+
+
+def test_source_shard_conflict_reports_committed_shard(shards):
+    b, store = shards
+    # เครื่องอื่นตัด R-01 เหลือ 1 หลังจาก store อ่านไปแล้ว
+    b.stock_tables["R"].update_cells([(2, 3, "1")])
+    with pytest.raises(StockMutationError, match="shard A"):
+        replenish(store, LogSink()).commit()
+    assert sheet(b, "A") == {("I2", "A-01"): 3}
+    assert sheet(b, "R") == {("I2", "R-01"): 1}
+
+
+def test_lookup_reads_every_shard(shards):
+    b, store = shards
+    replenish(store, LogSink()).commit()
+    found = store.lookup(["I2"])
+    assert sorted(zip(found["Location"], found["Shard"])) == [("A-01", "A"), ("R-01", "R")]
+    assert store.lookup(["I9"]).empty
+
+
+def test_read_after_keeps_a_cursor_per_shard(shards):
+    b, store = shards
+    rows, cursor = b.log.read_after(None)
+    assert rows == []
+    replenish(store, LogSink()).commit()
+    b.log.append_rows([["2024-01-02 00:00:00", "PICKING", "I2", "1", "R-01", "STG-01", "Admin"]])
+    rows, cursor = b.log.read_after(cursor)
+    assert [r[1] for r in rows] == ["PICKING"]
+    b.log.tables["R"].append_rows([["2024-01-03 00:00:00", "PICKING", "I2", "1", "R-01", "STG-01", "Admin"]])
+    rows, cursor = b.log.read_after(cursor)
+    assert [r[0] for r in rows] == ["2024-01-03 00:00:00"]
+    b.log.tables["R"].delete_rows([2])
+    assert b.log.read_after(cursor) is None
+
+
+def test_log_flush_marks_only_the_shard_it_wrote(shards):
+    b, store = shards
+    for s in store.stores.values():
+        s.poll_sec, s.full_resync_sec = 0, 3600
+    # เครื่องอื่นแก้ stock ใน shard R แล้วแอปเรา flush log ไป shard A
+    b.stock_tables["R"].update_cells([(2, 3, "5")])
+    row = ["2024-01-02 00:00:00", "RECEIVE", "I9", "1", "-", "A-01", "Admin"]
+    b.log.append_rows([row])
+    store.note_local_write([row])
+    assert store.sync()
+    assert store.stock_of("I2") == {"R-01": 5}
+
+
+def test_cross_shard_move_uses_source_qty_from_sheet(shards):
+    b, store = shards
+    log = LogSink()
+    mut = ShardedMutation(store, log).move("I2", "R-01", "A-01", log_action="REPLENISH")
+    # เครื่องอื่นตัด R-01 เหลือ 5 ระหว่าง move() กับ commit() (store ยังเห็น 7)
+    b.stock_tables["R"].update_cells([(2, 3, "5")])
+    mut.commit()
+    assert sheet(b, "A") == {("I2", "A-01"): 5}
+    assert sheet(b, "R") == {}
+    assert store.stock_of("I2") == {"A-01": 5}
+    assert [(r[1], r[3]) for r in log.rows] == [("REPLENISH", 5)]
@@ -0,0 +1,168 @@
+import pytest
+
+from wms_log import TransactionLogWriter
+from wms_stock import StockConflict, StockMutation, StockMutationError, StockStore
+from wms_storage import FakeBackend, SqliteBackend
+
+ROWS = [
+    ["I1", "Item 1", "10", "P-1", "Available", "-", "5", "2024-01-01 00:00:00"],
+    ["I2", "Item 2", "20", "R-1", "Available", "-", "5", "2024-01-01 00:00:00"],
+    ["I3", "Item 3", "30", "R-2", "Available", "-", "5", "2024-01-01 00:00:00"],
+]
+
+
+class LogSink:
+    def __init__(self):
+        self.rows = []
+
+    def write_many(self, rows):
+        self.rows += rows
+
+
+@pytest.fixture(params=["fake", "sqlite"])
+def table(request, tmp_path):
+    backend = FakeBackend() if request.param == "fake" else SqliteBackend(str(tmp_path / "wms.db"))
+    backend.stock.append_rows(ROWS)
+    return backend.stock
+
+
+def make_store(table):
+    store = StockStore(table, poll_sec=0, full_resync_sec=0)
+    store.sync(force=True)
+    return store
+
+
+def sheet(table):
+    return {(r[0], r[3]): int(r[2]) for r in table.get_all_values()[1:]}
+
+
+def test_commit_in_one_batch(table):
+    store, log = make_store(table), LogSink()
+    mut = StockMutation(store, log)
+    mut.decrement("I2", "R-1", 5).increment("I2", "P-9", 5).log("REPLENISH", "I2", 5, "R-1", "P-9")
+    stats = mut.commit()
+    assert stats["conflicts"] == 0
+    assert sheet(table) == {("I1", "P-1"): 10, ("I2", "R-1"): 15, ("I3", "R-2"): 30, ("I2", "P-9"): 5}
+    assert [r[1] for r in log.rows] == ["REPLENISH"]
+    assert store.stock_of("I2") == {"R-1": 15, "P-9": 5}
+
+
+def test_external_value_change_is_retried_on_fresh_value(table):
+    store, log = make_store(table), LogSink()
+    # เครื่องอื่นตัด I2 เหลือ 12 หลังจาก store อ่านไปแล้ว
+    table.update_cells([(3, 3, "12")])
+    mut = StockMutation(store, log)
+    stats = mut.decrement("I2", "R-1", 5).commit()
+    assert stats["conflicts"] == 1
+    assert sheet(table)[("I2", "R-1")] == 7
+    assert store.stock_of("I2") == {"R-1": 7}
+
+
+def test_external_change_makes_stock_insufficient(table):
+    store, log = make_store(table), LogSink()
+    table.update_cells([(3, 3, "2")])
+    with pytest.raises(StockMutationError):
+        StockMutation(store, log).decrement("I2", "R-1", 5).log("PICKING", "I2", 5, "R-1", "STG-01").commit()
+    assert sheet(table)[("I2", "R-1")] == 2
+    assert log.rows == []
+
+
+def test_row_deleted_above_shifts_rows(table):
+    store, log = make_store(table), LogSink()
+    # เครื่องอื่นลบแถวของ I1 (แถว 2) แถวข้างล่างเลื่อนขึ้นหมด
+    table.delete_rows([2])
+    stats = StockMutation(store, log).decrement("I3", "R-2", 10).commit()
+    assert stats["conflicts"] == 1
+    assert sheet(table) == {("I2", "R-1"): 20, ("I3", "R-2"): 20}
+    assert store.find_rows("I3", "R-2") == [3]
+
+
+def test_target_row_deleted(table):
+    store, log = make_store(table), LogSink()
+    table.delete_rows([3])
+    with pytest.raises(StockMutationError):
+        StockMutation(store, log).decrement("I2", "R-1", 5).commit()
+    assert sheet(table) == {("I1", "P-1"): 10, ("I3", "R-2"): 30}
+
+
+class Contended:
+    """Table ที่มีเครื่องอื่นแก้แถวทุกครั้งก่อนที่เราจะตรวจ (ชนทุกรอบ)"""
+
+    def __init__(self, table):
+        self.table = table
+        self.edits = 0
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def get_rows(self, row_nos):
+        self.edits += 1
+        self.table.update_cells([(3, 3, str(100 + self.edits))])
+        return self.table.get_rows(row_nos)
+
+
+def test_exhausted_retries_raise_conflict_without_writing(table):
+    contended = Contended(table)
+    store, log = make_store(contended), LogSink()
+    mut = StockMutation(store, log, max_retries=2)
+    with pytest.raises(StockConflict) as e:
+        mut.decrement("I2", "R-1", 5).increment("I2", "P-9", 5).log("REPLENISH", "I2", 5, "R-1", "P-9").commit()
+    assert e.value.rows == [3]
+    assert contended.edits == 3
+    # ไม่มีอะไรถูกเขียน: ค่าเป็นของเครื่องอื่น ไม่มีแถวใหม่ ไม่มี log
+    assert sheet(table) == {("I1", "P-1"): 10, ("I2", "R-1"): 103, ("I3", "R-2"): 30}
+    assert log.rows == []
+    assert store.stock_of("I2") == {"R-1": 103}
+
+
+def test_verify_off_skips_read(table):
+    store, log = make_store(table), LogSink()
+    calls = []
+    orig = table.get_rows
+    table.get_rows = lambda rows: calls.append(rows) or orig(rows)
+    StockMutation(store, log, verify=False).decrement("I1", "P-1", 1).commit()
+    assert calls == []
+    assert sheet(table)[("I1", "P-1")] == 9
+
+
+def test_on_hand_by_type_follows_commits(table):
+    store, log = make_store(table), LogSink()
+    loc_map = {"P-1": "PICK", "P-9": "PICK", "R-1": "RESERVE", "R-2": "RESERVE"}
+    assert store.on_hand_by_type("I2", loc_map) == {"RESERVE": 20}
+    StockMutation(store, log).decrement("I2", "R-1", 20).increment("I2", "P-9", 20).commit()
+    assert store.on_hand_by_type("I2", loc_map) == {"PICK": 20}
+    assert store.on_hand_by_type("I9", loc_map) == {}
+
+
+def test_external_edit_after_log_flush_is_not_skipped(tmp_path):
+    # Transaction_Log อยู่ Spreadsheet เดียวกับ Current_Stock: revision เปลี่ยนทั้งไฟล์ทุกครั้งที่ flush
+    backend = FakeBackend()
+    backend.stock.append_rows(ROWS)
+    store = make_store(backend.stock)
+    store.poll_sec, store.full_resync_sec = 0, 3600
+    writer = TransactionLogWriter(backend.log.append_rows, str(tmp_path / "journal.db"), flush_size=10_000,
+                                  flush_sec=3600, on_flush=store.note_local_write)
+    try:
+        writer.write(["2024-01-01 10:00:00", "PICKING", "I1", 2, "P-1", "STG-01", "u"])
+        writer.flush()
+        # เครื่องอื่นแก้ stock หลัง flush ก่อน poll รอบถัดไป: ต้องอ่านใหม่ ไม่ถูกกลืนไปกับการเขียนของเรา
+        backend.stock.update_cells([(3, 3, "12")])
+        assert store.sync()
+        assert store.stock_of("I2") == {"R-1": 12}
+        writer.write(["2024-01-01 10:00:01", "PICKING", "I1", 1, "P-1", "STG-01", "u"])
+        writer.flush()
+        assert not store.sync()  # revision ของ flush เราเอง ไม่ต้องอ่านใหม่
+    finally:
+        writer.close()
+
+
+def test_own_commit_does_not_trigger_reload(table):
+    store, log = make_store(table), LogSink()
+    store.poll_sec, store.full_resync_sec = 0, 3600
+    StockMutation(store, log).decrement("I1", "P-1", 1).commit()
+    api_calls = store.api_calls
+    assert not store.sync()
+    assert store.api_calls == api_calls + 1
+    table.update_cells([(2, 3, "4")])
+    assert store.sync()
+    assert store.stock_of("I1") == {"P-1": 4}
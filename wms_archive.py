@@ -0,0 +1,132 @@
+"""ย้าย Transaction_Log เดือนที่ปิดแล้วออกจากชีตไปเก็บเป็น Parquet แบ่ง partition ตามปี/เดือน และค้นประวัติจากไฟล์"""
+import hashlib
+import json
+import os
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+import pandas as pd
+
+# ชื่อ Column มาตรฐานใน archive (แอปเขียน log ตามตำแหน่ง ไม่ขึ้นกับชื่อ header ในชีต)
+LOG_COLUMNS = ["Timestamp", "Action", "Item_ID", "Qty", "From_Loc", "To_Loc", "User"]
+
+
+def _month_index(ts):
+    return ts.year * 12 + ts.month - 1
+
+
+class LogArchive:
+    """root/year=YYYY/month=MM/part-<hash>.parquet
+
+    - rollover() อ่าน log สด 1 ครั้ง เขียนเดือนที่ปิดแล้วเป็น Parquet แล้วลบแถวเหล่านั้นออกจากชีตใน batch เดียว
+      ชื่อไฟล์มาจาก hash ของข้อมูล: ถ้าล่มหลังเขียนไฟล์แต่ก่อนลบแถว รันซ้ำจะเขียนทับไฟล์เดิม ไม่เกิดข้อมูลซ้ำ
+    - query() อ่านเฉพาะ partition ที่อยู่ในช่วงวันที่ และเฉพาะ column ที่ขอ ไม่แตะ Sheets API
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.stats = {"rollovers": 0, "archived": 0, "last_rollover": None}
+
+    # ---------- rollover ----------
+    def rollover(self, table, writer=None, keep_months=1, now=None):
+        """ย้ายทุกแถวที่เก่ากว่า keep_months เดือนล่าสุด (นับเดือนปัจจุบันด้วย) ออกจาก table"""
+        t0 = time.perf_counter()
+        if writer is not None:
+            writer.flush()
+        cutoff = _month_index(now or datetime.now()) - (max(1, keep_months) - 1)
+        with writer.paused() if writer is not None else nullcontext():
+            values = table.get_all_values()
+            rows = [list(r) + [""] * (len(LOG_COLUMNS) - len(r)) for r in values[1:]]
+            if not rows:
+                return self._result(0, [], 0, t0)
+            df = pd.DataFrame([r[:len(LOG_COLUMNS)] for r in rows], columns=LOG_COLUMNS)
+            df["Row"] = range(2, len(df) + 2)
+            ts = pd.to_datetime(df["Timestamp"], errors="coerce")
+            # แถวที่อ่านเวลาไม่ได้ให้อยู่ในชีตต่อ (ไม่รู้ว่าเป็นของเดือนไหน)
+            old = df[ts.notna() & ((ts.dt.year * 12 + ts.dt.month - 1) < cutoff)].copy()
+            if old.empty:
+                return self._result(0, [], len(df), t0)
+            old["Timestamp"] = ts[old.index]
+            written = []
+            for (year, month), part in old.groupby([old["Timestamp"].dt.year, old["Timestamp"].dt.month]):
+                written.append(self._write_partition(int(year), int(month), part.drop(columns="Row")))
+            table.apply_batch(deletes=old["Row"].tolist())
+        self.stats["rollovers"] += 1
+        self.stats["archived"] += len(old)
+        self.stats["last_rollover"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return self._result(len(old), written, len(df) - len(old), t0)
+
+    def _result(self, archived, partitions, live, t0):
+        return {"archived": archived, "partitions": partitions, "live_rows": live,
+                "ms": round((time.perf_counter() - t0) * 1000)}
+
+    def _partition_dir(self, year, month):
+        return os.path.join(self.root, f"year={year}", f"month={month:02d}")
+
+    def _write_partition(self, year, month, part):
+        part = part.copy()
+        for c in LOG_COLUMNS[1:]:
+            part[c] = part[c].astype(str)
+        digest = hashlib.sha1(json.dumps(part.astype(str).values.tolist()).encode("utf-8")).hexdigest()[:16]
+        folder = self._partition_dir(year, month)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{digest}.parquet")
+        tmp = path + ".tmp"
+        part.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        return f"{year}-{month:02d}"
+
+    # ---------- อ่าน ----------
+    def partitions(self):
+        """[(year, month), ...] ที่มีข้อมูลใน archive เรียงตามเวลา"""
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for y in os.listdir(self.root):
+            if not y.startswith("year="):
+                continue
+            for m in os.listdir(os.path.join(self.root, y)):
+                if m.startswith("month="):
+                    out.append((int(y[5:]), int(m[6:])))
+        return sorted(out)
+
+    def query(self, start=None, end=None, items=None, actions=None, columns=None):
+        """ค้นประวัติจาก archive
+
+        - start / end: วันที่ (รวมทั้งสองวัน) ใช้เลือก partition ก่อน แล้วค่อยกรองรายแถว
+        - items / actions: รายการ Item_ID / Action ที่ต้องการ (None = ทั้งหมด)
+        - columns: column ที่ต้องการ (None = ทั้งหมด) อ่านจากไฟล์เฉพาะ column ที่ใช้
+        """
+        import pyarrow.dataset as ds
+
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None
+        files = []
+        for year, month in self.partitions():
+            first = pd.Timestamp(year=year, month=month, day=1)
+            if (start is not None and first + pd.offsets.MonthBegin(1) <= start) or (end is not None and first >= end):
+                continue
+            folder = self._partition_dir(year, month)
+            files += [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".parquet")]
+        cols = list(columns) if columns else list(LOG_COLUMNS)
+        if not files:
+            return pd.DataFrame(columns=cols)
+
+        flt = None
+        conds = []
+        if start is not None:
+            conds.append(ds.field("Timestamp") >= start.to_pydatetime())
+        if end is not None:
+            conds.append(ds.field("Timestamp") < end.to_pydatetime())
+        if items:
+            conds.append(ds.field("Item_ID").isin([str(i) for i in items]))
+        if actions:
+            conds.append(ds.field("Action").isin([str(a) for a in actions]))
+        for c in conds:
+            flt = c if flt is None else flt & c
+        df = ds.dataset(files, format="parquet").to_table(columns=cols, filter=flt).to_pandas()
+        if "Timestamp" in df.columns:
+            df = df.sort_values("Timestamp", kind="stable").reset_index(drop=True)
+        return df
+
@@ -0,0 +1,149 @@
+"""รับของทั้งตู้จาก ASN (Advance Shipping Notice) ไฟล์ CSV / Excel: อ่านทีละ chunk -> ตรวจกับ Item_Master -> สแกนนับเทียบ -> บันทึกใน batch เดียว"""
+import io
+from datetime import datetime
+
+import pandas as pd
+
+ASN_COLUMNS = ["Container", "Barcode", "Qty"]
+LINE_COLUMNS = ["Container", "Barcode", "Item_Name", "Qty"]
+ERROR_COLUMNS = ["Line", "Container", "Barcode", "Qty", "Error"]
+RECONCILE_COLUMNS = ["Barcode", "Item_Name", "Expected", "Scanned", "Diff", "Result"]
+
+# ชื่อ header ที่ยอมรับ (ไม่สนตัวพิมพ์ / ช่องว่าง) -> ชื่อมาตรฐาน
+ASN_ALIASES = {
+    "container": "Container", "container_id": "Container", "pallet": "Container", "pallet_id": "Container",
+    "barcode": "Barcode", "item_id": "Barcode", "sku": "Barcode",
+    "qty": "Qty", "quantity": "Qty",
+}
+
+
+class AsnError(Exception):
+    pass
+
+
+def _normalize(chunk):
+    chunk = chunk.rename(columns=lambda c: ASN_ALIASES.get(str(c).strip().lower().replace(" ", "_"), c))
+    missing = [c for c in ("Barcode", "Qty") if c not in chunk.columns]
+    if missing:
+        raise AsnError(f"ไฟล์ ASN ขาด column: {', '.join(missing)}")
+    if "Container" not in chunk.columns:
+        chunk["Container"] = ""
+    return chunk[ASN_COLUMNS]
+
+
+def read_asn(file, filename, chunksize=500):
+    """อ่านไฟล์ ASN ทีละ chunk (DataFrame[Container, Barcode, Qty] ทุกค่าเป็น str) ไม่โหลดทั้งไฟล์เป็น DataFrame เดียว
+
+    - .csv: pandas read_csv(chunksize)
+    - .xlsx: openpyxl read_only (อ่านทีละแถว) ใช้ sheet แรก
+    """
+    data = file.getvalue() if hasattr(file, "getvalue") else file.read()
+    if str(filename).lower().endswith((".xlsx", ".xlsm")):
+        yield from _read_xlsx(data, chunksize)
+        return
+    reader = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, chunksize=chunksize,
+                         encoding="utf-8-sig")
+    for chunk in reader:
+        yield _normalize(chunk)
+
+
+def _read_xlsx(data, chunksize):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = ["" if h is None else str(h) for h in header]
+        buf = []
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            buf.append(["" if v is None else (str(int(v)) if isinstance(v, float) and v.is_integer() else str(v))
+                        for v in row[:len(header)]])
+            if len(buf) >= chunksize:
+                yield _normalize(pd.DataFrame(buf, columns=header[:len(buf[0])]))
+                buf = []
+        if buf:
+            yield _normalize(pd.DataFrame(buf, columns=header[:len(buf[0])]))
+    finally:
+        wb.close()
+
+
+def validate_asn(chunks, item_index, default_container=""):
+    """ตรวจทุกบรรทัดกับ Item_Master index แล้วรวมบรรทัดซ้ำ คืนค่า (lines, errors, total_lines)
+
+    - lines: DataFrame[Container, Barcode, Item_Name, Qty] 1 แถวต่อ (Container, Barcode) ตามลำดับในไฟล์
+    - errors: บรรทัดที่ไม่ผ่าน (Line = เลขบรรทัดในไฟล์ นับ header เป็นบรรทัด 1) เช่น Barcode ไม่มีใน Master, Qty ผิด
+    """
+    good, bad = [], []
+    total = 0
+    for chunk in chunks:
+        chunk = chunk.copy()
+        chunk["Line"] = range(total + 2, total + 2 + len(chunk))
+        total += len(chunk)
+        chunk["Barcode"] = chunk["Barcode"].astype(str).str.strip()
+        chunk["Container"] = chunk["Container"].astype(str).str.strip().replace("", default_container)
+        qty = pd.to_numeric(chunk["Qty"], errors="coerce")
+        names = chunk["Barcode"].map(lambda b: (item_index.get(b) or {}).get("Description"))
+        error = pd.Series("", index=chunk.index)
+        error[~(qty > 0) | (qty % 1 != 0)] = "Qty ไม่ถูกต้อง"
+        error[names.isna()] = "ไม่พบใน Item_Master"
+        error[chunk["Barcode"] == ""] = "ไม่มี Barcode"
+        error[chunk["Container"] == ""] = "ไม่มี Container"
+        ok = error == ""
+        bad.append(chunk.loc[~ok].assign(Error=error[~ok])[ERROR_COLUMNS])
+        good.append(chunk.loc[ok, ["Container", "Barcode"]].assign(Item_Name=names[ok], Qty=qty[ok].astype("int64")))
+    errors = pd.concat(bad, ignore_index=True) if bad else pd.DataFrame(columns=ERROR_COLUMNS)
+    if not good or all(g.empty for g in good):
+        return pd.DataFrame(columns=LINE_COLUMNS), errors, total
+    lines = (pd.concat(good, ignore_index=True)
+               .groupby(["Container", "Barcode"], as_index=False, sort=False)
+               .agg(Item_Name=("Item_Name", "first"), Qty=("Qty", "sum")))
+    return lines[LINE_COLUMNS], errors, total
+
+
+def reconcile(lines, scanned):
+    """เทียบจำนวนใน ASN กับที่สแกนนับได้จริง (scanned: {Barcode: จำนวน}) ต่อ Barcode
+
+    Result: OK / SHORT (ขาด) / OVER (เกิน) / NOT_IN_ASN (สแกนเจอแต่ไม่มีใน ASN)
+    """
+    expected = lines.groupby("Barcode", sort=False).agg(Item_Name=("Item_Name", "first"), Expected=("Qty", "sum"))
+    extra = [b for b in scanned if b not in expected.index]
+    out = expected.reindex(list(expected.index) + extra)
+    out["Expected"] = out["Expected"].fillna(0).astype("int64")
+    out["Item_Name"] = out["Item_Name"].fillna("")
+    out["Scanned"] = [int(scanned.get(b, 0)) for b in out.index]
+    out["Diff"] = out["Scanned"] - out["Expected"]
+    out["Result"] = "OK"
+    out.loc[out["Diff"] < 0, "Result"] = "SHORT"
+    out.loc[out["Diff"] > 0, "Result"] = "OVER"
+    out.loc[out["Expected"] == 0, "Result"] = "NOT_IN_ASN"
+    return out.rename_axis("Barcode").reset_index()[RECONCILE_COLUMNS]
+
+
+def apply_counts(lines, scanned):
+    """ปรับ Qty ใน lines ให้เท่าที่สแกนได้จริง (แบ่งให้ Container ตามลำดับในไฟล์) ตัดบรรทัดที่เหลือ 0"""
+    left = {b: int(q) for b, q in scanned.items()}
+    out = lines.copy()
+    qty = []
+    for b, q in zip(out["Barcode"], out["Qty"]):
+        take = min(int(q), left.get(b, 0))
+        left[b] = left.get(b, 0) - take
+        qty.append(take)
+    out["Qty"] = qty
+    return out[out["Qty"] > 0].reset_index(drop=True)
+
+
+def add_asn_to_mutation(mut, lines, replen_point, location="DOCK_IN", status="Pending Putaway", action="RECEIVE"):
+    # 1 แถวต่อ (Container, Barcode) ใน Current_Stock + log RECEIVE ที่ From_Loc = Container (ย้อนดูได้ว่ามากับตู้ไหน)
+    # replen_point(barcode) -> Replen_Point ของแถวใหม่
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for line in lines.itertuples(index=False):
+        mut.append([line.Barcode, line.Item_Name, int(line.Qty), location, status, line.Container,
+                    replen_point(line.Barcode), ts])
+        mut.log(action, line.Barcode, int(line.Qty), line.Container, location)
+    return mut
+
@@ -0,0 +1,217 @@
+"""ควบคุมการเรียก Google Sheets API ทั้ง process: จำกัดอัตราตาม quota, รวม read ที่ซ้ำกัน, retry เมื่อโดน 429 / 5xx"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# ชื่อ method ของ gspread แยกตามประเภท quota
+READ_METHODS = {"get_all_values", "get_all_records", "get_values", "col_values", "row_values", "cell", "acell",
+                "findall", "find", "get", "batch_get", "worksheet", "worksheets", "fetch_sheet_metadata"}
+WRITE_METHODS = {"append_row", "append_rows", "update", "update_cell", "update_cells", "batch_update",
+                 "delete_rows", "insert_row", "insert_rows", "clear", "values_append", "values_update"}
+# modifiedTime มาจาก Drive API (quota คนละก้อนกับ Sheets)
+DRIVE_METHODS = {"get_lastUpdateTime"}
+
+
+class QuotaExceeded(Exception):
+    """ลองใหม่ครบแล้วยังโดน 429 (quota เต็ม)"""
+
+
+def error_status(exc):
+    """HTTP status ของ error จาก gspread (APIError) / googleapiclient (HttpError) ถ้าหาได้"""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "resp", None), "status", None)
+    if status is None:
+        status = getattr(exc, "code", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """เติม token ทีละ per_min / 60 ต่อวินาที เก็บได้สูงสุด burst ใบ acquire() รอจนได้ token แล้วคืนเวลาที่รอ"""
+
+    def __init__(self, per_min, burst=None):
+        self.rate = per_min / 60.0
+        self.capacity = float(burst if burst is not None else max(1, per_min // 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                need = (1 - self.tokens) / self.rate
+            time.sleep(need)
+            waited += need
+
+    def drain(self):
+        # โดน 429 จาก server: ทิ้ง token ที่เหลือ ให้ทุก thread ชะลอพร้อมกัน
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0)
+
+
+class QuotaGovernor:
+    """ทุก call ผ่าน call(kind, fn, key)
+
+    - kind: "read" / "write" / "drive" แต่ละประเภทมี TokenBucket ของตัวเอง
+    - key: read ที่ key เหมือนกันและกำลังรออยู่ จะรอผลจาก call เดียวกัน (ผลลัพธ์ใช้ร่วมกัน ห้ามแก้)
+    - read retry เมื่อ 429 / 5xx, write retry เฉพาะ 429 (5xx อาจเขียนไปแล้ว retry แล้วอาจซ้ำ)
+      รอแบบ exponential backoff + full jitter
+    """
+
+    def __init__(self, read_per_min=60, write_per_min=60, drive_per_min=600,
+                 max_retries=5, base_delay=1.0, max_delay=32.0):
+        self.buckets = {
+            "read": TokenBucket(read_per_min),
+            "write": TokenBucket(write_per_min),
+            "drive": TokenBucket(drive_per_min),
+        }
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._recent = {k: deque() for k in self.buckets}
+        self.stats = {k: {"calls": 0, "coalesced": 0, "throttled": 0, "retries": 0, "errors": 0,
+                          "wait_total": 0.0, "wait_max": 0.0} for k in self.buckets}
+        self.events = deque(maxlen=20)
+
+    def call(self, kind, fn, key=None):
+        if key is None:
+            return self._run(kind, fn)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats[kind]["coalesced"] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = self._run(kind, fn)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _run(self, kind, fn):
+        stat = self.stats[kind]
+        bucket = self.buckets[kind]
+        attempt = 0
+        while True:
+            waited = bucket.acquire()
+            with self._lock:
+                stat["calls"] += 1
+                stat["wait_total"] += waited
+                stat["wait_max"] = max(stat["wait_max"], waited)
+                self._recent[kind].append(time.monotonic())
+            try:
+                return fn()
+            except Exception as e:
+                status = error_status(e)
+                retry = status == 429 or (kind != "write" and status is not None and status >= 500)
+                if status == 429:
+                    bucket.drain()
+                    with self._lock:
+                        stat["throttled"] += 1
+                        self.events.append((time.strftime("%H:%M:%S"), kind, status))
+                if not retry or attempt >= self.max_retries:
+                    with self._lock:
+                        stat["errors"] += 1
+                    if status == 429:
+                        raise QuotaExceeded(
+                            f"Google Sheets quota เต็ม ({kind}) ลองใหม่ {attempt} ครั้งแล้ว กรุณารอสักครู่") from e
+                    raise
+                attempt += 1
+                with self._lock:
+                    stat["retries"] += 1
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def snapshot(self):
+        """สถิติต่อประเภท: calls/min (60 วินาทีล่าสุด), รอคิวเฉลี่ย/สูงสุด (ms), throttled, retries, coalesced, errors"""
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for kind, stat in self.stats.items():
+                recent = self._recent[kind]
+                while recent and now - recent[0] > 60:
+                    recent.popleft()
+                out[kind] = {
+                    "calls_per_min": len(recent),
+                    "calls": stat["calls"],
+                    "wait_avg_ms": round(stat["wait_total"] / stat["calls"] * 1000, 1) if stat["calls"] else 0.0,
+                    "wait_max_ms": round(stat["wait_max"] * 1000, 1),
+                    "throttled": stat["throttled"],
+                    "retries": stat["retries"],
+                    "coalesced": stat["coalesced"],
+                    "errors": stat["errors"],
+                }
+        return out
+
+
+def _kind(name):
+    if name in READ_METHODS:
+        return "read"
+    if name in WRITE_METHODS:
+        return "write"
+    if name in DRIVE_METHODS:
+        return "drive"
+    return None
+
+
+class GovernedWorksheet:
+    """ครอบ gspread.Worksheet: method ที่เรียก API วิ่งผ่าน governor ส่วน attribute อื่น (id, title) ส่งต่อตรง"""
+
+    def __init__(self, worksheet, governor):
+        self._target = worksheet
+        self._governor = governor
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        kind = _kind(name)
+        if kind is None or not callable(attr):
+            return attr
+
+        def governed(*args, **kwargs):
+            key = None
+            if kind == "read":
+                key = (id(self._target), name, repr(args), repr(sorted(kwargs.items())))
+            return self._wrap(self._governor.call(kind, lambda: attr(*args, **kwargs), key=key))
+
+        return governed
+
+    def _wrap(self, result):
+        return result
+
+
+class GovernedSpreadsheet(GovernedWorksheet):
+    """ครอบ gspread.Spreadsheet: worksheet() / worksheets() คืน worksheet ที่ครอบแล้ว"""
+
+    def _wrap(self, result):
+        if isinstance(result, list) and result and hasattr(result[0], "get_all_values"):
+            return [GovernedWorksheet(ws, self._governor) for ws in result]
+        if hasattr(result, "get_all_values"):
+            return GovernedWorksheet(result, self._governor)
+        return result
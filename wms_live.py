@@ -0,0 +1,159 @@
+"""สแกน Barcode ต่อเนื่องจากวิดีโอ: เฟรมจากกล้อง -> worker thread decode เฉพาะเฟรมที่สุ่มไว้ -> ตัดการอ่านซ้ำ -> คิว code ให้หน้าแอป
+
+ทดสอบกับเฟรมที่บันทึกไว้ได้ (โฟลเดอร์รูป หรือ GIF/TIFF หลายเฟรม):
+    python wms_live.py <โฟลเดอร์ หรือ ไฟล์> [--fps 15]
+"""
+import argparse
+import os
+import threading
+import time
+from collections import deque
+
+FRAME_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+
+class LiveScanner:
+    """feed(frame) ถูกเรียกจาก thread ของกล้อง (เช่น callback ของ streamlit-webrtc) และคืนค่าทันที
+
+    - เก็บแค่เฟรมล่าสุด 1 เฟรม worker decode ไม่เกิน max_fps เฟรม/วินาที เฟรมที่มาระหว่างนั้นถูกแทนที่ (ไม่ค้างคิว)
+    - code เดิมที่อ่านได้ซ้ำภายใน dedupe_sec วินาที (นับจากครั้งล่าสุดที่เห็น) ไม่ถูกส่งซ้ำ
+    - drain() คืน code ใหม่ทั้งหมด (เรียกจาก script ของ Streamlit แล้วเก็บลง session_state)
+    - worker หยุดเองเมื่อไม่มีเฟรมเข้ามา idle_sec วินาที และเริ่มใหม่เมื่อมีเฟรมถัดไป
+    """
+
+    def __init__(self, decode_frame, max_fps=8.0, dedupe_sec=2.0, idle_sec=30.0, history=20):
+        self.decode_frame = decode_frame
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.dedupe_sec = dedupe_sec
+        self.idle_sec = idle_sec
+        self.codes = deque(maxlen=history)
+        self.stats = {"frames": 0, "sampled": 0, "decoded": 0, "duplicates": 0, "errors": 0,
+                      "decode_ms": 0.0, "last_error": None}
+        self._cond = threading.Condition()
+        self._frame = None
+        self._busy = False
+        self._worker = None
+        self._last_seen = {}
+
+    def feed(self, frame):
+        with self._cond:
+            self.stats["frames"] += 1
+            self._frame = frame
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="wms-live-scan", daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+
+    def drain(self):
+        """code ที่อ่านได้ใหม่ตั้งแต่ครั้งก่อน (เรียงตามเวลา)"""
+        with self._cond:
+            out = [code for code, _ in self.codes]
+            self.codes.clear()
+        return out
+
+    def wait_idle(self, timeout=5.0):
+        # รอจนเฟรมที่ส่งมาแล้ว decode เสร็จหมด (ใช้ตอน replay / ทดสอบ)
+        end = time.monotonic() + timeout
+        with self._cond:
+            while self._frame is not None or self._busy:
+                left = end - time.monotonic()
+                if left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    def _run(self):
+        last = 0.0
+        while True:
+            with self._cond:
+                if self._frame is None and not self._cond.wait_for(lambda: self._frame is not None, self.idle_sec):
+                    self._worker = None
+                    return
+            # รอให้ครบรอบ sampling ก่อนหยิบเฟรม ระหว่างนี้เฟรมใหม่จะแทนที่เฟรมเก่า
+            wait = self.interval - (time.monotonic() - last)
+            if wait > 0:
+                time.sleep(wait)
+            with self._cond:
+                frame, self._frame = self._frame, None
+                self._busy = True
+            last = time.monotonic()
+            try:
+                result = self.decode_frame(frame)
+            except Exception as e:
+                result = None
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e)
+            with self._cond:
+                self.stats["sampled"] += 1
+                self.stats["decode_ms"] += (time.monotonic() - last) * 1000
+                if result and result.get("code"):
+                    self._emit(result["code"])
+                self._busy = False
+                self._cond.notify_all()
+
+    def _emit(self, code):
+        now = time.monotonic()
+        seen = self._last_seen.get(code)
+        self._last_seen[code] = now
+        if seen is not None and now - seen < self.dedupe_sec:
+            self.stats["duplicates"] += 1
+            return
+        self.stats["decoded"] += 1
+        self.codes.append((code, now))
+        # ลืม code ที่ไม่เห็นนานแล้ว (กัน dict โตไม่หยุด)
+        if len(self._last_seen) > 256:
+            self._last_seen = {c: t for c, t in self._last_seen.items() if now - t < self.dedupe_sec}
+
+
+def load_frames(path):
+    """เฟรมที่บันทึกไว้: โฟลเดอร์รูป (เรียงตามชื่อไฟล์) หรือไฟล์รูปหลายเฟรม (GIF / TIFF)"""
+    from PIL import Image, ImageSequence
+
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(FRAME_EXTS):
+                with Image.open(os.path.join(path, name)) as img:
+                    yield img.convert("L")
+        return
+    with Image.open(path) as img:
+        for frame in ImageSequence.Iterator(img):
+            yield frame.convert("L")
+
+
+def replay(scanner, frames, fps=15.0):
+    """ส่งเฟรมให้ scanner ตามจังหวะ fps เหมือนกล้องจริง แล้วคืน code ทั้งหมดที่อ่านได้"""
+    gap = 1.0 / fps if fps else 0.0
+    start = time.monotonic()
+    for i, frame in enumerate(frames):
+        wait = start + i * gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        scanner.feed(frame)
+    scanner.wait_idle()
+    return scanner.drain()
+
+
+def main(argv=None):
+    from wms_scan import BarcodeDecoder
+
+    parser = argparse.ArgumentParser(description="ทดสอบสแกนต่อเนื่องกับเฟรมที่บันทึกไว้")
+    parser.add_argument("path", help="โฟลเดอร์รูป หรือไฟล์ GIF / TIFF หลายเฟรม")
+    parser.add_argument("--fps", type=float, default=15.0, help="จังหวะส่งเฟรม (เหมือนกล้อง)")
+    parser.add_argument("--max-fps", type=float, default=8.0, help="decode ไม่เกินกี่เฟรม/วินาที")
+    parser.add_argument("--dedupe-sec", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    scanner = LiveScanner(BarcodeDecoder().decode_frame, max_fps=args.max_fps, dedupe_sec=args.dedupe_sec)
+    t0 = time.perf_counter()
+    codes = replay(scanner, load_frames(args.path), fps=args.fps)
+    stats = scanner.stats
+    print(f"{stats['frames']} เฟรม / decode {stats['sampled']} เฟรม "
+          f"({stats['decode_ms'] / max(1, stats['sampled']):.1f} ms/เฟรม) / ซ้ำ {stats['duplicates']} / "
+          f"error {stats['errors']} / {time.perf_counter() - t0:.1f} s")
+    for code in codes:
+        print(code)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
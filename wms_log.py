@@ -0,0 +1,201 @@
+"""เขียน Transaction_Log แบบ background โดยมี journal ใน SQLite กัน log หายตอนแอปล่ม"""
+import atexit
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from wms_governor import error_status
+
+
+class TransactionLogWriter:
+    """write() บันทึกลง journal (SQLite) แล้วคืนค่าทันที
+    thread เบื้องหลังจะส่ง log ที่ค้างอยู่ขึ้นชีตด้วย append_rows ครั้งละหลายแถว เมื่อ
+    - ค้างครบ flush_size แถว หรือ
+    - แถวที่เก่าที่สุดค้างนานเกิน flush_sec วินาที
+    แถวจะถูกลบออกจาก journal หลังส่งสำเร็จเท่านั้น ถ้าแอปล่มก่อนส่ง เปิดแอปใหม่จะส่งต่อให้เอง
+
+    append_rows ส่งซ้ำแล้วได้แถวซ้ำ: ถ้าส่งแล้ว error ที่ไม่ใช่ 429 (5xx / timeout อาจเขียนไปแล้ว)
+    จะจำเลขแถวสุดท้ายของ batch นั้นไว้ใน journal ก่อนส่งรอบถัดไปอ่านท้ายชีตด้วย tail_fn(n)
+    แถวที่อยู่ในชีตแล้วถูกลบออกจาก journal โดยไม่ส่งซ้ำ (tail_fn = None: ส่งซ้ำแบบเดิม)
+
+    on_flush(rows) ถูกเรียกหลังส่งแต่ละ batch สำเร็จ พร้อมแถวที่เพิ่งส่ง
+    """
+
+    def __init__(self, append_fn, journal_path, flush_size=50, flush_sec=3.0,
+                 max_batch=500, on_flush=None, tail_fn=None, tail_slack=200):
+        self.append_fn = append_fn
+        self.tail_fn = tail_fn
+        self.tail_slack = tail_slack
+        self.journal_path = journal_path
+        self.flush_size = flush_size
+        self.flush_sec = flush_sec
+        self.max_batch = max_batch
+        self.on_flush = on_flush
+        self._db_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._retry_at = 0.0
+        self._failures = 0
+        self._conn = sqlite3.connect(journal_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created REAL NOT NULL,"
+            " row TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.stats = {
+            "queued": 0,
+            "flushed": 0,
+            "api_calls": 0,
+            "errors": 0,
+            "deduped": 0,
+            "last_error": None,
+            "replayed": self.pending_count(),
+        }
+        self._thread = threading.Thread(target=self._run, name="wms-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- ฝั่งผู้ใช้ ----------
+    def write(self, row):
+        self.write_many([row])
+
+    def write_many(self, rows):
+        if not rows:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._conn.executemany(
+                "INSERT INTO pending (created, row) VALUES (?, ?)",
+                [(now, json.dumps(list(r), ensure_ascii=False, default=str)) for r in rows],
+            )
+        self.stats["queued"] += len(rows)
+        if self.pending_count() >= self.flush_size:
+            self._wake.set()
+
+    def pending_count(self):
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def flush(self):
+        """ส่งทุกแถวที่ค้างทันที (ใช้ตอนปิดแอป หรือก่อนงานที่ต้องอ่าน log ให้ครบ)"""
+        while self._flush_batch():
+            pass
+        return self.pending_count() == 0
+
+    @contextlib.contextmanager
+    def paused(self):
+        """หยุดส่ง log ขึ้นชีตชั่วคราว (เช่น ตอนย้าย log เก่าออก ที่ต้องอ้างเลขแถวระหว่างอ่านกับลบ)"""
+        with self._flush_lock:
+            yield
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    # ---------- background ----------
+    def _oldest_age(self):
+        with self._db_lock:
+            row = self._conn.execute("SELECT MIN(created) FROM pending").fetchone()
+        return None if row[0] is None else time.time() - row[0]
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(timeout=min(1.0, self.flush_sec))
+            self._wake.clear()
+            if self._stop.is_set() or time.monotonic() < self._retry_at:
+                continue
+            age = self._oldest_age()
+            if age is None:
+                continue
+            if age >= self.flush_sec or self.pending_count() >= self.flush_size:
+                try:
+                    self.flush()
+                except Exception:
+                    pass
+
+    def _flush_batch(self):
+        with self._flush_lock:
+            with self._db_lock:
+                batch = self._conn.execute(
+                    "SELECT id, row FROM pending ORDER BY id LIMIT ?", (self.max_batch,)
+                ).fetchall()
+            if not batch:
+                return False
+            sending = False
+            try:
+                if self._uncertain_upto() is not None and self.tail_fn:
+                    batch = self._skip_written(batch)
+                    if not batch:
+                        return True
+                sending = True
+                self.stats["api_calls"] += 1
+                rows = [json.loads(r) for _, r in batch]
+                self.append_fn(rows)
+            except Exception as e:
+                # เก็บไว้ใน journal แล้วลองใหม่แบบ backoff (2, 4, 8 ... สูงสุด 60 วินาที)
+                self._failures += 1
+                self._retry_at = time.monotonic() + min(60, 2 ** self._failures)
+                self.stats["errors"] += 1
+                self.stats["last_error"] = str(e)
+                if sending and error_status(e) != 429:
+                    self._set_uncertain(batch[-1][0])
+                raise
+            with self._db_lock:
+                self._conn.execute("DELETE FROM pending WHERE id <= ?", (batch[-1][0],))
+            self._failures = 0
+            self.stats["last_error"] = None
+            self.stats["flushed"] += len(batch)
+            if self.on_flush:
+                self.on_flush(rows)
+            return True
+
+    # ---------- กันแถวซ้ำหลังส่งแล้ว error ----------
+    def _uncertain_upto(self):
+        with self._db_lock:
+            row = self._conn.execute("SELECT value FROM state WHERE key = 'uncertain_upto'").fetchone()
+        return None if row is None else row[0]
+
+    def _set_uncertain(self, last_id):
+        with self._db_lock:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('uncertain_upto', ?)", (last_id,))
+
+    def _skip_written(self, batch):
+        """ตัดแถวของ batch ที่ไม่แน่ใจว่าส่งแล้วหรือยัง ที่เจอในท้ายชีต ออกจาก journal คืนแถวที่ยังต้องส่ง
+
+        เทียบแบบนับจำนวน (แถวเหมือนกัน 2 แถวใน journal ต้องเจอ 2 แถวในชีต) ค่าเทียบเป็น string เพราะชีตคืนค่าเป็น string
+        """
+        upto = self._uncertain_upto()
+        head = [(i, r) for i, r in batch if i <= upto]
+        have = Counter(_row_key(r) for r in self.tail_fn(len(head) + self.tail_slack) if r)
+        written = set()
+        for i, r in head:
+            key = _row_key(json.loads(r))
+            if have[key] > 0:
+                have[key] -= 1
+                written.add(i)
+        with self._db_lock:
+            if written:
+                self._conn.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in written])
+            self._conn.execute("DELETE FROM state WHERE key = 'uncertain_upto'")
+        self.stats["deduped"] += len(written)
+        return [b for b in batch if b[0] not in written]
+
+
+def _row_key(row):
+    # ชีตตัด cell ว่างท้ายแถว และคืนตัวเลขเป็น string
+    values = [str(v) for v in row]
+    while values and values[-1] == "":
+        values.pop()
+    return tuple(values)
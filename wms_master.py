@@ -0,0 +1,173 @@
+"""Index ของ Master Data (Item_Master) ที่แชร์กันทั้ง process และอ่านใหม่เฉพาะตอนชีตถูกแก้"""
+import bisect
+import threading
+import time
+
+from wms_schema import parse_rows
+from wms_storage import TABLE_ITEM_MASTER
+
+
+class ItemMasterIndex:
+    """Barcode -> record แบบ O(1) พร้อม index รอง (Category, ค้นหาชื่อด้วยคำขึ้นต้น)
+
+    - sync() เช็ค table.revision() ไม่เกินทุก poll_sec วินาที และอ่านใหม่เฉพาะเมื่อ revision เปลี่ยน
+    - add_local() / update_local() ใช้หลังแอปเขียนชีตเอง ให้ index เห็นข้อมูลใหม่ทันทีโดยไม่ต้องอ่านซ้ำ
+      แล้วจำ revision หลังการเขียนนั้นไว้ sync() ข้ามการอ่านใหม่เฉพาะ revision นั้นพอดี
+      (มีคนแก้ชีตหลังจากนั้น revision เปลี่ยนอีก -> อ่านใหม่ตามปกติ)
+    """
+
+    def __init__(self, table, poll_sec=10.0, key_col="Barcode", name_col="Description", category_col="Category"):
+        self.table = table
+        self.poll_sec = poll_sec
+        self.key_col = key_col
+        self.name_col = name_col
+        self.category_col = category_col
+        self.lock = threading.RLock()
+        self.header = []
+        self.records = []
+        self.by_barcode = {}
+        self.rows_by_barcode = {}
+        self.by_category = {}
+        self._names = []
+        self.version = 0
+        self.revision = None
+        self.api_calls = 0
+        self._loaded = False
+        self._local_revision = None
+        self._last_poll = 0.0
+        self._frame = None
+        self._frame_version = -1
+        self.schema_report = None
+
+    # ---------- sync ----------
+    def sync(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            if not force and self._loaded:
+                if now - self._last_poll < self.poll_sec:
+                    return False
+                self._last_poll = now
+                try:
+                    self.api_calls += 1
+                    rev = self.table.revision()
+                except Exception:
+                    return False
+                if rev == self.revision:
+                    return False
+                if rev == self._local_revision:
+                    # revision ที่เกิดจากการเขียนของเราเอง index อัปเดตไปแล้ว
+                    self.revision = rev
+                    return False
+            else:
+                try:
+                    self.api_calls += 1
+                    rev = self.table.revision()
+                except Exception:
+                    rev = None
+            self.api_calls += 1
+            values = self.table.get_all_values()
+            self.header = [str(h).strip() for h in values[0]] if values else []
+            self.records = []
+            for row in values[1:]:
+                self.records.append(self._record(row))
+            self._rebuild()
+            self.revision = rev
+            self._loaded = True
+            self._local_revision = None
+            self._last_poll = now
+            return True
+
+    def _record(self, row):
+        row = [str(v) for v in row] + [""] * (len(self.header) - len(row))
+        return dict(zip(self.header, row))
+
+    def _rebuild(self):
+        self.by_barcode = {}
+        self.rows_by_barcode = {}
+        self.by_category = {}
+        names = [self._index(i, rec) for i, rec in enumerate(self.records)]
+        self._names = sorted(n for n in names if n)
+        self.version += 1
+
+    def _index(self, i, rec):
+        barcode = rec.get(self.key_col, "").strip()
+        if not barcode:
+            return None
+        # Barcode ซ้ำ: ใช้แถวแรกเป็นข้อมูลหลัก (เหมือนเดิมที่ใช้ iloc[0])
+        if barcode in self.by_barcode:
+            self.rows_by_barcode[barcode].append(i + 2)
+            return None
+        self.by_barcode[barcode] = rec
+        self.rows_by_barcode[barcode] = [i + 2]
+        self.by_category.setdefault(rec.get(self.category_col, "").strip(), []).append(barcode)
+        return rec.get(self.name_col, "").strip().lower(), barcode
+
+    # ---------- อ่าน ----------
+    def get(self, barcode):
+        with self.lock:
+            return self.by_barcode.get(str(barcode).strip())
+
+    def __contains__(self, barcode):
+        return self.get(barcode) is not None
+
+    def rows_of(self, barcode):
+        with self.lock:
+            return list(self.rows_by_barcode.get(str(barcode).strip(), ()))
+
+    def in_category(self, category):
+        with self.lock:
+            return [self.by_barcode[b] for b in self.by_category.get(str(category).strip(), ())]
+
+    def categories(self):
+        with self.lock:
+            return sorted(c for c in self.by_category if c)
+
+    def search_prefix(self, prefix, limit=20):
+        """ค้นหาสินค้าจากชื่อที่ขึ้นต้นด้วย prefix (ไม่สนตัวพิมพ์เล็ก/ใหญ่)"""
+        p = str(prefix).strip().lower()
+        if not p:
+            return []
+        with self.lock:
+            i = bisect.bisect_left(self._names, (p, ""))
+            out = []
+            while i < len(self._names) and self._names[i][0].startswith(p) and len(out) < limit:
+                out.append(self.by_barcode[self._names[i][1]])
+                i += 1
+            return out
+
+    def to_frame(self):
+        with self.lock:
+            if self._frame_version != self.version:
+                self._frame, self.schema_report = parse_rows([list(r.values()) for r in self.records],
+                                                             TABLE_ITEM_MASTER)
+                self._frame_version = self.version
+            return self._frame.copy()
+
+    # ---------- อัปเดตจากการเขียนของแอปเอง ----------
+    def add_local(self, values):
+        with self.lock:
+            rec = self._record(values)
+            self.records.append(rec)
+            name = self._index(len(self.records) - 1, rec)
+            if name:
+                bisect.insort(self._names, name)
+            self.version += 1
+            self._note_local_write()
+
+    def update_local(self, row_no, field, value):
+        with self.lock:
+            if 2 <= row_no < len(self.records) + 2:
+                self.records[row_no - 2][field] = str(value)
+                if field in (self.key_col, self.name_col, self.category_col):
+                    self._rebuild()
+                else:
+                    self.version += 1
+                self._note_local_write()
+
+    def _note_local_write(self):
+        # revision หลังการเขียนของเรา อ่านไม่ได้ = ไม่ข้าม (การเปลี่ยนครั้งถัดไปอ่านใหม่ทั้งชีต)
+        try:
+            self.api_calls += 1
+            self._local_revision = self.table.revision()
+        except Exception:
+            self._local_revision = None
@@ -0,0 +1,172 @@
+"""คิวอัปโหลดรูปสินค้าแบบ background: ย่อ/บีบอัดรูป -> อัปโหลด Drive -> แจ้งกลับเพื่อเติม Image_Link"""
+import hashlib
+import io
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def compress_photo(data, max_side=1280, quality=80):
+    # import ตอนบีบอัดรูปแรก (ใน thread อัปโหลด) ไม่ใช่ตอนเปิดแอป
+    from PIL import Image, ImageOps
+
+    img = Image.open(io.BytesIO(data))
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((max_side, max_side))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+class PhotoUploadQueue:
+    """submit() คืนค่าทันที งานจริง (บีบอัด + อัปโหลด) ทำใน thread pool
+
+    - upload_fn(data, filename) -> file_id  (ถูกเรียกทีละงาน เพราะใช้ Drive client ตัวเดียวกัน)
+    - on_done(key, file_id) ถูกเรียกเมื่ออัปโหลดเสร็จ (เช่น เติม Image_Link ใน Item_Master)
+    - on_failed(key, hash) ถูกเรียกเมื่อลองครบ max_attempts แล้วยังไม่สำเร็จ (เช่น เขียน UPLOAD_FAILED:<hash> ลงชีต)
+    - รูปที่ hash เหมือนกันจะอัปโหลดครั้งเดียว งานถัดไปใช้ file_id เดิม
+    - journal_path: เก็บรูปที่ยังไม่เสร็จไว้ใน SQLite (แบบ wms_log) ลบออกเมื่อเสร็จ resume() ส่งต่อหลังเปิดแอปใหม่
+      งานที่ล้มเหลวยังอยู่ใน journal จนกว่า retry_failed() / resume() จะส่งสำเร็จ
+    """
+
+    def __init__(self, upload_fn, on_done=None, on_failed=None, journal_path=None, max_side=1280, quality=80,
+                 workers=2, history=50, max_attempts=4, retry_sec=5.0):
+        self.upload_fn = upload_fn
+        self.on_done = on_done
+        self.on_failed = on_failed
+        self.max_side = max_side
+        self.quality = quality
+        self.history = history
+        self.max_attempts = max_attempts
+        self.retry_sec = retry_sec
+        self.jobs = OrderedDict()
+        self.stats = {"submitted": 0, "uploaded": 0, "deduped": 0, "failed": 0, "retried": 0,
+                      "bytes_in": 0, "bytes_out": 0}
+        self._uploads = {}
+        self._lock = threading.Lock()
+        self._upload_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wms-photo")
+        self._conn = None
+        if journal_path:
+            self._conn = sqlite3.connect(journal_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS photos ("
+                " key TEXT PRIMARY KEY,"
+                " filename TEXT NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " data BLOB NOT NULL,"
+                " submitted REAL NOT NULL)"
+            )
+
+    def submit(self, key, data, filename):
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        if self._conn is not None:
+            # key เดิม (Barcode เดิม) ถูกแทนด้วยรูปล่าสุด
+            with self._db_lock:
+                self._conn.execute("INSERT OR REPLACE INTO photos (key, filename, hash, data, submitted) "
+                                   "VALUES (?, ?, ?, ?, ?)", (key, filename, digest, data, now))
+        with self._lock:
+            self.stats["submitted"] += 1
+        return self._enqueue(key, data, filename, digest, now)
+
+    def resume(self):
+        """ส่งงานที่ค้างใน journal (แอปล่ม / ปิดก่อนอัปโหลดเสร็จ) คืนจำนวนงาน"""
+        for key, filename, digest, data, submitted in self._journal():
+            if key not in self.jobs:
+                self._enqueue(key, data, filename, digest, submitted)
+        return len(self.pending())
+
+    def retry_failed(self):
+        """ส่งงานที่ลองครบแล้วยังล้มเหลวอีกรอบ (ต้องมี journal เพราะไม่ได้เก็บรูปไว้ใน memory) คืนจำนวนงาน"""
+        with self._lock:
+            failed = {k for k, j in self.jobs.items() if j["status"] == "failed"}
+        rows = [r for r in self._journal() if r[0] in failed]
+        for key, filename, digest, data, submitted in rows:
+            self._enqueue(key, data, filename, digest, submitted)
+        return len(rows)
+
+    def pending(self):
+        with self._lock:
+            return [j for j in self.jobs.values() if j["status"] in ("queued", "retrying")]
+
+    def _journal(self):
+        if self._conn is None:
+            return []
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT key, filename, hash, data, submitted FROM photos ORDER BY submitted").fetchall()
+
+    def _enqueue(self, key, data, filename, digest, submitted):
+        with self._lock:
+            job = {"key": key, "filename": filename, "hash": digest, "status": "queued", "attempts": 0,
+                   "file_id": None, "error": None, "submitted": submitted, "finished": None}
+            self.jobs[key] = job
+            self.jobs.move_to_end(key)
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+        self._start(job, data)
+        return job
+
+    def _start(self, job, data):
+        with self._lock:
+            future = self._uploads.get(job["hash"])
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._pool.submit(self._upload, data, job["filename"])
+                self._uploads[job["hash"]] = future
+            else:
+                self.stats["deduped"] += 1
+        future.add_done_callback(lambda f: self._finish(job, data, f))
+
+    def _upload(self, data, filename):
+        small = compress_photo(data, self.max_side, self.quality)
+        with self._lock:
+            self.stats["bytes_in"] += len(data)
+            self.stats["bytes_out"] += len(small)
+        with self._upload_lock:
+            file_id = self.upload_fn(small, filename)
+        with self._lock:
+            self.stats["uploaded"] += 1
+        return file_id
+
+    def _finish(self, job, data, future):
+        try:
+            file_id = future.result()
+            if self.on_done:
+                self.on_done(job["key"], file_id)
+        except Exception as e:
+            with self._lock:
+                job["attempts"] += 1
+                job["error"] = str(e)
+                self.stats["failed"] += 1
+                retry = job["attempts"] < self.max_attempts
+                job["status"] = "retrying" if retry else "failed"
+                job["finished"] = time.time()
+            if retry:
+                # ลองใหม่แบบ backoff (retry_sec, x2, x4, ...) ถ้า upload สำเร็จแล้วแต่ on_done ล้ม จะใช้ file_id เดิม
+                with self._lock:
+                    self.stats["retried"] += 1
+                timer = threading.Timer(self.retry_sec * 2 ** (job["attempts"] - 1), self._start, (job, data))
+                timer.daemon = True
+                timer.start()
+            elif self.on_failed:
+                try:
+                    self.on_failed(job["key"], job["hash"])
+                except Exception:
+                    pass
+            return
+        with self._lock:
+            job["file_id"] = file_id
+            job["status"] = "done"
+            job["error"] = None
+            job["finished"] = time.time()
+        if self._conn is not None:
+            # ลบเฉพาะรูปนี้ (ถ้ามีรูปใหม่ของ key เดียวกันเข้ามาแล้ว ให้แถวใหม่อยู่ต่อ)
+            with self._db_lock:
+                self._conn.execute("DELETE FROM photos WHERE key = ? AND hash = ?", (job["key"], job["hash"]))
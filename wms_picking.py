@@ -0,0 +1,180 @@
+"""หยิบสินค้าตาม Order: จัดสรร stock ให้แต่ละ Order -> แบ่ง Batch -> เรียงจุดหยิบตามพิกัด Location (ลดระยะเดิน)"""
+import re
+
+import pandas as pd
+
+ORDER_COLUMNS = ["Order_ID", "Item_ID", "Qty"]
+PICK_COLUMNS = ["Order_ID", "Item_ID", "Item_Name", "Location", "Qty"]
+STOP_COLUMNS = ["Stop", "Location", "Item_ID", "Item_Name", "Qty", "Orders"]
+
+# Location ที่ไม่ใช่ที่เก็บของพร้อมหยิบ
+NON_PICKABLE = {"DOCK_IN", "OUT"}
+# ของรอ Put Away / ของที่หยิบแล้วรอส่งในช่อง Staging
+NON_PICKABLE_STATUS = {"Pending Putaway", "Staged"}
+
+
+def _natural(value):
+    # "R10" ต้องมาหลัง "R9": แยกตัวเลขออกมาเทียบเป็นจำนวน (ตัวเลขมาก่อนตัวอักษรเสมอ)
+    return tuple((0, int(p), "") if p.isdigit() else (1, 0, p)
+                 for p in re.split(r"(\d+)", str(value).strip().upper()) if p)
+
+
+def parse_location_id(loc_id):
+    """เดาพิกัดจากรหัส Location เช่น "A-01-2" / "A01-02" -> (Zone, Rack, Level)"""
+    parts = [p for p in re.split(r"[-_./ ]+", str(loc_id).strip()) if p]
+    if len(parts) == 1:
+        m = re.match(r"^([A-Za-z]+)(\d*)$", parts[0])
+        parts = [m.group(1), m.group(2)] if m else parts
+    parts += [""] * (3 - len(parts))
+    return parts[0], parts[1], parts[2]
+
+
+def location_coords(values):
+    """ตาราง Location_Master (get_all_values) -> DataFrame[Location, Zone, Rack, Level]
+
+    หา column จากชื่อ header (ไม่สนตัวพิมพ์) ถ้าไม่มีหรือค่าว่างจะเดาจากรหัส Location แทน
+    """
+    if not values or len(values) < 2:
+        return pd.DataFrame(columns=["Location", "Zone", "Rack", "Level"])
+    header = [str(h).strip().lower() for h in values[0]]
+
+    def col(*names):
+        for n in names:
+            if n in header:
+                return header.index(n)
+        return None
+
+    c_loc = col("location_id", "location")
+    c_loc = 0 if c_loc is None else c_loc
+    cols = {"Zone": col("zone"), "Rack": col("rack", "aisle"), "Level": col("level", "shelf")}
+    out = []
+    for row in values[1:]:
+        loc = str(row[c_loc]).strip() if len(row) > c_loc else ""
+        if not loc:
+            continue
+        guess = parse_location_id(loc)
+        rec = {"Location": loc}
+        for i, (name, c) in enumerate(cols.items()):
+            v = str(row[c]).strip() if c is not None and len(row) > c else ""
+            rec[name] = v or guess[i]
+        out.append(rec)
+    return pd.DataFrame(out, columns=["Location", "Zone", "Rack", "Level"]).drop_duplicates("Location")
+
+
+def load_orders(df):
+    """Order จาก CSV / ชีต Orders -> DataFrame[Order_ID, Item_ID, Qty] (รวมบรรทัดซ้ำ, ตัด Qty <= 0)
+
+    ลำดับของ Order คงตามไฟล์ (Order ที่มาก่อนได้ของก่อน)
+    """
+    missing = [c for c in ORDER_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"ไฟล์ Order ขาด column: {', '.join(missing)}")
+    orders = df[ORDER_COLUMNS].copy()
+    orders["Order_ID"] = orders["Order_ID"].astype(str).str.strip()
+    orders["Item_ID"] = orders["Item_ID"].astype(str).str.strip()
+    orders["Qty"] = pd.to_numeric(orders["Qty"], errors="coerce").fillna(0).astype("int64")
+    orders = orders[(orders["Qty"] > 0) & (orders["Order_ID"] != "") & (orders["Item_ID"] != "")]
+    return orders.groupby(["Order_ID", "Item_ID"], as_index=False, sort=False)["Qty"].sum()
+
+
+def allocate_orders(orders, df, loc_map):
+    """จัดสรร stock ให้ทุก Order ในรอบเดียว คืนค่า (picks, shortages)
+
+    - หยิบจาก PICK location ก่อน แล้วค่อย Location อื่น (ยกเว้น DOCK_IN / ของรอ Put Away / ของใน Staging)
+    - ภายในกลุ่มเดียวกัน ของเก่า (Time น้อย) ออกก่อน
+    - จับคู่ด้วยช่วงสะสมของ demand / supply ต่อสินค้า เหมือน wms_replen ไม่จ่ายเกินที่มี
+    - Order ที่ของไม่พอแม้บรรทัดเดียวจะถูกพักไว้ทั้ง Order (ไม่หยิบบางส่วน) และไม่กันของของ Order อื่น
+    """
+    picks, shortages = _allocate(orders, df, loc_map)
+    if shortages.empty:
+        return picks, shortages
+    # ตัด Order ที่ขาดออกแล้วจัดสรรใหม่: demand ลดลงอย่างเดียว จึงไม่มี Order ใหม่ขาดเพิ่ม
+    held = set(shortages["Order_ID"])
+    picks, _ = _allocate(orders[~orders["Order_ID"].isin(held)], df, loc_map)
+    return picks, shortages
+
+
+def _allocate(orders, df, loc_map):
+    stock = df[["Item_ID", "Item_Name", "Qty", "Location", "Status", "Time"]].copy()
+    stock["Item_ID"] = stock["Item_ID"].astype(str)
+    stock["Location"] = stock["Location"].astype(str)
+    stock["Qty"] = pd.to_numeric(stock["Qty"], errors="coerce").fillna(0).astype("int64")
+    stock["Time"] = pd.to_datetime(stock["Time"], errors="coerce")
+    stock = stock[(stock["Qty"] > 0) & ~stock["Location"].isin(NON_PICKABLE)
+                  & ~stock["Status"].astype(str).isin(NON_PICKABLE_STATUS)
+                  & stock["Item_ID"].isin(orders["Item_ID"])]
+
+    supply = (stock.groupby(["Item_ID", "Location"], as_index=False, sort=False)
+                   .agg(Item_Name=("Item_Name", "first"), Avail=("Qty", "sum"), Src_Time=("Time", "min")))
+    supply["Rank"] = (supply["Location"].map(loc_map) != "PICK").astype(int)
+    supply = supply.sort_values(["Item_ID", "Rank", "Src_Time", "Location"], kind="stable", na_position="last")
+    supply["S_End"] = supply.groupby("Item_ID")["Avail"].cumsum()
+    supply["S_Start"] = supply["S_End"] - supply["Avail"]
+
+    demand = orders.copy()
+    demand["D_End"] = demand.groupby("Item_ID")["Qty"].cumsum()
+    demand["D_Start"] = demand["D_End"] - demand["Qty"]
+
+    pairs = demand.merge(supply, on="Item_ID", how="inner")
+    pairs["Alloc"] = pairs[["D_End", "S_End"]].min(axis=1) - pairs[["D_Start", "S_Start"]].max(axis=1)
+    pairs = pairs[pairs["Alloc"] > 0]
+    picks = pd.DataFrame({
+        "Order_ID": pairs["Order_ID"], "Item_ID": pairs["Item_ID"], "Item_Name": pairs["Item_Name"],
+        "Location": pairs["Location"], "Qty": pairs["Alloc"].astype("int64"),
+    }, columns=PICK_COLUMNS).reset_index(drop=True)
+
+    got = picks.groupby(["Order_ID", "Item_ID"])["Qty"].sum()
+    short = orders.set_index(["Order_ID", "Item_ID"])
+    short["Picked"] = got.reindex(short.index).fillna(0).astype("int64").values
+    short = short[short["Picked"] < short["Qty"]].reset_index()
+    shortages = pd.DataFrame({
+        "Order_ID": short["Order_ID"], "Item_ID": short["Item_ID"],
+        "Qty": short["Qty"], "Short": short["Qty"] - short["Picked"],
+    })
+    return picks, shortages
+
+
+def make_batches(orders, orders_per_batch=10):
+    """Order_ID -> เลข Batch (1, 2, ...) ตามลำดับ Order ในไฟล์"""
+    ids = pd.unique(orders["Order_ID"])
+    size = max(1, int(orders_per_batch))
+    return {oid: i // size + 1 for i, oid in enumerate(ids)}
+
+
+def pick_path(picks, coords):
+    """รวมจุดหยิบของทั้ง Batch แล้วเรียงเส้นทางเดินแบบงู (serpentine)
+
+    Zone เรียงจากน้อยไปมาก, Rack เดินไปข้างหน้าใน Zone คี่ และย้อนกลับใน Zone คู่
+    ภายใน Rack เดียวกันไล่ Level จากล่างขึ้นบน, Location ที่ไม่มีใน Master ไปอยู่ท้ายสุด
+    """
+    if picks.empty:
+        return pd.DataFrame(columns=STOP_COLUMNS)
+    stops = (picks.groupby(["Location", "Item_ID"], as_index=False, sort=False)
+                  .agg(Item_Name=("Item_Name", "first"), Qty=("Qty", "sum"),
+                       Orders=("Order_ID", lambda s: ", ".join(dict.fromkeys(s)))))
+    known = coords.set_index("Location") if not coords.empty else None
+    keys = []
+    for loc in stops["Location"]:
+        if known is not None and loc in known.index:
+            z, r, lv = known.loc[loc, ["Zone", "Rack", "Level"]]
+            keys.append((0, _natural(z), _natural(r), _natural(lv)))
+        else:
+            z, r, lv = parse_location_id(loc)
+            keys.append((1, _natural(z), _natural(r), _natural(lv)))
+    zone_no = {z: i for i, z in enumerate(sorted({k[:2] for k in keys}))}
+    rack_no = {r: i for i, r in enumerate(sorted({k[2] for k in keys}))}
+    stops["_key"] = [(k[0], zone_no[k[:2]], rack_no[k[2]] if zone_no[k[:2]] % 2 == 0 else -rack_no[k[2]], k[3])
+                     for k in keys]
+    stops = stops.iloc[sorted(range(len(stops)), key=lambda i: stops["_key"].iat[i])].drop(columns="_key")
+    stops.insert(0, "Stop", range(1, len(stops) + 1))
+    return stops.reset_index(drop=True)
+
+
+def add_picks_to_mutation(mut, picks, lane, status="Staged"):
+    # ตัด stock ต้นทางรวมต่อ (สินค้า, Location) ครั้งเดียว แล้วพักของในช่อง Staging แยกแถวตาม Order
+    for (item_id, loc), qty in picks.groupby(["Item_ID", "Location"], sort=False)["Qty"].sum().items():
+        mut.decrement(item_id, loc, int(qty))
+    for p in picks.itertuples(index=False):
+        mut.increment(p.Item_ID, lane, int(p.Qty), item_name=p.Item_Name, status=status, container=p.Order_ID)
+        mut.log("PICKING", p.Item_ID, int(p.Qty), p.Location, lane)
+    return mut
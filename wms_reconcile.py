@@ -0,0 +1,246 @@
+"""สร้างยอด Stock ใหม่จาก Transaction_Log (event replay) แล้วเทียบกับ Current_Stock ราย Item / Location
+
+ทุกขั้นเป็น group-by ทั้งก้อน (ไม่วนทีละแถว) และเก็บ checkpoint ไว้ในเครื่อง: รอบถัดไป replay เฉพาะ log ที่ใหม่กว่า checkpoint
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from wms_archive import LOG_COLUMNS
+from wms_schema import TS_FORMAT, parse_rows
+from wms_storage import TABLE_LOG
+
+LEDGER_COLUMNS = ["Item_ID", "Location", "Qty"]
+DIFF_COLUMNS = ["Item_ID", "Location", "Stock", "Log", "Diff"]
+
+# Action -> (ตัดจาก From_Loc, เพิ่มที่ To_Loc)
+# RECEIVE: From_Loc เป็น "-" หรือเลข Container (ไม่ใช่ช่องในคลัง) / SHIP_OUT: To_Loc เป็นเลข Shipment
+ACTION_LEGS = {
+    "RECEIVE": (False, True),
+    "PUT_AWAY": (True, True),
+    "REPLENISH": (True, True),
+    "PICKING": (True, True),
+    "SHIP_OUT": (True, False),
+}
+# To_Loc ที่หมายถึงของออกจากคลัง (log PICKING รุ่นแรกใช้ "OUT" แทนช่อง Staging)
+OUTBOUND_LOCS = {"OUT"}
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def empty_ledger():
+    return pd.DataFrame({"Item_ID": pd.Series(dtype=str), "Location": pd.Series(dtype=str),
+                         "Qty": pd.Series(dtype="int64")})
+
+
+def log_frame(values, since=None):
+    """ค่าจาก get_all_values() ของ Transaction_Log (แถวแรกเป็น header) -> DataFrame[LOG_COLUMNS] ตาม schema (wms_schema)
+
+    since: ตัดแถวที่ Timestamp < since ออกก่อนสร้าง DataFrame (เทียบเป็น string เพราะรูปแบบเวลาเรียงตามตัวอักษรได้)
+    แถวที่อ่านเวลาไม่ได้เก็บไว้เสมอ
+    """
+    body = values[1:]
+    if since is not None and body:
+        ts = pd.Series([r[0] if r else "" for r in body], dtype=object)
+        old = (ts.str.len() == 19) & (ts < since.strftime(TS_FORMAT))
+        body = [body[i] for i in (~old).to_numpy().nonzero()[0]]
+    df, _ = parse_rows(body, TABLE_LOG)
+    if since is not None:
+        df = df[df["Timestamp"].isna() | (df["Timestamp"] >= since)].reset_index(drop=True)
+    return df
+
+
+def replay(events, opening=None):
+    """เล่น log ตามลำดับแถวทับยอดตั้งต้น (opening = ledger จาก checkpoint) คืนค่า (ledger, info)
+
+    - 1 event -> ขาออก (-Qty ที่ From_Loc) และ/หรือ ขาเข้า (+Qty ที่ To_Loc) ตาม ACTION_LEGS แล้ว group-by รวมยอด
+    - Qty = "All" (PUT_AWAY รุ่นแรก ย้ายทั้งแถว) = ยอดคงเหลือของ (Item, From_Loc) ณ ตอนนั้น ดู _resolve_all()
+      ตอนนั้นแอปย้ายแค่แถวแรกที่เจอ ถ้ามีหลายแถวของ Item เดียวกันใน DOCK_IN ยอดจาก log จะย้ายมากกว่าที่ย้ายจริง
+    - info: events / skipped (Action ไม่รู้จัก, Qty อ่านไม่ได้) / unresolved (All ที่หายอดไม่ได้ นับเป็น 0)
+    """
+    ev = events.reset_index(drop=True)
+    action = ev["Action"].astype(str).str.strip().str.upper()
+    item = ev["Item_ID"].astype(str).str.strip()
+    raw = ev["Qty"].astype(str).str.strip()
+    qty = pd.to_numeric(raw, errors="coerce")
+    frm = ev["From_Loc"].astype(str).str.strip()
+    to = ev["To_Loc"].astype(str).str.strip()
+
+    out_actions = [a for a, (o, _) in ACTION_LEGS.items() if o]
+    in_actions = [a for a, (_, i) in ACTION_LEGS.items() if i]
+    is_all = (raw.str.upper() == "ALL") & action.isin(out_actions)
+    ok = action.isin(list(ACTION_LEGS)) & (item != "") & (qty.notna() | is_all)
+    out_leg = ok & action.isin(out_actions) & (frm != "")
+    in_leg = ok & action.isin(in_actions) & (to != "") & ~to.str.upper().isin(OUTBOUND_LOCS)
+
+    seq = pd.Series(range(len(ev)), dtype="int64")
+    parts = []
+    if opening is not None and len(opening):
+        parts.append(pd.DataFrame({
+            "Order": -1, "Event": -1, "Item_ID": opening["Item_ID"].astype(str).values,
+            "Location": opening["Location"].astype(str).values,
+            "Delta": pd.to_numeric(opening["Qty"], errors="coerce").fillna(0).astype(float).values,
+            "Out": False, "All": False}))
+    parts.append(pd.DataFrame({"Order": seq[out_leg] * 2, "Event": seq[out_leg], "Item_ID": item[out_leg],
+                               "Location": frm[out_leg], "Delta": -qty[out_leg], "Out": True,
+                               "All": is_all[out_leg]}))
+    parts.append(pd.DataFrame({"Order": seq[in_leg] * 2 + 1, "Event": seq[in_leg], "Item_ID": item[in_leg],
+                               "Location": to[in_leg], "Delta": qty[in_leg], "Out": False,
+                               "All": is_all[in_leg]}))
+    legs = pd.concat(parts, ignore_index=True).sort_values("Order", kind="stable").reset_index(drop=True)
+
+    unresolved = _resolve_all(legs) if legs["Delta"].isna().any() else 0
+    ledger = (legs.groupby(["Item_ID", "Location"], sort=False)["Delta"].sum()
+                  .round().astype("int64").rename("Qty").reset_index())
+    ledger = ledger[ledger["Qty"] != 0].reset_index(drop=True)
+    info = {"events": len(ev), "skipped": int((~ok).sum()), "unresolved": unresolved}
+    return ledger[LEDGER_COLUMNS], info
+
+
+def _resolve_all(legs):
+    """เติม Delta ของ event "All" (แก้ legs ตรงๆ) คืนจำนวน event ที่ยังหายอดไม่ได้
+
+    หลัง All ยอดของ (Item, From_Loc) เหลือ 0 ยอดของ All ตัวถัดไปจึง = ผลรวมขาที่อยู่ระหว่าง All สองตัวนั้น
+    ทำได้ทั้งก้อนด้วย cumsum / group-by ยกเว้นช่วงที่มีขาเข้าจาก All อื่นที่ยังไม่รู้ยอด (ย้าย All ต่อกันหลายทอด)
+    ซึ่งจะได้ยอดในรอบถัดไป
+    """
+    key = legs.groupby(["Item_ID", "Location"], sort=False).ngroup()
+    while True:
+        pending = legs["Delta"].isna()
+        if not pending.any():
+            return 0
+        sub = legs[key.isin(key[pending].unique())]
+        k = key[sub.index]
+        all_out = sub["All"] & sub["Out"]
+        # ช่วงของแต่ละ All-out = ขาตั้งแต่ All-out ตัวก่อนหน้า (ของ key เดียวกัน) จนถึงตัวมันเอง
+        segment = all_out.astype("int64").groupby(k).cumsum() - all_out.astype("int64")
+        by = [k, segment]
+        known = sub["Delta"].where(~all_out, 0).fillna(0)
+        balance = known.groupby(by).transform("sum")
+        blocked = (sub["Delta"].isna() & ~all_out).astype("int64").groupby(by).transform("sum")
+        ready = all_out & sub["Delta"].isna() & (blocked == 0)
+        if not ready.any():
+            return int(legs.loc[pending & legs["Out"], "Event"].nunique())
+        amount = balance[ready].clip(lower=0)
+        legs.loc[amount.index, "Delta"] = -amount
+        moved = pd.Series(amount.values, index=legs.loc[amount.index, "Event"].values)
+        dest = legs["Delta"].isna() & ~legs["Out"] & legs["Event"].isin(moved.index)
+        legs.loc[dest, "Delta"] = legs.loc[dest, "Event"].map(moved)
+
+
+def compare_stock(ledger, stock_df):
+    """เทียบยอดจาก log กับ Current_Stock ราย (Item_ID, Location) คืนเฉพาะที่ไม่ตรง เรียงจากต่างมากไปน้อย"""
+    if stock_df is None or stock_df.empty:
+        stock = pd.Series(dtype="int64", name="Stock",
+                          index=pd.MultiIndex.from_tuples([], names=["Item_ID", "Location"]))
+    else:
+        s = stock_df.assign(Item_ID=stock_df["Item_ID"].astype(str).str.strip(),
+                            Location=stock_df["Location"].astype(str).str.strip(),
+                            Qty=pd.to_numeric(stock_df["Qty"], errors="coerce").fillna(0))
+        stock = s.groupby(["Item_ID", "Location"])["Qty"].sum().rename("Stock")
+    log = ledger.set_index(["Item_ID", "Location"])["Qty"].rename("Log")
+    out = pd.concat([stock, log], axis=1).fillna(0).astype("int64")
+    out["Diff"] = out["Stock"] - out["Log"]
+    out = out[out["Diff"] != 0]
+    out = out.iloc[out["Diff"].abs().argsort(kind="stable")[::-1]]
+    return out.rename_axis(["Item_ID", "Location"]).reset_index()[DIFF_COLUMNS]
+
+
+class StockReconciler:
+    """root/checkpoint.json + root/ledger-<watermark>.parquet
+
+    - checkpoint = ยอดจาก log ทุกแถวที่ Timestamp < watermark
+    - rebuild() อ่านเฉพาะ log ที่ Timestamp >= watermark (archive อ่านเฉพาะ partition ที่เกี่ยวข้อง + log สดในชีต)
+      แล้วเลื่อน watermark ไปที่ (ตอนนี้ - lag_sec): log ที่ยังค้างส่งจากเครื่องอื่นและเวลาเก่ากว่า lag_sec จะตกหล่น
+    - log ที่อ่านเวลาไม่ได้ไม่เข้า checkpoint (replay ใหม่ทุกรอบ)
+    - เขียน ledger ไฟล์ใหม่ก่อนแล้วค่อยสลับ checkpoint.json: ถ้าล่มกลางทาง checkpoint เดิมยังใช้ได้
+    """
+
+    def __init__(self, root, lag_sec=600):
+        self.root = root
+        self.lag_sec = lag_sec
+        self.stats = {"runs": 0, "last_run": None, "last_ms": None}
+
+    # ---------- checkpoint ----------
+    def checkpoint(self):
+        """meta ของ checkpoint ล่าสุด (watermark / events / created / ledger) หรือ None"""
+        path = os.path.join(self.root, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self):
+        meta = self.checkpoint()
+        if meta is None:
+            return empty_ledger(), None
+        ledger = pd.read_parquet(os.path.join(self.root, meta["ledger"]))
+        return ledger[LEDGER_COLUMNS], meta
+
+    def save(self, ledger, watermark, events, source="log"):
+        os.makedirs(self.root, exist_ok=True)
+        name = f"ledger-{watermark.strftime('%Y%m%d%H%M%S')}.parquet"
+        tmp = os.path.join(self.root, name + ".tmp")
+        ledger[LEDGER_COLUMNS].to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(self.root, name))
+        meta = {"watermark": watermark.strftime(TS_FORMAT), "events": int(events), "source": source,
+                "rows": len(ledger), "ledger": name, "created": datetime.now().strftime(TS_FORMAT)}
+        tmp = os.path.join(self.root, CHECKPOINT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.root, CHECKPOINT_FILE))
+        for f in os.listdir(self.root):
+            if f.startswith("ledger-") and f != name:
+                os.remove(os.path.join(self.root, f))
+        return meta
+
+    def reset(self, stock_df, writer=None, now=None):
+        """ตั้ง Current_Stock ปัจจุบันเป็นยอดตั้งต้น (เช่น หลังนับสต็อกจริง) log ก่อนหน้านี้ไม่ถูกนับอีก"""
+        if writer is not None:
+            writer.flush()
+        ledger = empty_ledger()
+        if stock_df is not None and not stock_df.empty:
+            ledger = compare_stock(empty_ledger(), stock_df).rename(columns={"Stock": "Qty"})[LEDGER_COLUMNS]
+        return self.save(ledger, pd.Timestamp(now or datetime.now()).floor("s"), 0, source="stock")
+
+    # ---------- replay ----------
+    def rebuild(self, table, archive=None, writer=None, full=False, now=None):
+        """ยอด Stock จาก log คืนค่า (ledger, info) full=True ไม่ใช้ checkpoint (replay log ทั้งหมด)"""
+        t0 = time.perf_counter()
+        if writer is not None:
+            writer.flush()
+        opening, meta = (empty_ledger(), None) if full else self.load()
+        watermark = pd.Timestamp(meta["watermark"]) if meta else None
+
+        frames = []
+        if archive is not None:
+            old = archive.query(start=watermark, columns=LOG_COLUMNS)
+            if len(old):
+                frames.append(old)
+        frames.append(log_frame(table.get_all_values(), since=watermark))
+        # log หลาย shard (หลาย Spreadsheet) ต่อกันเป็นช่วงๆ เรียงตามเวลาก่อน replay (เวลาเท่ากันคงลำดับเดิม)
+        events = pd.concat(frames, ignore_index=True).sort_values("Timestamp", kind="stable", na_position="last")
+
+        # ส่วนที่เก่ากว่า cutoff เข้า checkpoint ใหม่ ที่เหลือ replay ทับอีกที (ไม่เก็บ)
+        cutoff = pd.Timestamp(now or datetime.now()).floor("s") - pd.Timedelta(seconds=self.lag_sec)
+        if watermark is not None:
+            cutoff = max(cutoff, watermark)
+        settled = events["Timestamp"].notna() & (events["Timestamp"] < cutoff)
+        base, info = replay(events[settled], opening)
+        if watermark is None or cutoff > watermark:
+            meta = self.save(base, cutoff, (meta["events"] if meta else 0) + int(settled.sum()))
+        ledger, tail = replay(events[~settled], base)
+
+        ms = round((time.perf_counter() - t0) * 1000)
+        self.stats["runs"] += 1
+        self.stats["last_run"] = datetime.now().strftime(TS_FORMAT)
+        self.stats["last_ms"] = ms
+        return ledger, {
+            "replayed": len(events), "checkpointed": int(settled.sum()),
+            "skipped": info["skipped"] + tail["skipped"], "unresolved": info["unresolved"] + tail["unresolved"],
+            "from": watermark.strftime(TS_FORMAT) if watermark is not None else None,
+            "watermark": meta["watermark"] if meta else None, "ms": ms,
+        }
@@ -0,0 +1,81 @@
+"""วางแผนเติมสินค้า (Replenishment Wave): จับคู่ Reserve -> PICK ทุกรายการในรอบเดียวแบบ vectorized"""
+import pandas as pd
+
+WAVE_COLUMNS = ["Task", "Item_ID", "Item_Name", "From_Loc", "To_Loc", "Qty", "Source_Time"]
+
+
+def _prepare(df, loc_map):
+    stock = df[["Item_ID", "Item_Name", "Qty", "Location", "Replen_Point", "Time"]].copy()
+    stock["Item_ID"] = stock["Item_ID"].astype(str)
+    stock["Location"] = stock["Location"].astype(str)
+    stock["Qty"] = pd.to_numeric(stock["Qty"], errors="coerce").fillna(0).astype("int64")
+    stock["Replen_Point"] = pd.to_numeric(stock["Replen_Point"], errors="coerce")
+    stock["Time"] = pd.to_datetime(stock["Time"], errors="coerce")
+    stock["Loc_Type"] = stock["Location"].map(loc_map)
+    return stock
+
+
+def plan_replenishment_wave(df, loc_map):
+    """คืนค่า (tasks, shortages)
+
+    - เป้าหมาย: PICK location ที่ Qty <= Replen_Point เติมให้เกิน Replen_Point 1 ชิ้น (หลุดจากคิวเติมหลัง commit)
+    - ต้นทาง: RESERVE ของสินค้าเดียวกัน เรียงตาม Time เก่าสุดก่อน (FIFO)
+    - จับคู่ด้วยช่วงสะสม (cumulative) ของ need / supply ต่อสินค้า ไม่จ่ายเกินของที่มีใน Reserve แต่ละจุด
+    """
+    empty = pd.DataFrame(columns=WAVE_COLUMNS)
+    if df.empty:
+        return empty, pd.DataFrame(columns=["Item_ID", "Item_Name", "To_Loc", "Need", "Short"])
+    stock = _prepare(df, loc_map)
+
+    pick = stock[stock["Loc_Type"] == "PICK"]
+    targets = (pick.groupby(["Item_ID", "Location"], as_index=False, sort=False)
+                   .agg(Item_Name=("Item_Name", "first"), Qty=("Qty", "sum"),
+                        Replen_Point=("Replen_Point", "max")))
+    targets = targets[targets["Qty"] <= targets["Replen_Point"]].copy()
+    targets["Need"] = (targets["Replen_Point"] - targets["Qty"] + 1).astype("int64")
+    # ช่องที่ว่างกว่า (Qty / Replen_Point ต่ำ) ได้ของก่อน
+    targets["Fill"] = targets["Qty"] / targets["Replen_Point"].where(targets["Replen_Point"] > 0, 1)
+    targets = targets.sort_values(["Item_ID", "Fill", "Location"], kind="stable")
+    targets["D_End"] = targets.groupby("Item_ID")["Need"].cumsum()
+    targets["D_Start"] = targets["D_End"] - targets["Need"]
+
+    reserve = stock[(stock["Loc_Type"] == "RESERVE") & (stock["Qty"] > 0)
+                    & stock["Item_ID"].isin(targets["Item_ID"])]
+    sources = (reserve.groupby(["Item_ID", "Location"], as_index=False, sort=False)
+                      .agg(Avail=("Qty", "sum"), Source_Time=("Time", "min")))
+    sources = sources.sort_values(["Item_ID", "Source_Time", "Location"], kind="stable", na_position="last")
+    sources["S_End"] = sources.groupby("Item_ID")["Avail"].cumsum()
+    sources["S_Start"] = sources["S_End"] - sources["Avail"]
+
+    pairs = targets.merge(sources, on="Item_ID", how="inner")
+    pairs["Alloc"] = (pairs[["D_End", "S_End"]].min(axis=1) - pairs[["D_Start", "S_Start"]].max(axis=1))
+    pairs = pairs[pairs["Alloc"] > 0]
+
+    tasks = pd.DataFrame({
+        "Item_ID": pairs["Item_ID"],
+        "Item_Name": pairs["Item_Name"],
+        "From_Loc": pairs["Location_y"],
+        "To_Loc": pairs["Location_x"],
+        "Qty": pairs["Alloc"].astype("int64"),
+        "Source_Time": pairs["Source_Time"],
+    }).sort_values(["From_Loc", "Item_ID", "To_Loc"], kind="stable").reset_index(drop=True)
+    tasks.insert(0, "Task", range(1, len(tasks) + 1))
+
+    got = tasks.groupby(["Item_ID", "To_Loc"])["Qty"].sum()
+    short = targets.set_index(["Item_ID", "Location"])
+    short["Got"] = got.reindex(short.index).fillna(0).astype("int64").values
+    short = short[short["Got"] < short["Need"]].reset_index()
+    shortages = pd.DataFrame({
+        "Item_ID": short["Item_ID"], "Item_Name": short["Item_Name"], "To_Loc": short["Location"],
+        "Need": short["Need"], "Short": short["Need"] - short["Got"],
+    })
+    return tasks, shortages
+
+
+def add_wave_to_mutation(mut, tasks):
+    # ทุก task ของ wave ลงใน StockMutation เดียว -> commit เป็น batch เดียว
+    for t in tasks.itertuples(index=False):
+        mut.decrement(t.Item_ID, t.From_Loc, int(t.Qty))
+        mut.increment(t.Item_ID, t.To_Loc, int(t.Qty), item_name=t.Item_Name)
+        mut.log("REPLENISH", t.Item_ID, int(t.Qty), t.From_Loc, t.To_Loc)
+    return mut
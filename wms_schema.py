@@ -0,0 +1,147 @@
+"""Schema ของตารางหลัก: แปลงค่าจากชีต (string ทั้งหมด) เป็น dtype จริงครั้งเดียว + ตรวจแถวเสีย + รายงานหน่วยความจำ / เวลา
+
+อ่านตามตำแหน่ง column แบบเดียวกับที่แอปเขียน (Col 1, 2, ...) ชื่อ header ในชีตไม่มีผล column เกิน schema ถูกตัดทิ้ง
+"""
+import time
+
+import pandas as pd
+
+from wms_storage import TABLE_ITEM_MASTER, TABLE_LOC_MASTER, TABLE_LOG, TABLE_STOCK
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# ชนิดของ column
+# - text: string ตามที่อยู่ในชีต (ไม่ตัดช่องว่าง เพราะ StockStore / การเขียนกลับใช้ค่าตรงตัว)
+# - id: string ตัดช่องว่างหัวท้าย / cat: category (ค่าซ้ำเยอะ) / code: category ตัดช่องว่าง + ตัวพิมพ์ใหญ่
+# - int: int32 (ว่าง = 0) / num: float (ว่าง = NaN เช่น Replen_Point ที่ยังไม่ตั้ง) / time: datetime (ว่าง = NaT)
+SCHEMAS = {
+    TABLE_STOCK: [("Item_ID", "text"), ("Item_Name", "cat"), ("Qty", "int"), ("Location", "cat"),
+                  ("Status", "cat"), ("Container", "cat"), ("Replen_Point", "num"), ("Time", "time")],
+    TABLE_ITEM_MASTER: [("Barcode", "id"), ("Description", "text"), ("Category", "cat"), ("Zone", "cat"),
+                        ("Rack", "cat"), ("Level", "cat"), ("Image_Link", "text"), ("Replen_Point", "num"),
+                        ("Timestamp", "time")],
+    TABLE_LOC_MASTER: [("Location_ID", "id"), ("Zone", "cat"), ("Rack", "cat"), ("Level", "cat"),
+                       ("Bin", "cat"), ("Loc_Type", "code")],
+    # Qty ใน log เก็บเป็น text: PUT_AWAY รุ่นแรกเขียน "All" (replay() เป็นคนแปลง)
+    TABLE_LOG: [("Timestamp", "time"), ("Action", "code"), ("Item_ID", "text"), ("Qty", "text"),
+                ("From_Loc", "cat"), ("To_Loc", "cat"), ("User", "cat")],
+}
+
+# column ที่ห้ามว่าง (ว่าง = แถวเสีย)
+REQUIRED = {
+    TABLE_STOCK: ("Item_ID", "Location"),
+    TABLE_ITEM_MASTER: ("Barcode",),
+    TABLE_LOC_MASTER: ("Location_ID",),
+    TABLE_LOG: ("Timestamp", "Action", "Item_ID"),
+}
+
+BAD_COLUMNS = ["Row", "Column", "Value", "Error"]
+
+_DTYPES = {"text": str, "id": str, "int": "int32", "num": "float64", "time": "datetime64[ns]"}
+
+
+def columns(table):
+    return [name for name, _ in SCHEMAS[table]]
+
+
+def empty_frame(table):
+    return pd.DataFrame({name: pd.Series(dtype="category" if kind in ("cat", "code") else _DTYPES[kind])
+                         for name, kind in SCHEMAS[table]})
+
+
+def _text(col):
+    # ค่าจาก fake / SQLite อาจเป็นตัวเลข ส่วนแถวสั้นกว่า header ได้ None
+    return col.where(col.notna(), "").astype(str)
+
+
+def _parse_column(text, kind):
+    """Series[str] -> (Series ตามชนิด, mask ค่าที่อ่านไม่ได้ หรือ None, ข้อความ error)"""
+    if kind == "text":
+        return text, None, ""
+    if kind == "id":
+        return text.str.strip(), None, ""
+    if kind == "cat":
+        return text.astype("category"), None, ""
+    if kind == "code":
+        return text.str.strip().str.upper().astype("category"), None, ""
+    blank = text.str.strip() == ""
+    if kind in ("int", "num"):
+        num = pd.to_numeric(text, errors="coerce")
+        if kind == "num":
+            return num.astype("float64"), num.isna() & ~blank, "ไม่ใช่ตัวเลข"
+        bad = (num.isna() & ~blank) | ((num % 1).fillna(0) != 0)
+        return num.where(~bad).fillna(0).astype("int32"), bad, "ไม่ใช่จำนวนเต็ม"
+    ts = pd.to_datetime(text, format=TS_FORMAT, errors="coerce")
+    retry = ts.isna() & ~blank
+    if retry.any():
+        # แก้มือในชีตอาจเป็นรูปแบบอื่น ลองอ่านเฉพาะแถวที่ไม่ตรงรูปแบบหลัก
+        ts[retry] = pd.to_datetime(text[retry], format="mixed", errors="coerce")
+    return ts, ts.isna() & ~blank, "อ่านวันที่ไม่ได้"
+
+
+def parse_rows(rows, table, first_row=2):
+    """แถวข้อมูล (ไม่รวม header) -> (DataFrame ตาม SCHEMAS[table], report)
+
+    แถวเสียไม่ถูกตัดทิ้ง (เลขแถวต้องตรงกับชีต) ค่าที่อ่านไม่ได้เป็น 0 / NaN / NaT แล้วบันทึกใน report["bad"]
+    report: rows / bad (DataFrame[Row, Column, Value, Error] Row = เลขแถวในชีต) / parse_ms / raw_bytes / typed_bytes
+    """
+    t0 = time.perf_counter()
+    if not rows:
+        return empty_frame(table), _report(table, 0, [], t0, 0, 0)
+    spec = SCHEMAS[table]
+    raw = pd.DataFrame(rows).reindex(columns=range(len(spec)))
+    raw.columns = columns(table)
+    required = REQUIRED.get(table, ())
+    out, bad = {}, []
+    for name, kind in spec:
+        text = _text(raw[name])
+        out[name], mask, error = _parse_column(text, kind)
+        if mask is not None and mask.any():
+            bad.append((text[mask], name, error))
+        if name in required:
+            missing = text.str.strip() == ""
+            if missing.any():
+                bad.append((text[missing], name, "ว่าง"))
+    frame = pd.DataFrame(out)
+    raw_bytes = int(raw.memory_usage(deep=True).sum())
+    typed_bytes = int(frame.memory_usage(deep=True).sum())
+    bad_rows = [pd.DataFrame({"Row": vals.index + first_row, "Column": name, "Value": vals.values, "Error": error})
+                for vals, name, error in bad]
+    return frame, _report(table, len(frame), bad_rows, t0, raw_bytes, typed_bytes)
+
+
+def _report(table, rows, bad_rows, t0, raw_bytes, typed_bytes):
+    bad = (pd.concat(bad_rows, ignore_index=True).sort_values("Row", kind="stable", ignore_index=True)
+           if bad_rows else pd.DataFrame(columns=BAD_COLUMNS))
+    return {"table": table, "rows": rows, "bad": bad, "parse_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "raw_bytes": raw_bytes, "typed_bytes": typed_bytes}
+
+
+def concat_frames(frames, table):
+    """ต่อ DataFrame ที่ parse แยกกัน (เช่น ทีละ shard) ให้ column category ยังเป็น category
+
+    pd.concat กับ category ที่ชุดค่าต่างกันจะกลายเป็น object จึงรวมชุดค่าก่อนต่อ
+    """
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return empty_frame(table)
+    if len(frames) == 1:
+        return frames[0]
+    frames = [f.copy() for f in frames]
+    for name, kind in SCHEMAS[table]:
+        if kind in ("cat", "code"):
+            cats = pd.api.types.union_categoricals([f[name] for f in frames]).categories
+            for f in frames:
+                f[name] = f[name].cat.set_categories(cats)
+    return pd.concat(frames, ignore_index=True)
+
+
+def merge_reports(reports, table):
+    """{ชื่อ shard: report} -> report ก้อนเดียว (แถวเสียมี column Shard บอกว่ามาจากชีตไหน)"""
+    bads = [r["bad"].assign(Shard=name) for name, r in reports.items() if r and not r["bad"].empty]
+    reports = [r for r in reports.values() if r]
+    return {"table": table, "rows": sum(r["rows"] for r in reports),
+            "bad": pd.concat(bads, ignore_index=True) if bads else pd.DataFrame(columns=BAD_COLUMNS),
+            "parse_ms": round(sum(r["parse_ms"] for r in reports), 1),
+            "raw_bytes": sum(r["raw_bytes"] for r in reports),
+            "typed_bytes": sum(r["typed_bytes"] for r in reports)}
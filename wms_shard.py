@@ -0,0 +1,422 @@
+"""แบ่ง Current_Stock / Transaction_Log ไปหลาย Spreadsheet (shard) ตามโซน / ไซต์ของ Location
+
+- ShardRouter: Location -> ชื่อ shard (คอลัมน์ Shard / Site / Zone ใน Location_Master หรือ prefix ของรหัส Location)
+- ShardedTable: หลายตารางรวมเป็นตารางเดียว (อ่านพร้อมกันทุก shard ด้วย thread pool) แถวใหม่ถูกส่งไป shard ตาม route
+- ShardedStockStore / ShardedMutation: StockStore / StockMutation 1 ชุดต่อ shard แต่หน้าแอปใช้ interface เดิม
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from wms_schema import concat_frames, merge_reports
+from wms_stock import COL_LOC, StockMutation, StockMutationError
+from wms_storage import (DEFAULT_HEADERS, FakeSpreadsheet, StorageBackend, SheetTable, Table, TABLE_LOG, TABLE_STOCK,
+                         WorksheetNotFound)
+
+# column ใน Location_Master ที่บอก shard ของช่อง (ไล่ตามลำดับ ค่าต้องตรงกับชื่อ shard)
+SHARD_COLUMNS = ("shard", "site", "zone")
+
+
+class ShardRouter:
+    """shard ของ Location: ค่าจาก Location_Master (load) ก่อน ถ้าไม่มีใช้ prefix ที่ยาวที่สุดของรหัสที่ตรงกับชื่อ shard
+
+    Location ที่ไม่เข้า shard ไหน (DOCK_IN, ช่อง Staging, Location ที่ไม่รู้จัก) อยู่ shard default
+    """
+
+    def __init__(self, shards, default):
+        self.shards = list(shards)
+        self.default = default
+        self.by_location = {}
+        self._prefixes = sorted((str(s).upper() for s in self.shards if s != default), key=len, reverse=True)
+        self._names = {str(s).upper(): s for s in self.shards}
+
+    def load(self, values):
+        """อ่าน shard ของแต่ละ Location จาก Location_Master (get_all_values)"""
+        if not values or len(values) < 2:
+            return self
+        header = [str(h).strip().lower() for h in values[0]]
+        c_loc = next((header.index(n) for n in ("location_id", "location") if n in header), 0)
+        cols = [header.index(n) for n in SHARD_COLUMNS if n in header]
+        out = {}
+        for row in values[1:]:
+            loc = str(row[c_loc]).strip() if len(row) > c_loc else ""
+            for c in cols:
+                name = self._names.get(str(row[c]).strip().upper()) if len(row) > c else None
+                if loc and name is not None:
+                    out[loc] = name
+                    break
+        self.by_location = out
+        return self
+
+    def match(self, location):
+        """ชื่อ shard ที่ Location นี้เข้า หรือ None ถ้าไม่เข้า shard ไหน"""
+        loc = str(location).strip()
+        if loc in self.by_location:
+            return self.by_location[loc]
+        upper = loc.upper()
+        for p in self._prefixes:
+            if upper.startswith(p):
+                return self._names[p]
+        return None
+
+    def shard_of(self, location):
+        return self.match(location) or self.default
+
+    def log_shard(self, row):
+        # log ไปอยู่ shard ของปลายทาง (To_Loc) ถ้าไม่เข้า shard ไหน (เช่น SHIP_OUT ไปเลข Shipment) ใช้ต้นทาง
+        to_loc = row[5] if len(row) > 5 else ""
+        from_loc = row[4] if len(row) > 4 else ""
+        return self.match(to_loc) or self.match(from_loc) or self.default
+
+
+class ShardedTable(Table):
+    """หลาย Table (ชื่อ shard -> Table) ที่ header เดียวกัน มองเป็นตารางเดียว: แถวของ shard แรกก่อน แล้ว shard ถัดไปต่อท้าย
+
+    เลขแถวรวมใช้ได้กับผลของ get_all_values() ครั้งล่าสุดเท่านั้น (update / delete / get_rows
+    แปลงกลับเป็นเลขแถวของแต่ละ shard ด้วย offset ของการอ่านครั้งนั้น แถวใหม่ที่ต่อท้าย shard อื่นหลังจากนั้นไม่กระทบ)
+    """
+
+    def __init__(self, tables, route, pool):
+        self.tables = tables
+        self.route = route
+        self.pool = pool
+        self.title = next(iter(tables.values())).title
+        self._offsets = None
+        self._lock = threading.Lock()
+
+    def fan_out(self, fn):
+        """เรียก fn(table) ทุก shard พร้อมกัน คืน {ชื่อ shard: ผลลัพธ์} ตามลำดับ shard"""
+        futures = {name: self.pool.submit(fn, t) for name, t in self.tables.items()}
+        return {name: f.result() for name, f in futures.items()}
+
+    def get_all_values(self):
+        parts = self.fan_out(lambda t: t.get_all_values())
+        header, rows, offsets = [], [], []
+        for name, values in parts.items():
+            if values and not header:
+                header = list(values[0])
+            offsets.append((len(rows) + 2, len(values[1:]) if values else 0, name))
+            rows += values[1:] if values else []
+        with self._lock:
+            self._offsets = offsets
+        return [header] + rows if header else []
+
+    def _local(self, row_nos):
+        # {ชื่อ shard: {เลขแถวใน shard: เลขแถวรวม}}
+        with self._lock:
+            offsets = self._offsets
+        if offsets is None:
+            raise RuntimeError(f"{self.title}: ต้องอ่าน get_all_values() ก่อนใช้เลขแถว")
+        out = {}
+        for n in row_nos:
+            for start, count, name in offsets:
+                if start <= n < start + count:
+                    out.setdefault(name, {})[n - start + 2] = n
+                    break
+        return out
+
+    def get_rows(self, row_nos):
+        out = {n: None for n in row_nos}
+        local = self._local(row_nos)
+        got = {name: self.pool.submit(self.tables[name].get_rows, list(rows)) for name, rows in local.items()}
+        for name, future in got.items():
+            for n, row in future.result().items():
+                out[local[name][n]] = row
+        return out
+
+    def tail(self, n):
+        # n แถวสุดท้ายของแต่ละ shard ต่อกัน (แถวใหม่ถูกต่อท้ายทุก shard ได้)
+        return [r for rows in self.fan_out(lambda t: t.tail(n)).values() for r in rows]
+
+    def read_after(self, cursor=None):
+        # cursor แยกต่อ shard ({ชื่อ shard: cursor}) เพราะแถวใหม่ต่อท้ายได้ทุก shard
+        cursor = cursor or {}
+        futures = {name: self.pool.submit(t.read_after, cursor.get(name)) for name, t in self.tables.items()}
+        parts = {name: f.result() for name, f in futures.items()}
+        if any(p is None for p in parts.values()):
+            return None
+        return [r for rows, _ in parts.values() for r in rows], {name: c for name, (_, c) in parts.items()}
+
+    def append_rows(self, rows):
+        self.apply_batch(appends=rows)
+
+    def apply_batch(self, updates=(), appends=(), deletes=()):
+        work = {}
+        if updates or deletes:
+            local = self._local([n for n, _, _ in updates] + list(deletes))
+            back = {n: (name, m) for name, rows in local.items() for m, n in rows.items()}
+            for n, c, v in updates:
+                name, m = back[n]
+                work.setdefault(name, ([], [], []))[0].append((m, c, v))
+            for n in deletes:
+                name, m = back[n]
+                work.setdefault(name, ([], [], []))[2].append(m)
+        for r in appends:
+            work.setdefault(self.route(r), ([], [], []))[1].append(r)
+        futures = [self.pool.submit(self.tables[name].apply_batch, u, a, d) for name, (u, a, d) in work.items()]
+        return sum(f.result() or 0 for f in futures)
+
+    def revision(self):
+        return "|".join(str(r) for r in self.fan_out(lambda t: t.revision()).values())
+
+
+class ShardedStockStore:
+    """StockStore 1 ตัวต่อ shard (เลขแถวแยกกันแต่ละ Spreadsheet) หน้าแอปเรียก method เดียวกับ StockStore
+
+    - sync() อ่านทุก shard พร้อมกัน (thread pool) เวลารวม ~ shard ที่ช้าที่สุด ไม่ใช่ผลรวม
+    - method ที่ระบุ Location ไปถาม shard ของ Location นั้นตรงๆ / method ของสินค้า (stock_of, lookup) รวมจากทุก shard
+    """
+
+    def __init__(self, stores, router, pool):
+        self.stores = stores
+        self.router = router
+        self.pool = pool
+        self._frame = None
+        self._frame_version = None
+        self.schema_report = None
+
+    def store_of(self, location):
+        return self.stores[self.router.shard_of(location)]
+
+    def _fan_out(self, fn):
+        futures = {name: self.pool.submit(fn, s) for name, s in self.stores.items()}
+        return {name: f.result() for name, f in futures.items()}
+
+    @property
+    def version(self):
+        return sum(s.version for s in self.stores.values())
+
+    @property
+    def api_calls(self):
+        return sum(s.api_calls for s in self.stores.values())
+
+    @property
+    def header(self):
+        return next(iter(self.stores.values())).header
+
+    def sync(self, force=False):
+        return any(self._fan_out(lambda s: s.sync(force)).values())
+
+    def note_local_write(self, rows=None):
+        # rows = แถว Transaction_Log ที่เพิ่งส่ง: แจ้งเฉพาะ shard ที่ได้ log ไป (None = ทุก shard เช่นหลัง rollover)
+        names = self.stores if rows is None else {self.router.log_shard(r) for r in rows}
+        for name in names:
+            self.stores[name].note_local_write()
+
+    def to_frame(self):
+        version = tuple(s.version for s in self.stores.values())
+        if self._frame_version != version:
+            frames = [s.to_frame() for s in self.stores.values()]
+            self._frame = concat_frames(frames, TABLE_STOCK)
+            self.schema_report = merge_reports(
+                {name: s.schema_report for name, s in self.stores.items()}, TABLE_STOCK)
+            self._frame_version = version
+        return self._frame.copy()
+
+    # ---------- อ่านตาม Location (shard เดียว) ----------
+    def is_occupied(self, location):
+        return self.store_of(location).is_occupied(location)
+
+    def rows_at(self, location):
+        return self.store_of(location).rows_at(location)
+
+    # ---------- อ่านตามสินค้า (ทุก shard) ----------
+    def stock_of(self, item_id, loc_map=None, loc_type=None):
+        out = {}
+        for s in self.stores.values():
+            for loc, q in s.stock_of(item_id, loc_map, loc_type).items():
+                out[loc] = out.get(loc, 0) + q
+        return out
+
+    def on_hand_by_type(self, item_id, loc_map):
+        totals = {}
+        for loc, qty in self.stock_of(item_id).items():
+            t = loc_map.get(loc)
+            totals[t] = totals.get(t, 0) + qty
+        return totals
+
+    def on_hand_map(self):
+        out = {}
+        for s in self.stores.values():
+            for item, locs in s.on_hand_map().items():
+                merged = out.setdefault(item, {})
+                for loc, q in locs.items():
+                    merged[loc] = merged.get(loc, 0) + q
+        return out
+
+    def occupied_locations(self):
+        return set().union(*(s.occupied_locations() for s in self.stores.values()))
+
+    def last_replen_point(self, item_id, default=None):
+        # shard default ก่อน (ของรับเข้าอยู่ DOCK_IN) แล้วค่อยไล่ shard อื่น
+        order = [self.router.default] + [n for n in self.stores if n != self.router.default]
+        for name in order:
+            value = self.stores[name].last_replen_point(item_id)
+            if value is not None:
+                return value
+        return default
+
+    def lookup(self, item_ids, fresh=False):
+        """แถว stock ของสินค้าที่ขอจากทุก shard (อ่านพร้อมกัน) -> DataFrame (column ตาม Current_Stock + Shard)
+
+        fresh=True: sync ทุก shard พร้อมกันก่อน (อ่านเฉพาะ shard ที่ revision เปลี่ยน)
+        """
+        if fresh:
+            self.sync()
+        found = [f.assign(Shard=name) for name, f in self._fan_out(lambda s: s.lookup(item_ids)).items() if not f.empty]
+        if not found:
+            return pd.DataFrame(columns=list(self.header) + ["Shard"])
+        return pd.concat(found, ignore_index=True)
+
+
+class ShardedMutation:
+    """StockMutation 1 ตัวต่อ shard ที่งานนี้แตะ (คำสั่งส่งไป shard ตาม Location)
+
+    - move ข้าม shard = เพิ่มแถวใหม่ใน shard ปลายทาง + ตัดแถวเดิมใน shard ต้นทาง
+    - commit ทีละ shard (แต่ละ shard เป็น batch เดียว + compare-and-swap เหมือนเดิม) shard ที่มีแต่การเพิ่มของก่อน
+      shard ที่ตัดของทีหลัง ถ้าล้มกลางทางของจะเกินไม่หาย (ตรวจเจอได้ในเมนู Reconcile)
+    """
+
+    def __init__(self, store, log_writer, user="Admin", verify=True, max_retries=2):
+        self.store = store
+        self.log_writer = log_writer
+        self.user = user
+        self.verify = verify
+        self.max_retries = max_retries
+        self.parts = {}
+        self.ops = 0
+        self._moves = []
+
+    def _part(self, location):
+        name = self.store.router.shard_of(location)
+        if name not in self.parts:
+            self.parts[name] = StockMutation(self.store.stores[name], self.log_writer, self.user,
+                                             verify=self.verify, max_retries=self.max_retries)
+        return self.parts[name]
+
+    def append(self, values):
+        self.ops += 1
+        self._part(values[COL_LOC - 1] if len(values) >= COL_LOC else "").append(values)
+        return self
+
+    def move(self, item_id, from_loc, to_loc, status="Available", log_action=None):
+        self.ops += 1
+        if self.store.router.shard_of(from_loc) == self.store.router.shard_of(to_loc):
+            self._part(from_loc).move(item_id, from_loc, to_loc, status, log_action)
+        else:
+            self._moves.append((str(item_id), str(from_loc), str(to_loc), status, log_action))
+        return self
+
+    def decrement(self, item_id, location, qty):
+        self.ops += 1
+        self._part(location).decrement(item_id, location, qty)
+        return self
+
+    def increment(self, item_id, location, qty, replen_point=None, item_name="", status="Available", container=None):
+        self.ops += 1
+        self._part(location).increment(item_id, location, qty, replen_point, item_name, status, container)
+        return self
+
+    def clear_location(self, location, log_action=None, to_loc=""):
+        self.ops += 1
+        self._part(location).clear_location(location, log_action, to_loc)
+        return self
+
+    def log(self, action, item_id, qty, from_loc, to_loc):
+        self.ops += 1
+        self._part(to_loc if self.store.router.match(to_loc) else from_loc).log(action, item_id, qty, from_loc, to_loc)
+        return self
+
+    def _split_moves(self):
+        # move ข้าม shard: ใช้แถวแรกของสินค้าที่ต้นทาง (แถวเดียวกับที่ StockMutation.move จะย้าย)
+        # หาแถวผ่าน read-set ของ StockMutation ใต้ lock ของ shard ต้นทาง: ยอดที่ย้ายตรงกับชีต ไม่ใช่ค่าเก่าใน store
+        # คืน (API call, ครั้งที่ชน) ของการตรวจแถวต้นทาง
+        api_calls = conflicts = 0
+        for item_id, from_loc, to_loc, status, log_action in self._moves:
+            source = self.store.store_of(from_loc)
+            probe = StockMutation(source, self.log_writer, self.user, verify=self.verify, max_retries=self.max_retries)
+            with source.lock:
+                probe.move(item_id, from_loc, to_loc, status)._resolve()
+            api_calls += probe.api_calls
+            conflicts += probe.conflicts
+            row = next(list(r) for r in probe._work.values() if r[COL_LOC - 1] == to_loc)
+            qty = StockMutation._qty(row)
+            self._part(to_loc).append(row)
+            self._part(from_loc).decrement(item_id, from_loc, qty)
+            if log_action:
+                self._part(to_loc).log(log_action, item_id, qty, from_loc, to_loc)
+        self._moves = []
+        return api_calls, conflicts
+
+    def commit(self):
+        t0 = time.perf_counter()
+        api_calls, conflicts = self._split_moves()
+        removes = {"decrement", "move", "clear"}
+        order = sorted(self.parts.items(), key=lambda kv: any(op[0] in removes for op in kv[1].ops))
+        stats = {"ops": self.ops, "requests": 0, "api_calls": api_calls, "conflicts": conflicts, "shards": len(order)}
+        done = []
+        for name, mut in order:
+            try:
+                res = mut.commit()
+            except StockMutationError as e:
+                if done:
+                    raise StockMutationError(f"{e} (shard {', '.join(done)} บันทึกไปแล้ว / shard {name} ไม่สำเร็จ)") from e
+                raise
+            done.append(name)
+            for k in ("requests", "api_calls", "conflicts"):
+                stats[k] += res[k]
+        stats["ms"] = round((time.perf_counter() - t0) * 1000)
+        return stats
+
+
+class ShardedBackend(StorageBackend):
+    """backend หลัก (Master / Orders / shard default) + shard อื่นที่มีแค่ Current_Stock และ Transaction_Log
+
+    shards: {ชื่อ shard: (stock_table, log_table)} ของ shard อื่นที่ไม่ใช่ default
+    """
+
+    def __init__(self, main, shards, default="MAIN", workers=None):
+        self.main = main
+        self.governor = getattr(main, "governor", None)
+        tables = {default: (main.stock, main.log)}
+        tables.update(shards)
+        self.router = ShardRouter(tables, default)
+        self.pool = ThreadPoolExecutor(max_workers=workers or len(tables) * 2, thread_name_prefix="wms-shard")
+        self.stock_tables = {name: t[0] for name, t in tables.items()}
+        log = ShardedTable({name: t[1] for name, t in tables.items()}, self.router.log_shard, self.pool)
+        stock = ShardedTable(self.stock_tables, lambda r: self.router.shard_of(r[COL_LOC - 1]), self.pool)
+        super().__init__(stock, log, main.item_master, main.loc_master, main.orders)
+
+    @property
+    def calls(self):
+        # backend "fake": นับ call ของทุก Spreadsheet รวมกัน
+        calls = getattr(self.main, "calls", None)
+        if calls is None:
+            return None
+        for name, table in self.stock_tables.items():
+            extra = getattr(table.spreadsheet, "calls", None) if name != self.router.default else None
+            if extra is not None:
+                calls = calls + extra
+        return calls
+
+    @staticmethod
+    def sheet_shard(spreadsheet, governor=None):
+        """(Current_Stock, Transaction_Log) ของ Spreadsheet 1 shard (metadata 1 call)"""
+        if governor is not None:
+            from wms_governor import GovernedSpreadsheet
+            spreadsheet = GovernedSpreadsheet(spreadsheet, governor)
+        sheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+        for title in (TABLE_STOCK, TABLE_LOG):
+            if title not in sheets:
+                raise WorksheetNotFound(title)
+        return SheetTable(sheets[TABLE_STOCK], spreadsheet), SheetTable(sheets[TABLE_LOG], spreadsheet)
+
+    @staticmethod
+    def fake_shard(title, latency=0.0):
+        """shard ปลอมใน memory (ใช้กับ backend "fake")"""
+        sh = FakeSpreadsheet(title, latency)
+        for t in (TABLE_STOCK, TABLE_LOG):
+            sh.add_worksheet(t, values=[DEFAULT_HEADERS[t]])
+        return ShardedBackend.sheet_shard(sh)
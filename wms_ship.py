@@ -0,0 +1,47 @@
+"""Ship Out: ของที่หยิบแล้วพักในช่อง Staging -> สร้าง Manifest ต่อ Shipment -> ปิดรถ (ตัด stock ทั้งคัน) ใน batch เดียว"""
+import pandas as pd
+
+STAGED_STATUS = "Staged"
+MANIFEST_COLUMNS = ["Shipment_ID", "Lane", "Order_ID", "Item_ID", "Item_Name", "Qty"]
+
+
+def staging_lanes(loc_map, prefix="STG", default=("STG-01",)):
+    """ช่อง Staging = Location ที่ Loc_Type เป็น STAGING หรือรหัสขึ้นต้นด้วย prefix (ไม่มีเลยใช้ default)"""
+    lanes = sorted(loc for loc, t in loc_map.items() if t == "STAGING" or str(loc).upper().startswith(prefix))
+    return lanes or list(default)
+
+
+def _staged(df, lanes):
+    if df.empty:
+        return pd.DataFrame(columns=["Item_ID", "Item_Name", "Qty", "Location", "Container"])
+    lines = df[df["Location"].astype(str).isin(lanes)].copy()
+    lines["Qty"] = pd.to_numeric(lines["Qty"], errors="coerce").fillna(0).astype("int64")
+    return lines
+
+
+def lane_summary(df, lanes):
+    """สรุปของที่รอส่งในแต่ละช่อง: จำนวนบรรทัด / ชิ้น / Order"""
+    lines = _staged(df, lanes)
+    if lines.empty:
+        return pd.DataFrame({"Lane": lanes, "Lines": 0, "Qty": 0, "Orders": 0})
+    summary = (lines.groupby("Location", sort=True, observed=True)
+                    .agg(Lines=("Item_ID", "size"), Qty=("Qty", "sum"),
+                         Orders=("Container", lambda s: s[s != "-"].nunique())))
+    return summary.reindex(lanes, fill_value=0).rename_axis("Lane").reset_index()
+
+
+def build_manifest(df, lanes, shipment_id):
+    """รายการของทั้งหมดในช่องที่เลือก (1 แถวต่อ Order / สินค้า / ช่อง) ใช้เป็นใบกำกับรถ"""
+    lines = _staged(df, lanes)
+    manifest = (lines.groupby(["Location", "Container", "Item_ID"], as_index=False, sort=True, observed=True)
+                     .agg(Item_Name=("Item_Name", "first"), Qty=("Qty", "sum"))
+                     .rename(columns={"Location": "Lane", "Container": "Order_ID"}))
+    manifest.insert(0, "Shipment_ID", shipment_id)
+    return manifest[MANIFEST_COLUMNS]
+
+
+def add_closeout_to_mutation(mut, lanes, shipment_id):
+    # ปิดรถ: ลบทุกแถวในช่องที่เลือก + log SHIP_OUT ทีละแถว (To_Loc = เลข Shipment) ใน commit เดียว
+    for lane in lanes:
+        mut.clear_location(lane, log_action="SHIP_OUT", to_loc=shipment_id)
+    return mut
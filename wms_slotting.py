@@ -0,0 +1,270 @@
+"""จัดตำแหน่งสินค้าตามความถี่การหยิบ (Slotting): ABC จาก log PICKING -> แนะนำช่อง PICK -> แนะนำปลายทางตอน Put Away"""
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from wms_archive import LOG_COLUMNS
+from wms_picking import location_coords, _natural
+from wms_reconcile import log_frame
+
+LOCATION_COLUMNS = ["Location", "Zone", "Rack", "Level", "Loc_Type", "Walk"]
+VELOCITY_COLUMNS = ["Item_ID", "Hits", "Hits_7d", "Qty", "Replens", "Share", "ABC"]
+PLAN_COLUMNS = ["Item_ID", "ABC", "Hits", "Replens", "Current_Slot", "Current_Walk",
+                "Suggested_Slot", "Suggested_Walk", "Gain"]
+SUGGEST_COLUMNS = ["Location", "Loc_Type", "Walk", "Reason"]
+
+# ส่วนแบ่งจำนวนครั้งที่หยิบสะสม: A = 80% แรก, B = ถึง 95%, ที่เหลือ C
+ABC_CUTS = (0.80, 0.95)
+SLOT_ACTIONS = ["PICKING", "REPLENISH"]
+
+
+def location_table(values):
+    """Location_Master ทุกช่อง -> DataFrame[Location, Zone, Rack, Level, Loc_Type, Walk]
+
+    Walk = ลำดับบนเส้นทางเดินแบบงูเดียวกับ pick_path (0 = ใกล้จุดเริ่มที่สุด) ใช้แทนระยะเดิน
+    Loc_Type หาจาก header "type" / "loc_type" ถ้าไม่มีใช้ column ที่ 6 แบบ get_location_map()
+    """
+    coords = location_coords(values)
+    if coords.empty:
+        return pd.DataFrame(columns=LOCATION_COLUMNS)
+    header = [str(h).strip().lower() for h in values[0]]
+    c_loc = next((header.index(n) for n in ("location_id", "location") if n in header), 0)
+    c_type = next((header.index(n) for n in ("loc_type", "type") if n in header), 5)
+    types = {str(r[c_loc]).strip(): str(r[c_type]).strip().upper()
+             for r in values[1:] if len(r) > max(c_loc, c_type)}
+    coords["Loc_Type"] = coords["Location"].map(types).fillna("")
+
+    zone = coords["Zone"].map(_natural)
+    rack = coords["Rack"].map(_natural)
+    zone_no = {z: i for i, z in enumerate(sorted(set(zone)))}
+    rack_no = {r: i for i, r in enumerate(sorted(set(rack)))}
+    coords["Zone_No"] = zone.map(zone_no)
+    coords["Rack_No"] = rack.map(rack_no)
+    coords["Level_No"] = coords["Level"].map(_natural).map(
+        {lv: i for i, lv in enumerate(sorted(set(coords["Level"].map(_natural))))})
+    # Zone คู่เดิน Rack ย้อนกลับ (serpentine) / ใน Rack เดียวกันชั้นล่างก่อน
+    serp = coords["Rack_No"].where(coords["Zone_No"] % 2 == 0, -coords["Rack_No"])
+    order = coords.assign(_s=serp).sort_values(["Zone_No", "_s", "Level_No", "Location"], kind="stable").index
+    coords.loc[order, "Walk"] = range(len(coords))
+    coords["Walk"] = coords["Walk"].astype("int64")
+    return coords.reset_index(drop=True)
+
+
+def abc_class(hits, cuts=ABC_CUTS):
+    """Series[Hits] -> (Share, ABC) ตามส่วนแบ่งสะสมของสินค้าที่หยิบบ่อยกว่า (ตัวที่บ่อยที่สุดเป็น A เสมอ)"""
+    ordered = hits.sort_values(ascending=False, kind="stable")
+    total = ordered.sum()
+    share = ordered / total if total else ordered * 0.0
+    before = share.cumsum() - share
+    cls = pd.Series("C", index=ordered.index)
+    cls[before < cuts[1]] = "B"
+    cls[before < cuts[0]] = "A"
+    cls[ordered <= 0] = "C"
+    return share.reindex(hits.index), cls.reindex(hits.index)
+
+
+class SlottingModel:
+    """เก็บยอดหยิบ / เติม รายวันต่อสินค้า (ย้อนหลัง window_days วัน) แล้วคำนวณ velocity / ABC / แผนช่อง PICK
+
+    - refresh() อ่าน log ได้ไม่เกิน 1 ครั้งต่อ refresh_sec โดยจำ cursor ของแถวในชีตที่รวมยอดไปแล้ว
+      รอบถัดไปอ่านเฉพาะแถวที่ต่อท้ายมาใหม่ (column แรก + แถวใหม่) แล้วบวกเข้ายอดรายวันตามวันของแต่ละแถว
+    - ถ้าแถวที่อ่านไปแล้วถูกลบ / เลื่อน (rollover) ทิ้งยอดตั้งแต่ 00:00 ของวันที่ refresh ครั้งก่อน
+      แล้วอ่านช่วงนั้นใหม่จาก archive + ชีต (ไม่นับซ้ำ)
+    - velocity() / plan() cache ไว้ตาม version ของยอดรายวัน (plan ใช้ version ของ StockStore + hash ของ Location_Master ด้วย)
+    """
+
+    def __init__(self, window_days=30, recent_days=7, refresh_sec=600):
+        self.window_days = window_days
+        self.recent_days = recent_days
+        self.refresh_sec = refresh_sec
+        self.daily = self._empty()
+        self.cursor = None
+        self.settled_until = None
+        self.refreshed = None
+        self.version = 0
+        self.stats = {"refreshes": 0, "full_reads": 0, "rows": 0, "last_ms": None, "last_refresh": None}
+        self._velocity = (None, None)
+        self._plan = (None, None)
+
+    @staticmethod
+    def _empty():
+        return pd.DataFrame({"Item_ID": pd.Series(dtype=str), "Day": pd.Series(dtype="datetime64[ns]"),
+                             "Hits": pd.Series(dtype="int64"), "Qty": pd.Series(dtype="int64"),
+                             "Replens": pd.Series(dtype="int64")})
+
+    # ---------- อ่าน log ----------
+    def refresh(self, table, archive=None, force=False, now=None):
+        """อ่าน log ใหม่ถ้าครบ refresh_sec แล้ว คืน True ถ้าอ่าน"""
+        if not force and self.refreshed is not None and time.monotonic() - self.refreshed < self.refresh_sec:
+            return False
+        t0 = time.perf_counter()
+        today = pd.Timestamp(now or datetime.now()).normalize()
+        got = table.read_after(self.cursor) if self.cursor is not None else None
+        if got is not None:
+            rows, self.cursor = got
+            events, since = log_frame([[]] + rows), None
+        else:
+            # รอบแรก หรือแถวในชีตถูกลบ / เลื่อน: อ่านใหม่ตั้งแต่ since (log ที่ rollover ออกไปแล้วอ่านจาก archive)
+            since = self.settled_until or today - pd.Timedelta(days=self.window_days - 1)
+            rows, self.cursor = table.read_after(None)
+            frames = []
+            if archive is not None and archive.partitions():
+                old = archive.query(start=since, actions=SLOT_ACTIONS, columns=LOG_COLUMNS)
+                if len(old):
+                    frames.append(old)
+            frames.append(log_frame([[]] + rows, since=since))
+            events = pd.concat(frames, ignore_index=True)
+            self.stats["full_reads"] += 1
+        self.update(events, today, since)
+        self.refreshed = time.monotonic()
+        self.stats["refreshes"] += 1
+        self.stats["rows"] = len(events)
+        self.stats["last_ms"] = round((time.perf_counter() - t0) * 1000)
+        self.stats["last_refresh"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return True
+
+    def update(self, events, today, since=None):
+        """รวม events (DataFrame[LOG_COLUMNS]) เข้ายอดรายวัน แล้วตัดวันที่เก่ากว่า window_days ทิ้ง
+
+        since: ทิ้งยอดตั้งแต่วันนี้ก่อน (events คือ log ทั้งช่วงตั้งแต่ since ที่อ่านใหม่)
+        """
+        agg = self._aggregate(events)
+        first = today - pd.Timedelta(days=self.window_days - 1)
+        daily = self.daily if since is None else self.daily[self.daily["Day"] < since]
+        if len(agg):
+            daily = agg if daily.empty else (pd.concat([daily, agg], ignore_index=True)
+                                             .groupby(["Item_ID", "Day"], as_index=False).sum())
+        daily = daily[daily["Day"] >= first].reset_index(drop=True)
+        if since is not None or len(agg) or len(daily) != len(self.daily):
+            self.daily = daily
+            self.version += 1
+        self.settled_until = today
+
+    @staticmethod
+    def _aggregate(events):
+        ev = events[events["Timestamp"].notna()]
+        action = ev["Action"].astype(str).str.strip().str.upper()
+        ev = ev[action.isin(SLOT_ACTIONS)]
+        action = action[ev.index]
+        picking = action == "PICKING"
+        out = pd.DataFrame({
+            "Item_ID": ev["Item_ID"].astype(str).str.strip(),
+            "Day": pd.to_datetime(ev["Timestamp"]).dt.normalize(),
+            "Hits": picking.astype("int64"),
+            "Qty": pd.to_numeric(ev["Qty"], errors="coerce").fillna(0).where(picking, 0).astype("int64"),
+            "Replens": (~picking).astype("int64"),
+        })
+        return out.groupby(["Item_ID", "Day"], as_index=False).sum()
+
+    # ---------- velocity ----------
+    def velocity(self, now=None):
+        """DataFrame[Item_ID, Hits, Hits_7d, Qty, Replens, Share, ABC] เรียงจากหยิบบ่อยไปน้อย
+
+        Hits = จำนวนบรรทัดหยิบ (= จำนวนเที่ยวที่เดินไปช่องนั้น) ใน window_days วันล่าสุด ใช้จัด ABC
+        """
+        today = pd.Timestamp(now or datetime.now()).normalize()
+        key = (self.version, today)
+        if self._velocity[0] == key:
+            return self._velocity[1].copy()
+        daily = self.daily
+        if daily.empty:
+            out = pd.DataFrame(columns=VELOCITY_COLUMNS)
+        else:
+            days = pd.date_range(end=today, periods=self.window_days, freq="D")
+            mat = (daily.pivot_table(index="Day", columns="Item_ID", values=["Hits", "Qty", "Replens"],
+                                     aggfunc="sum", fill_value=0)
+                        .reindex(days, fill_value=0))
+            last = {name: mat[name].rolling(self.window_days, min_periods=1).sum().iloc[-1]
+                    for name in ("Hits", "Qty", "Replens")}
+            last["Hits_7d"] = mat["Hits"].rolling(self.recent_days, min_periods=1).sum().iloc[-1]
+            out = pd.DataFrame(last).fillna(0).astype("int64").rename_axis("Item_ID").reset_index()
+            out["Share"], out["ABC"] = abc_class(out["Hits"])
+            out = out[(out["Hits"] > 0) | (out["Replens"] > 0)]
+            out = out.sort_values(["Hits", "Replens", "Item_ID"], ascending=[False, False, True], kind="stable")
+            out = out[VELOCITY_COLUMNS].reset_index(drop=True)
+        self._velocity = (key, out)
+        return out.copy()
+
+    # ---------- แผนช่อง PICK ----------
+    def plan(self, store, locations, now=None):
+        """แนะนำช่อง PICK: สินค้าที่หยิบบ่อยสุดได้ช่อง PICK ที่ Walk น้อยสุด (เดินสั้นสุด) ไล่ลงไปตามลำดับ
+
+        สินค้าที่ Hits เท่ากัน ตัวที่ถูกเติมบ่อยกว่าได้ช่องที่ใกล้กว่า (เที่ยวเติมสั้นลงด้วย)
+        Gain = Hits x (Walk ปัจจุบัน - Walk ที่แนะนำ) / สินค้าที่ยังไม่มีช่อง PICK นับ Walk ปัจจุบันเป็นช่องไกลสุด
+        คืนเฉพาะสินค้าที่ควรย้าย เรียงจาก Gain มากไปน้อย
+        """
+        # Location_Master ที่ได้มาเป็น DataFrame ใหม่ทุก rerun: key ตามเนื้อหา ไม่ใช่ตาม object
+        key = (self.version, store.version, int(pd.util.hash_pandas_object(locations).sum()))
+        if self._plan[0] == key:
+            return self._plan[1].copy()
+        vel = self.velocity(now)
+        slots = locations[locations["Loc_Type"] == "PICK"].sort_values("Walk", kind="stable")
+        if vel.empty or slots.empty:
+            out = pd.DataFrame(columns=PLAN_COLUMNS)
+            self._plan = (key, out)
+            return out.copy()
+        walk = slots.set_index("Location")["Walk"]
+        on_hand = store.on_hand_map()
+        current = {}
+        for item, locs in on_hand.items():
+            in_pick = [loc for loc in locs if loc in walk.index]
+            if in_pick:
+                current[item] = min(in_pick, key=walk.get)
+
+        plan = vel[vel["Hits"] > 0].head(len(slots)).copy()
+        plan["Suggested_Slot"] = slots["Location"].values[:len(plan)]
+        plan["Suggested_Walk"] = slots["Walk"].values[:len(plan)]
+        plan["Current_Slot"] = plan["Item_ID"].map(current).fillna("")
+        plan["Current_Walk"] = plan["Current_Slot"].map(walk).fillna(walk.max() + 1).astype("int64")
+        plan["Gain"] = plan["Hits"] * (plan["Current_Walk"] - plan["Suggested_Walk"])
+        plan = plan[(plan["Current_Slot"] != plan["Suggested_Slot"]) & (plan["Gain"] > 0)]
+        out = plan.sort_values("Gain", ascending=False, kind="stable")[PLAN_COLUMNS].reset_index(drop=True)
+        self._plan = (key, out)
+        return out.copy()
+
+    # ---------- Put Away ----------
+    def suggest_putaway(self, item_id, store, locations, limit=3, now=None):
+        """ปลายทางที่แนะนำสำหรับของที่รอ Put Away -> DataFrame[Location, Loc_Type, Walk, Reason]
+
+        - สินค้า A / B ที่ยังไม่มีช่อง PICK: ช่อง PICK ที่แผนแนะนำ (ถ้าว่าง) หรือช่อง PICK ว่างที่ใกล้ที่สุด
+        - RESERVE ว่าง: ใกล้ช่อง PICK ของสินค้านั้นที่สุด (เที่ยวเติมสั้น) ถ้ายังไม่มีช่อง PICK
+          สินค้า A / B เอาช่องต้นทางเดิน สินค้า C เอาช่องท้ายทาง (เก็บช่องใกล้ไว้ให้ของหยิบบ่อย)
+        """
+        item_id = str(item_id)
+        vel = self.velocity(now).set_index("Item_ID")
+        cls = vel["ABC"].get(item_id, "C") if not vel.empty else "C"
+        occupied = store.occupied_locations()
+        by_loc = locations.set_index("Location")
+        pick_slots = [loc for loc in store.stock_of(item_id) if by_loc["Loc_Type"].get(loc) == "PICK"]
+
+        out = []
+        if not pick_slots and cls in ("A", "B"):
+            plan = self.plan(store, locations, now)
+            planned = plan.loc[plan["Item_ID"] == item_id, "Suggested_Slot"].tolist()
+            free = locations[(locations["Loc_Type"] == "PICK") & ~locations["Location"].isin(occupied)]
+            if planned and planned[0] not in occupied:
+                out.append((planned[0], f"ช่อง PICK ตามแผน (สินค้า {cls})"))
+            elif not free.empty:
+                out.append((free.sort_values("Walk").iloc[0]["Location"], f"ช่อง PICK ว่างใกล้สุด (สินค้า {cls})"))
+
+        reserve = locations[(locations["Loc_Type"] == "RESERVE") & ~locations["Location"].isin(occupied)]
+        if not reserve.empty:
+            if pick_slots:
+                home = by_loc.loc[min(pick_slots, key=lambda loc: by_loc.at[loc, "Walk"])]
+                dist = ((reserve["Zone_No"] - home["Zone_No"]).abs() * 1000
+                        + (reserve["Rack_No"] - home["Rack_No"]).abs() * 10
+                        + (reserve["Level_No"] - home["Level_No"]).abs())
+                reason = f"RESERVE ว่างใกล้ช่อง PICK {home.name}"
+                reserve = reserve.assign(_d=dist).sort_values(["_d", "Walk"], kind="stable")
+            elif cls in ("A", "B"):
+                reason = f"RESERVE ว่างต้นทางเดิน (สินค้า {cls})"
+                reserve = reserve.sort_values("Walk", kind="stable")
+            else:
+                reason = "RESERVE ว่างท้ายทางเดิน (สินค้า C)"
+                reserve = reserve.sort_values("Walk", ascending=False, kind="stable")
+            out += [(loc, reason) for loc in reserve["Location"].head(limit - len(out))]
+
+        rows = [{"Location": loc, "Loc_Type": by_loc.at[loc, "Loc_Type"], "Walk": int(by_loc.at[loc, "Walk"]),
+                 "Reason": reason} for loc, reason in out[:limit]]
+        return pd.DataFrame(rows, columns=SUGGEST_COLUMNS)
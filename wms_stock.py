@@ -0,0 +1,564 @@
+"""Current_Stock store ที่แชร์กันทั้ง process (index ตาม Item_ID / Location + delta sync)"""
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from wms_schema import parse_rows
+from wms_storage import TABLE_STOCK
+
+# ลำดับ Column ใน Current_Stock (1-based ตาม Google Sheet)
+# Col 1:ID, 2:Name, 3:Qty, 4:Loc, 5:Status, 6:Container, 7:Replen, 8:Time
+COL_ITEM, COL_NAME, COL_QTY, COL_LOC, COL_STATUS, COL_CONTAINER, COL_REPLEN, COL_TIME = range(1, 9)
+
+
+class StockStore:
+    """เก็บ Current_Stock ไว้ใน memory แล้วอ่านใหม่เฉพาะตอนที่ table.revision() เปลี่ยน
+
+    - rows[i] คือแถวที่ i + 2 ในชีต (แถว 1 เป็น header)
+    - by_key: (Item_ID, Location) -> set ของเลขแถว
+    - by_loc: Location -> set ของเลขแถว (Location ที่มีของอยู่ = มี key ใน by_loc)
+    - by_item: Item_ID -> set ของเลขแถว
+    - on_hand: Item_ID -> {Location: Qty รวม}
+
+    index ทั้งหมดถูกปรับทุกครั้งที่แถวเปลี่ยน (sync / การเขียนของแอป) การเช็คกฎหรือหายอดจึงไม่ต้องสแกนทั้งตาราง
+    """
+
+    def __init__(self, table, poll_sec=5.0, full_resync_sec=300.0):
+        self.table = table
+        self.poll_sec = poll_sec
+        self.full_resync_sec = full_resync_sec
+        self.lock = threading.RLock()
+        self.header = []
+        self.rows = []
+        self.by_key = {}
+        self.by_loc = {}
+        self.by_item = {}
+        self.on_hand = {}
+        self.version = 0
+        self.revision = None
+        self.api_calls = 0
+        self._loaded = False
+        self._local_revision = None
+        self._last_poll = 0.0
+        self._last_full = 0.0
+        self._frame = None
+        self._frame_version = -1
+        self.schema_report = None
+
+    # ---------- sync ----------
+    def sync(self, force=False):
+        """คืนค่า True ถ้ามีการอ่านชีตใหม่"""
+        with self.lock:
+            now = time.monotonic()
+            if force or not self._loaded or now - self._last_full >= self.full_resync_sec:
+                self._reload(now)
+                return True
+            if now - self._last_poll < self.poll_sec:
+                return False
+            self._last_poll = now
+            try:
+                rev = self._fetch_revision()
+            except Exception:
+                return False
+            if rev == self.revision:
+                return False
+            if rev == self._local_revision:
+                # revision ที่เกิดจากการเขียนของเราเอง index อัปเดตไปแล้ว ไม่ต้องอ่านใหม่
+                # (มีคนแก้ชีตหลังจากนั้น revision เปลี่ยนอีก -> อ่านใหม่ตามปกติ)
+                self.revision = rev
+                return False
+            self._reload(now, rev)
+            return True
+
+    def note_local_write(self, rows=None):
+        """เรียกหลังแอปเขียนชีตเอง (StockMutation / writer อื่นที่เขียน Spreadsheet เดียวกัน เช่น Transaction_Log)
+
+        จำ revision ที่อ่านได้ทันทีหลังการเขียน sync() ข้ามการอ่านใหม่เฉพาะ revision นั้นพอดี
+        อ่าน revision ไม่ได้ = ไม่ข้าม (การเปลี่ยนครั้งถัดไปอ่านใหม่ทั้งชีต) rows ไม่ได้ใช้ (ดู ShardedStockStore)
+        """
+        with self.lock:
+            try:
+                self._local_revision = self._fetch_revision()
+            except Exception:
+                self._local_revision = None
+
+    def _fetch_revision(self):
+        self.api_calls += 1
+        return self.table.revision()
+
+    def _reload(self, now, rev=None):
+        if rev is None:
+            try:
+                rev = self._fetch_revision()
+            except Exception:
+                rev = None
+        self.api_calls += 1
+        values = self.table.get_all_values()
+        header, rows = (values[0], values[1:]) if values else ([], [])
+        self._apply_delta(header, [[str(v) for v in r] for r in rows])
+        self.revision = rev
+        self._loaded = True
+        self._local_revision = None
+        self._last_poll = now
+        self._last_full = now
+
+    def _apply_delta(self, header, rows):
+        if header != self.header:
+            self.header = header
+            self.rows = rows
+            self._rebuild_index()
+            self.version += 1
+            return
+        changed = False
+        for i, new in enumerate(rows):
+            if i < len(self.rows):
+                if self.rows[i] != new:
+                    self._unindex(i + 2)
+                    self.rows[i] = new
+                    self._index(i + 2)
+                    changed = True
+            else:
+                self.rows.append(new)
+                self._index(i + 2)
+                changed = True
+        while len(self.rows) > len(rows):
+            self._unindex(len(self.rows) + 1)
+            self.rows.pop()
+            changed = True
+        if changed:
+            self.version += 1
+
+    # ---------- index ----------
+    def _key(self, row_no):
+        r = self.rows[row_no - 2]
+        item = r[COL_ITEM - 1] if len(r) >= COL_ITEM else ""
+        loc = r[COL_LOC - 1] if len(r) >= COL_LOC else ""
+        return item, loc
+
+    def _qty(self, row_no):
+        r = self.rows[row_no - 2]
+        try:
+            return int(float(r[COL_QTY - 1]))
+        except (IndexError, ValueError):
+            return 0
+
+    def _index(self, row_no):
+        key = self._key(row_no)
+        self.by_key.setdefault(key, set()).add(row_no)
+        self.by_loc.setdefault(key[1], set()).add(row_no)
+        self.by_item.setdefault(key[0], set()).add(row_no)
+        self._add_on_hand(key, self._qty(row_no))
+
+    def _add_on_hand(self, key, qty):
+        if not qty:
+            return
+        locs = self.on_hand.setdefault(key[0], {})
+        total = locs.get(key[1], 0) + qty
+        if total:
+            locs[key[1]] = total
+        else:
+            locs.pop(key[1], None)
+            if not locs:
+                del self.on_hand[key[0]]
+
+    def _unindex(self, row_no):
+        key = self._key(row_no)
+        self._add_on_hand(key, -self._qty(row_no))
+        s = self.by_item.get(key[0])
+        if s is not None:
+            s.discard(row_no)
+            if not s:
+                del self.by_item[key[0]]
+        s = self.by_key.get(key)
+        if s is not None:
+            s.discard(row_no)
+            if not s:
+                del self.by_key[key]
+        s = self.by_loc.get(key[1])
+        if s is not None:
+            s.discard(row_no)
+            if not s:
+                del self.by_loc[key[1]]
+
+    def _rebuild_index(self):
+        self.by_key = {}
+        self.by_loc = {}
+        self.by_item = {}
+        self.on_hand = {}
+        for i in range(len(self.rows)):
+            self._index(i + 2)
+
+    # ---------- อ่าน ----------
+    def find_rows(self, item_id, location):
+        with self.lock:
+            return sorted(self.by_key.get((str(item_id), str(location)), ()))
+
+    def rows_at(self, location):
+        with self.lock:
+            return sorted(self.by_loc.get(str(location), ()))
+
+    def row(self, row_no):
+        with self.lock:
+            return list(self.rows[row_no - 2])
+
+    def is_occupied(self, location):
+        with self.lock:
+            return str(location) in self.by_loc
+
+    def on_hand_map(self):
+        """สำเนาของ on_hand ทั้งหมด {Item_ID: {Location: Qty}}"""
+        with self.lock:
+            return {item: dict(locs) for item, locs in self.on_hand.items()}
+
+    def occupied_locations(self):
+        with self.lock:
+            return set(self.by_loc)
+
+    def stock_of(self, item_id, loc_map=None, loc_type=None):
+        """{Location: Qty} ของสินค้า (เฉพาะ Location ที่ loc_map บอกว่าเป็น loc_type ถ้าระบุ)"""
+        with self.lock:
+            locs = dict(self.on_hand.get(str(item_id), {}))
+        if loc_type is not None:
+            locs = {loc: q for loc, q in locs.items() if (loc_map or {}).get(loc) == loc_type}
+        return locs
+
+    def on_hand_by_type(self, item_id, loc_map):
+        """{Loc_Type: Qty รวม} ของสินค้า (Location ที่ไม่มีใน loc_map นับเป็น None)"""
+        totals = {}
+        for loc, qty in self.stock_of(item_id).items():
+            t = loc_map.get(loc)
+            totals[t] = totals.get(t, 0) + qty
+        return totals
+
+    def lookup(self, item_ids, fresh=False):
+        """แถว stock ของสินค้าที่ขอ -> DataFrame (column ตาม header ของ Current_Stock เรียงตามเลขแถว)"""
+        if fresh:
+            self.sync()
+        ids = {str(i) for i in item_ids}
+        with self.lock:
+            width = len(self.header)
+            nos = sorted(n for i in ids for n in self.by_item.get(i, ()))
+            rows = [(self.rows[n - 2] + [""] * width)[:width] for n in nos]
+            return pd.DataFrame(rows, columns=list(self.header))
+
+    def last_replen_point(self, item_id, default=None):
+        # Replen_Point ของแถวล่าสุด (ล่างสุดในชีต) ของสินค้านี้
+        with self.lock:
+            rows = self.by_item.get(str(item_id))
+            if not rows:
+                return default
+            r = self.rows[max(rows) - 2]
+        try:
+            return int(float(r[COL_REPLEN - 1]))
+        except (IndexError, ValueError):
+            return default
+
+    def to_frame(self):
+        # DataFrame แบบมี dtype (wms_schema) parse ครั้งเดียวต่อ version คืนเป็น copy เพราะแต่ละหน้าแก้ column เอง
+        with self.lock:
+            if self._frame_version != self.version:
+                self._frame, self.schema_report = parse_rows(self.rows, TABLE_STOCK)
+                self._frame_version = self.version
+            return self._frame.copy()
+
+    # ---------- อัปเดตจากการเขียนของแอปเอง ----------
+    def apply_update(self, row_no, col, value):
+        with self.lock:
+            self._unindex(row_no)
+            r = self.rows[row_no - 2]
+            while len(r) < col:
+                r.append("")
+            r[col - 1] = str(value)
+            self._index(row_no)
+            self._touch()
+
+    def apply_append(self, values):
+        with self.lock:
+            r = [str(v) for v in values]
+            r += [""] * (len(self.header) - len(r))
+            self.rows.append(r)
+            self._index(len(self.rows) + 1)
+            self._touch()
+
+    def apply_delete(self, *row_nos):
+        # ลบแถวแล้วแถวที่อยู่ข้างล่างจะเลื่อนขึ้น เหมือน delete_rows ในชีต
+        with self.lock:
+            for row_no in sorted(set(row_nos), reverse=True):
+                del self.rows[row_no - 2]
+            self._rebuild_index()
+            self._touch()
+
+    def _touch(self):
+        self.version += 1
+
+    def refresh_rows(self, fresh):
+        """แทนที่เฉพาะแถวที่ระบุด้วยค่าจริงจากชีต ({เลขแถว: ค่า}) ใช้หลังเจอ conflict ตอน commit"""
+        with self.lock:
+            for row_no, values in fresh.items():
+                if not 2 <= row_no <= len(self.rows) + 1 or values is None:
+                    continue
+                self._unindex(row_no)
+                r = [str(v) for v in values]
+                self.rows[row_no - 2] = r + [""] * (len(self.header) - len(r))
+                self._index(row_no)
+            self.version += 1
+
+
+def _same_row(a, b):
+    # ชีตตัด cell ว่างท้ายแถวทิ้ง เทียบโดยไม่สน "" ท้ายแถว
+    a, b = [str(v) for v in a], [str(v) for v in b]
+    while a and a[-1] == "":
+        a.pop()
+    while b and b[-1] == "":
+        b.pop()
+    return a == b
+
+
+class StockMutationError(Exception):
+    pass
+
+
+class StockConflict(StockMutationError):
+    """แถวที่งานนี้อ่านไปถูกแก้ในชีตโดยเครื่อง / process อื่น (ลองใหม่ครบแล้วยังชน)"""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows)
+        super().__init__(f"ข้อมูล stock แถว {', '.join(map(str, self.rows[:10]))} ถูกแก้จากที่อื่น กรุณาลองใหม่")
+
+
+class StockMutation:
+    """รวมหลายขั้นตอน (ย้าย / ตัดจำนวน / ลบแถวที่เหลือ 0) แล้ว commit ด้วย batch_update ครั้งเดียว
+
+    แต่ละคำสั่งถูกเก็บไว้ก่อน แล้วค่อยหาแถวจริงจาก StockStore ตอน commit (ถือ lock ของ store)
+    ทำให้หลายคำสั่งที่แตะแถวเดียวกันถูกรวมเป็นค่าสุดท้ายค่าเดียว
+    log ของงานจะถูกส่งให้ log_writer (TransactionLogWriter) หลัง commit สำเร็จ
+
+    Compare-and-swap: ทุก session ใน process เดียวกันต่อคิวกันที่ lock ของ store อยู่แล้ว
+    ส่วนเครื่อง / process อื่นที่เขียนชีตเดียวกัน ตรวจด้วยค่าในแถว (ค่าในแถว = version ของแถว)
+    ก่อนเขียน อ่านเฉพาะแถวที่งานนี้อ่าน (read-set) จากชีตในครั้งเดียว ถ้าไม่ตรงกับ store
+    จะไม่เขียนอะไรเลย อัปเดตเฉพาะแถวที่ชนใน store แล้วคำนวณงานใหม่ (ไม่เกิน max_retries ครั้ง)
+    """
+
+    def __init__(self, store, log_writer, user="Admin", verify=True, max_retries=2):
+        self.store = store
+        self.log_writer = log_writer
+        self.user = user
+        self.verify = verify
+        self.max_retries = max_retries
+        self.ops = []
+        self.api_calls = 0
+        self.conflicts = 0
+
+    # ---------- คำสั่ง ----------
+    def append(self, values):
+        self.ops.append(("append", list(values)))
+        return self
+
+    def move(self, item_id, from_loc, to_loc, status="Available", log_action=None):
+        self.ops.append(("move", str(item_id), str(from_loc), str(to_loc), status, log_action))
+        return self
+
+    def decrement(self, item_id, location, qty):
+        self.ops.append(("decrement", str(item_id), str(location), int(qty)))
+        return self
+
+    def increment(self, item_id, location, qty, replen_point=None, item_name="", status="Available", container=None):
+        # container=None: เพิ่มเข้าแถวแรกของสินค้าที่ Location นี้, ระบุ container: แยกแถวตาม container (เช่น Order ในช่อง Staging)
+        self.ops.append(("increment", str(item_id), str(location), int(qty), replen_point, item_name,
+                         status, None if container is None else str(container)))
+        return self
+
+    def clear_location(self, location, log_action=None, to_loc=""):
+        # เอาทุกแถวใน Location ออกจาก stock (เช่น ปิดช่อง Staging ตอนรถออก) log แยกทีละแถว
+        self.ops.append(("clear", str(location), log_action, to_loc))
+        return self
+
+    def log(self, action, item_id, qty, from_loc, to_loc):
+        self.ops.append(("log", action, item_id, qty, from_loc, to_loc))
+        return self
+
+    # ---------- หาแถว ----------
+    def _row(self, row_no):
+        if row_no not in self._work:
+            self._work[row_no] = self.store.row(row_no)
+        return self._work[row_no]
+
+    def _candidates(self, item_id, location):
+        rows = set(self.store.find_rows(item_id, location))
+        rows.update(n for n, r in self._work.items()
+                    if r[COL_ITEM - 1] == item_id and r[COL_LOC - 1] == location)
+        out = []
+        for row_no in sorted(rows - self._deleted):
+            r = self._row(row_no)
+            if str(r[COL_ITEM - 1]) == item_id and str(r[COL_LOC - 1]) == location:
+                out.append(r)
+        out += [r for r in self._appends
+                if str(r[COL_ITEM - 1]) == item_id and str(r[COL_LOC - 1]) == location]
+        return out
+
+    def _row_no(self, row):
+        for n, r in self._work.items():
+            if r is row:
+                return n
+        return None
+
+    def _set_qty(self, row, qty):
+        # เหลือ 0 = ลบแถวทิ้ง (delete-if-zero)
+        if qty > 0:
+            row[COL_QTY - 1] = qty
+            return
+        row_no = self._row_no(row)
+        if row_no is None:
+            self._appends.remove(row)
+        else:
+            self._deleted.add(row_no)
+
+    @staticmethod
+    def _qty(row):
+        try:
+            return int(float(row[COL_QTY - 1]))
+        except (TypeError, ValueError):
+            return 0
+
+    # ---------- ทำคำสั่งกับสำเนาแถว ----------
+    def _apply_op(self, op):
+        kind = op[0]
+        if kind == "append":
+            r = op[1] + [""] * (len(self.store.header) - len(op[1]))
+            self._appends.append(r)
+        elif kind == "move":
+            _, item_id, from_loc, to_loc, status, log_action = op
+            rows = self._candidates(item_id, from_loc)
+            if not rows:
+                raise StockMutationError(f"ไม่พบ {item_id} ที่ {from_loc}")
+            r = rows[0]
+            r[COL_LOC - 1] = to_loc
+            r[COL_STATUS - 1] = status
+            r[COL_TIME - 1] = self.ts
+            if log_action:
+                self._logs.append([self.ts, log_action, item_id, self._qty(r), from_loc, to_loc, self.user])
+        elif kind == "decrement":
+            _, item_id, location, qty = op
+            rows = self._candidates(item_id, location)
+            # แถวแรกที่มีพอตัดได้ทั้งหมด ถ้าไม่มีแถวไหนพอ ค่อยตัดไล่ทีละแถวตามลำดับในชีต
+            single = [r for r in rows if self._qty(r) >= qty]
+            if single:
+                rows = single[:1]
+            elif sum(self._qty(r) for r in rows) < qty:
+                raise StockMutationError(f"{item_id} ที่ {location} มีไม่พอ {qty} ชิ้น")
+            for r in rows:
+                take = min(qty, self._qty(r))
+                self._set_qty(r, self._qty(r) - take)
+                qty -= take
+                if qty == 0:
+                    break
+        elif kind == "increment":
+            _, item_id, location, qty, replen_point, item_name, status, container = op
+            rows = self._candidates(item_id, location)
+            if container is not None:
+                rows = [r for r in rows if str(r[COL_CONTAINER - 1]) == container]
+            if rows:
+                r = rows[0]
+                r[COL_QTY - 1] = self._qty(r) + qty
+                if replen_point is not None:
+                    r[COL_REPLEN - 1] = int(replen_point)
+                r[COL_TIME - 1] = self.ts
+            else:
+                r = [item_id, item_name, qty, location, status, "-" if container is None else container,
+                     int(replen_point) if replen_point is not None else "", self.ts]
+                self._appends.append(r + [""] * (len(self.store.header) - len(r)))
+        elif kind == "clear":
+            _, location, log_action, to_loc = op
+            rows = set(self.store.rows_at(location))
+            rows.update(n for n, r in self._work.items() if r[COL_LOC - 1] == location)
+            for row_no in sorted(rows - self._deleted):
+                r = self._row(row_no)
+                if str(r[COL_LOC - 1]) != location:
+                    continue
+                self._deleted.add(row_no)
+                if log_action:
+                    self._logs.append([self.ts, log_action, r[COL_ITEM - 1], self._qty(r), location, to_loc, self.user])
+            for r in [r for r in self._appends if str(r[COL_LOC - 1]) == location]:
+                self._appends.remove(r)
+        elif kind == "log":
+            _, action, item_id, qty, from_loc, to_loc = op
+            self._logs.append([self.ts, action, item_id, qty, from_loc, to_loc, self.user])
+
+    def _changes(self):
+        updates = []
+        for row_no in sorted(set(self._work) - self._deleted):
+            new = self._work[row_no]
+            old = self.store.row(row_no)
+            updates += [(row_no, c, new[c - 1]) for c in range(1, len(new) + 1)
+                        if c > len(old) or str(new[c - 1]) != old[c - 1]]
+        return updates
+
+    def _verify(self):
+        # คืนค่า {เลขแถว: ค่าจริงในชีต} ของแถวใน read-set ที่ไม่ตรงกับ store (ว่าง = ไม่ชน)
+        read_set = sorted(set(self._work) | self._deleted)
+        if not self.verify or not read_set:
+            return {}
+        fresh = self.store.table.get_rows(read_set)
+        self.api_calls += 1
+        return {n: fresh.get(n) for n in read_set
+                if fresh.get(n) is None or not _same_row(fresh[n], self.store.row(n))}
+
+    def _shifted(self, changed):
+        # แถวหาย หรือค่าใหม่ของแถว n คือค่าเดิมของแถว n + 1 (แถวข้างบนถูกลบ)
+        last = len(self.store.rows) + 1
+        return any(v is None or (n < last and _same_row(v, self.store.row(n + 1))) for n, v in changed.items())
+
+    def _resolve(self):
+        # ทำทุกคำสั่งกับสำเนาแถวจนกว่า read-set ตรงกับชีต (ต้องถือ lock ของ store)
+        while True:
+            self.ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._work = {}
+            self._deleted = set()
+            self._appends = []
+            self._logs = []
+            for op in self.ops:
+                self._apply_op(op)
+            changed = self._verify()
+            if not changed:
+                return
+            self.conflicts += 1
+            if self.conflicts > self.max_retries:
+                self.store.sync(force=True)
+                raise StockConflict(changed)
+            if self._shifted(changed):
+                # มีคนลบแถวในชีต เลขแถวข้างล่างเลื่อนหมด อัปเดตทีละแถวไม่พอ ต้องอ่านใหม่ทั้งชีต
+                self.store.sync(force=True)
+            else:
+                # อ่านใหม่เฉพาะแถวที่ชน แล้วคำนวณงานใหม่กับค่าล่าสุด
+                self.store.refresh_rows(changed)
+
+    def commit(self):
+        """ส่งทุกคำสั่งในการเรียก API ครั้งเดียว คืนค่าสถิติของการ commit"""
+        t0 = time.perf_counter()
+        calls_before = self.store.api_calls
+        with self.store.lock:
+            self._resolve()
+            updates = self._changes()
+            requests = 0
+            if updates or self._appends or self._deleted:
+                requests = self.store.table.apply_batch(updates, self._appends, self._deleted)
+                self.api_calls += 1
+            # ให้ store ตรงกับชีต: update -> append -> delete (ลำดับเดียวกับใน batch)
+            for row_no, col, value in updates:
+                self.store.apply_update(row_no, col, value)
+            for r in self._appends:
+                self.store.apply_append(r)
+            if self._deleted:
+                self.store.apply_delete(*self._deleted)
+            if requests:
+                self.store.note_local_write()
+        self.log_writer.write_many(self._logs)
+        return {
+            "ops": len(self.ops),
+            "requests": requests or 0,
+            "api_calls": self.api_calls + self.store.api_calls - calls_before,
+            "conflicts": self.conflicts,
+            "ms": round((time.perf_counter() - t0) * 1000),
+        }
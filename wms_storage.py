@@ -0,0 +1,552 @@
+"""Storage backend ของ WMS: Google Sheets (gspread) / SQLite / Fake (in-memory) ใช้ interface เดียวกัน"""
+import collections
+import itertools
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class WorksheetNotFound(LookupError):
+    """ไม่พบชีตที่ต้องใช้ (ไม่ import gspread ตรงนี้: Fake / SQLite เปิดได้โดยไม่โหลด gspread)"""
+
+
+TABLE_STOCK = "Current_Stock"
+TABLE_LOG = "Transaction_Log"
+TABLE_ITEM_MASTER = "Item_Master"
+TABLE_LOC_MASTER = "Location_Master"
+TABLE_ORDERS = "Orders"
+
+# Header ตั้งต้นสำหรับ backend ที่สร้างตารางเอง (SQLite / Fake)
+DEFAULT_HEADERS = {
+    TABLE_STOCK: ["Item_ID", "Item_Name", "Qty", "Location", "Status", "Container", "Replen_Point", "Time"],
+    TABLE_LOG: ["Timestamp", "Action", "Item_ID", "Qty", "From_Loc", "To_Loc", "User"],
+    TABLE_ITEM_MASTER: ["Barcode", "Description", "Category", "Zone", "Rack", "Level",
+                        "Image_Link", "Replen_Point", "Timestamp"],
+    TABLE_LOC_MASTER: ["Location_ID", "Zone", "Rack", "Level", "Bin", "Loc_Type"],
+    TABLE_ORDERS: ["Order_ID", "Item_ID", "Qty", "Customer", "Status", "Time"],
+}
+
+# Index ของ SQLite ตาม lookup ที่แอปใช้จริง
+SQLITE_INDEXES = {
+    TABLE_STOCK: [("Item_ID", "Location"), ("Location",)],
+    TABLE_LOG: [("Item_ID",), ("Timestamp",), ("Action",)],
+    TABLE_ITEM_MASTER: [("Barcode",)],
+    TABLE_LOC_MASTER: [("Location_ID",)],
+    TABLE_ORDERS: [("Order_ID",), ("Status",)],
+}
+
+
+def _runs(numbers):
+    # [2, 3, 4, 8] -> [(2, 4), (8, 8)]
+    out = []
+    for n in sorted(numbers):
+        if out and n == out[-1][1] + 1:
+            out[-1] = (out[-1][0], n)
+        else:
+            out.append((n, n))
+    return out
+
+
+# ==========================================
+# Interface
+# ==========================================
+class Table:
+    """1 ตาราง = 1 worksheet เลขแถวนับแบบชีต (แถว 1 = header, ข้อมูลเริ่มแถว 2)"""
+
+    title = ""
+
+    def get_all_values(self):
+        raise NotImplementedError
+
+    def get_all_records(self):
+        values = self.get_all_values()
+        if not values:
+            return []
+        return [dict(zip(values[0], r)) for r in values[1:]]
+
+    def col_values(self, col):
+        return [r[col - 1] if len(r) >= col else "" for r in self.get_all_values()]
+
+    def get_rows(self, row_nos):
+        """{เลขแถว: ค่าในแถว} เฉพาะแถวที่ขอ (แถวที่ไม่มี / ว่าง = None) ใช้ตรวจแถวก่อนเขียนทับ"""
+        values = self.get_all_values()
+        return {n: (list(values[n - 1]) if 0 < n <= len(values) and any(values[n - 1]) else None) for n in row_nos}
+
+    def tail(self, n):
+        """n แถวสุดท้ายของตาราง (ไม่รวม header) อ่านแค่ column แรก + แถวท้าย ไม่อ่านทั้งตาราง"""
+        last = len(self.col_values(1))
+        rows = self.get_rows(range(max(2, last - n + 1), last + 1)) if last >= 2 else {}
+        return [rows[k] for k in sorted(rows) if rows[k]]
+
+    def read_after(self, cursor=None):
+        """แถวที่ต่อท้ายตารางหลังจาก cursor -> (แถวใหม่, cursor ใหม่) อ่านแค่ column แรก + แถวใหม่
+
+        cursor = (จำนวนแถวข้อมูลที่อ่านไปแล้ว, ค่า column แรกของแถวสุดท้ายนั้น) None = อ่านตั้งแต่แถวแรก
+        คืน None ถ้าแถวที่อ่านไปแล้วถูกลบ / เลื่อน (เช่น rollover) ต้องเริ่มอ่านใหม่ตั้งแต่แถวแรก
+        """
+        col = self.col_values(1)
+        count, key = cursor or (0, "")
+        if len(col) < count + 1 or (count and str(col[count]) != key):
+            return None
+        rows = self.get_rows(range(count + 2, len(col) + 1)) if len(col) > count + 1 else {}
+        return [rows[k] for k in sorted(rows) if rows[k]], (max(len(col) - 1, 0), str(col[-1]) if len(col) > 1 else "")
+
+    def append_row(self, row):
+        self.append_rows([row])
+
+    def append_rows(self, rows):
+        raise NotImplementedError
+
+    def update_cells(self, cells):
+        # cells = [(row, col, value), ...]
+        self.apply_batch(updates=cells)
+
+    def delete_rows(self, row_nos):
+        self.apply_batch(deletes=row_nos)
+
+    def apply_batch(self, updates=(), appends=(), deletes=()):
+        """update -> append -> delete ใน round trip เดียว (ลบจากล่างขึ้นบน)"""
+        raise NotImplementedError
+
+    def revision(self):
+        """ค่าที่เปลี่ยนทุกครั้งที่ตารางถูกแก้ ใช้เช็คว่าต้องอ่านใหม่หรือไม่"""
+        raise NotImplementedError
+
+
+class StorageBackend:
+    name = ""
+
+    def __init__(self, stock, log, item_master, loc_master=None, orders=None):
+        self.stock = stock
+        self.log = log
+        self.item_master = item_master
+        self.loc_master = loc_master
+        self.orders = orders
+
+
+# ==========================================
+# Google Sheets (gspread)
+# ==========================================
+def _cell(value):
+    if isinstance(value, bool):
+        return {"userEnteredValue": {"stringValue": str(value)}}
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": "" if value is None else str(value)}}
+
+
+def _row_data(values):
+    return {"values": [_cell(v) for v in values]}
+
+
+def get_sheet_revision(spreadsheet):
+    # ใช้ modifiedTime จาก Drive (เบากว่าอ่านทั้งชีตมาก)
+    if hasattr(spreadsheet, "get_lastUpdateTime"):
+        return spreadsheet.get_lastUpdateTime()
+    return spreadsheet.lastUpdateTime
+
+
+class SheetTable(Table):
+    def __init__(self, worksheet, spreadsheet):
+        self.worksheet = worksheet
+        self.spreadsheet = spreadsheet
+        self.title = worksheet.title
+
+    def get_all_values(self):
+        return self.worksheet.get_all_values()
+
+    def get_all_records(self):
+        return self.worksheet.get_all_records()
+
+    def col_values(self, col):
+        return self.worksheet.col_values(col)
+
+    def get_rows(self, row_nos):
+        # แถวที่ติดกันรวมเป็น range เดียว ทุก range ส่งใน batch_get ครั้งเดียว
+        runs = _runs(row_nos)
+        out = {}
+        for (r0, r1), values in zip(runs, self.worksheet.batch_get([f"{r0}:{r1}" for r0, r1 in runs])):
+            for n in range(r0, r1 + 1):
+                row = values[n - r0] if n - r0 < len(values) else []
+                out[n] = [str(v) for v in row] if any(row) else None
+        return out
+
+    def append_rows(self, rows):
+        self.worksheet.append_rows([list(r) for r in rows])
+
+    def apply_batch(self, updates=(), appends=(), deletes=()):
+        sheet_id = self.worksheet.id
+        requests = []
+        by_row = collections.defaultdict(dict)
+        for row_no, col, value in updates:
+            by_row[row_no][col] = value
+        for row_no in sorted(by_row):
+            cols = by_row[row_no]
+            for c0, c1 in _runs(cols):
+                requests.append({"updateCells": {
+                    "start": {"sheetId": sheet_id, "rowIndex": row_no - 1, "columnIndex": c0 - 1},
+                    "rows": [_row_data([cols[c] for c in range(c0, c1 + 1)])],
+                    "fields": "userEnteredValue",
+                }})
+        if appends:
+            requests.append({"appendCells": {
+                "sheetId": sheet_id,
+                "rows": [_row_data(r) for r in appends],
+                "fields": "userEnteredValue",
+            }})
+        for r0, r1 in reversed(_runs(set(deletes))):
+            requests.append({"deleteDimension": {"range": {
+                "sheetId": sheet_id, "dimension": "ROWS", "startIndex": r0 - 1, "endIndex": r1,
+            }}})
+        if requests:
+            self.spreadsheet.batch_update({"requests": requests})
+        return len(requests)
+
+    def revision(self):
+        return get_sheet_revision(self.spreadsheet)
+
+
+class GSheetsBackend(StorageBackend):
+    name = "gsheets"
+
+    def __init__(self, sh_wms, sh_master, governor=None):
+        # governor (wms_governor.QuotaGovernor): ทุก call ของ worksheet / spreadsheet ผ่านตัวคุม quota เดียวกัน
+        self.governor = governor
+        if governor is not None:
+            from wms_governor import GovernedSpreadsheet
+            sh_wms, sh_master = GovernedSpreadsheet(sh_wms, governor), GovernedSpreadsheet(sh_master, governor)
+        self.sh_wms = sh_wms
+        self.sh_master = sh_master
+        # worksheets() ครั้งเดียวต่อ Spreadsheet (metadata 1 call) แทน worksheet(title) ทีละชีต
+        wms_sheets = {ws.title: ws for ws in sh_wms.worksheets()}
+        master_sheets = {ws.title: ws for ws in sh_master.worksheets()}
+
+        def table(sheets, spreadsheet, title, required=True):
+            if title in sheets:
+                return SheetTable(sheets[title], spreadsheet)
+            if required:
+                raise WorksheetNotFound(title)
+            return None
+
+        super().__init__(
+            table(wms_sheets, sh_wms, TABLE_STOCK),
+            table(wms_sheets, sh_wms, TABLE_LOG),
+            table(master_sheets, sh_master, TABLE_ITEM_MASTER),
+            table(master_sheets, sh_master, TABLE_LOC_MASTER, required=False),
+            # ชีต Orders ไม่บังคับ (ไม่มีก็ยังหยิบตาม Order จากไฟล์ CSV ได้)
+            table(wms_sheets, sh_wms, TABLE_ORDERS, required=False),
+        )
+
+
+# ==========================================
+# SQLite (ใช้ในเครื่อง / on-premise)
+# ==========================================
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SqliteDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS _wms_tables ("
+            " title TEXT PRIMARY KEY, header TEXT NOT NULL, revision INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def table(self, title, header=None, indexes=()):
+        with self.lock:
+            row = self.conn.execute("SELECT header FROM _wms_tables WHERE title = ?", (title,)).fetchone()
+            if row is None:
+                header = list(header or DEFAULT_HEADERS[title])
+                cols = ", ".join(f"{_q(h)} TEXT NOT NULL DEFAULT ''" for h in header)
+                name = _q(title)
+                self.conn.execute("BEGIN")
+                self.conn.execute(f"CREATE TABLE {name} (row_no INTEGER NOT NULL, {cols})")
+                self.conn.execute(f"CREATE INDEX {_q('ix_' + title + '_row_no')} ON {name} (row_no)")
+                for ix in indexes:
+                    if all(c in header for c in ix):
+                        ix_name = _q("ix_" + title + "_" + "_".join(ix))
+                        self.conn.execute(f"CREATE INDEX {ix_name} ON {name} ({', '.join(_q(c) for c in ix)})")
+                self.conn.execute("INSERT INTO _wms_tables (title, header) VALUES (?, ?)",
+                                  (title, json.dumps(header)))
+                self.conn.execute("COMMIT")
+            else:
+                header = json.loads(row[0])
+        return SqliteTable(self, title, header)
+
+
+class SqliteTable(Table):
+    def __init__(self, db, title, header):
+        self.db = db
+        self.title = title
+        self.header = header
+        self._name = _q(title)
+        self._cols = ", ".join(_q(h) for h in header)
+
+    def _norm(self, row):
+        r = ["" if v is None else str(v) for v in row][:len(self.header)]
+        return r + [""] * (len(self.header) - len(r))
+
+    def get_all_values(self):
+        with self.db.lock:
+            rows = self.db.conn.execute(f"SELECT {self._cols} FROM {self._name} ORDER BY row_no").fetchall()
+        return [list(self.header)] + [list(r) for r in rows]
+
+    def col_values(self, col):
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT {_q(self.header[col - 1])} FROM {self._name} ORDER BY row_no").fetchall()
+        return [self.header[col - 1]] + [r[0] for r in rows]
+
+    def get_rows(self, row_nos):
+        row_nos = sorted(set(row_nos))
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT row_no, {self._cols} FROM {self._name} WHERE row_no IN ({', '.join('?' * len(row_nos))})",
+                row_nos).fetchall()
+        found = {r[0]: list(r[1:]) for r in rows}
+        return {n: found.get(n) for n in row_nos}
+
+    def append_rows(self, rows):
+        self.apply_batch(appends=rows)
+
+    def apply_batch(self, updates=(), appends=(), deletes=()):
+        conn = self.db.conn
+        with self.db.lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row_no, col, value in updates:
+                    conn.execute(f"UPDATE {self._name} SET {_q(self.header[col - 1])} = ? WHERE row_no = ?",
+                                 ("" if value is None else str(value), row_no))
+                if appends:
+                    last = conn.execute(f"SELECT COALESCE(MAX(row_no), 1) FROM {self._name}").fetchone()[0]
+                    marks = ", ".join("?" * (len(self.header) + 1))
+                    conn.executemany(
+                        f"INSERT INTO {self._name} (row_no, {self._cols}) VALUES ({marks})",
+                        [[last + i + 1] + self._norm(r) for i, r in enumerate(appends)],
+                    )
+                delete_runs = _runs(set(deletes))
+                for r0, r1 in reversed(delete_runs):
+                    conn.execute(f"DELETE FROM {self._name} WHERE row_no BETWEEN ? AND ?", (r0, r1))
+                    conn.execute(f"UPDATE {self._name} SET row_no = row_no - ? WHERE row_no > ?",
+                                 (r1 - r0 + 1, r1))
+                conn.execute("UPDATE _wms_tables SET revision = revision + 1 WHERE title = ?", (self.title,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(updates) + (1 if appends else 0) + len(delete_runs)
+
+    def revision(self):
+        with self.db.lock:
+            return self.db.conn.execute(
+                "SELECT revision FROM _wms_tables WHERE title = ?", (self.title,)).fetchone()[0]
+
+
+class SqliteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.db = SqliteDatabase(path)
+        super().__init__(*(self.db.table(t, indexes=SQLITE_INDEXES.get(t, ()))
+                           for t in (TABLE_STOCK, TABLE_LOG, TABLE_ITEM_MASTER, TABLE_LOC_MASTER, TABLE_ORDERS)))
+
+
+# ==========================================
+# Fake Google Sheets (in-memory) สำหรับทดสอบแบบ offline
+# ==========================================
+class FakeCell:
+    def __init__(self, row, col, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+class FakeWorksheet:
+    """เลียนแบบ gspread.Worksheet (เฉพาะ method ที่แอปใช้) เก็บค่าเป็น string เหมือน get_all_values()"""
+
+    def __init__(self, spreadsheet, title, rows=()):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = next(spreadsheet._ids)
+        self.rows = [self._norm(r) for r in rows]
+
+    @staticmethod
+    def _norm(row):
+        return ["" if v is None else str(v) for v in row]
+
+    def _call(self, method):
+        self.spreadsheet._call(method)
+
+    def _padded(self):
+        width = max((len(r) for r in self.rows), default=0)
+        return [r + [""] * (width - len(r)) for r in self.rows]
+
+    def get_all_values(self):
+        self._call("get_all_values")
+        return self._padded()
+
+    def get_all_records(self):
+        self._call("get_all_records")
+        values = self._padded()
+        if not values:
+            return []
+        return [dict(zip(values[0], r)) for r in values[1:]]
+
+    def row_values(self, row):
+        self._call("row_values")
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self._call("col_values")
+        return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+    def batch_get(self, ranges, **kwargs):
+        # รองรับเฉพาะ range แบบทั้งแถว "2:5" / "A2:H5" (ตัดแถวว่างท้าย range เหมือน API จริง)
+        self._call("batch_get")
+        out = []
+        for rng in ranges:
+            r0, r1 = (int(re.sub(r"\D", "", p)) for p in rng.split("!")[-1].split(":"))
+            values = [list(r) for r in self.rows[r0 - 1:r1]]
+            while values and not any(values[-1]):
+                values.pop()
+            out.append(values)
+        return out
+
+    def cell(self, row, col):
+        self._call("cell")
+        r = self.rows[row - 1] if row <= len(self.rows) else []
+        return FakeCell(row, col, r[col - 1] if len(r) >= col else "")
+
+    def findall(self, query):
+        self._call("findall")
+        return [FakeCell(i + 1, j + 1, v) for i, r in enumerate(self.rows)
+                for j, v in enumerate(r) if v == str(query)]
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row")
+        self.rows.append(self._norm(values))
+        self.spreadsheet._touch()
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows")
+        self.rows.extend(self._norm(r) for r in values)
+        self.spreadsheet._touch()
+
+    def update_cell(self, row, col, value):
+        self._call("update_cell")
+        self._set(row, col, value)
+        self.spreadsheet._touch()
+
+    def delete_rows(self, start_index, end_index=None):
+        self._call("delete_rows")
+        del self.rows[start_index - 1:(end_index or start_index)]
+        self.spreadsheet._touch()
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        r = self.rows[row - 1]
+        while len(r) < col:
+            r.append("")
+        r[col - 1] = "" if value is None else str(value)
+
+
+def _fake_value(cell):
+    value = next(iter(cell.get("userEnteredValue", {"stringValue": ""}).values()))
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return value
+
+
+class FakeSpreadsheet:
+    """เลียนแบบ gspread.Spreadsheet: worksheet(), batch_update() และนับจำนวน call / หน่วงเวลาได้"""
+
+    _id_seq = itertools.count(1)
+
+    def __init__(self, title, latency=0.0):
+        self.title = title
+        self.id = f"fake-{next(self._id_seq)}"
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._ids = itertools.count(0)
+        self._sheets = {}
+        self._modified = 0
+
+    def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _touch(self):
+        self._modified += 1
+
+    def add_worksheet(self, title, rows=None, cols=None, values=()):
+        ws = FakeWorksheet(self, title, values)
+        self._sheets[title] = ws
+        return ws
+
+    def worksheet(self, title):
+        self._call("worksheet")
+        if title not in self._sheets:
+            raise WorksheetNotFound(title)
+        return self._sheets[title]
+
+    def worksheets(self):
+        self._call("worksheets")
+        return list(self._sheets.values())
+
+    def get_lastUpdateTime(self):
+        self._call("get_lastUpdateTime")
+        ts = datetime.fromtimestamp(self._modified, tz=timezone.utc)
+        return ts.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def batch_update(self, body):
+        self._call("batch_update")
+        by_id = {ws.id: ws for ws in self._sheets.values()}
+        for req in body.get("requests", []):
+            if "updateCells" in req:
+                u = req["updateCells"]
+                ws = by_id[u["start"]["sheetId"]]
+                r0, c0 = u["start"]["rowIndex"], u["start"].get("columnIndex", 0)
+                for i, row in enumerate(u["rows"]):
+                    for j, cell in enumerate(row.get("values", [])):
+                        ws._set(r0 + i + 1, c0 + j + 1, _fake_value(cell))
+            elif "appendCells" in req:
+                u = req["appendCells"]
+                ws = by_id[u["sheetId"]]
+                ws.rows.extend([str(_fake_value(c)) for c in row.get("values", [])] for row in u["rows"])
+            elif "deleteDimension" in req:
+                rng = req["deleteDimension"]["range"]
+                ws = by_id[rng["sheetId"]]
+                del ws.rows[rng["startIndex"]:rng["endIndex"]]
+            else:
+                raise NotImplementedError(f"FakeSpreadsheet ไม่รองรับ request: {list(req)}")
+        self._touch()
+        return {"spreadsheetId": self.id, "replies": [{} for _ in body.get("requests", [])]}
+
+
+class FakeBackend(GSheetsBackend):
+    """Google Sheets ปลอมใน memory ใช้โค้ดชุดเดียวกับ GSheetsBackend ทุกอย่าง"""
+
+    name = "fake"
+
+    def __init__(self, latency=0.0, governor=None):
+        sh_wms = FakeSpreadsheet("WMS_Database", latency)
+        sh_master = FakeSpreadsheet("Master_Data", latency)
+        for sh, titles in ((sh_wms, (TABLE_STOCK, TABLE_LOG, TABLE_ORDERS)),
+                           (sh_master, (TABLE_ITEM_MASTER, TABLE_LOC_MASTER))):
+            for t in titles:
+                sh.add_worksheet(t, values=[DEFAULT_HEADERS[t]])
+        self.fake_wms, self.fake_master = sh_wms, sh_master
+        super().__init__(sh_wms, sh_master, governor)
+
+    @property
+    def calls(self):
+        return self.fake_wms.calls + self.fake_master.calls